@@ -2,6 +2,7 @@ import argparse
 
 from lib.search_utils import DEFAULT_SEARCH_LIMIT
 from lib.augmented_generation import citation_command, question_command, rag_command, summarize_command
+from lib.query_embedding_cache import QUERY_EMBEDDING_CACHE
 
 
 def main():
@@ -10,20 +11,26 @@ def main():
 
     rag_parser = subparsers.add_parser("rag", help="Perform RAG (search + generate answer)")
     rag_parser.add_argument("query", type=str, help="Search query for RAG")
+    rag_parser.add_argument("--disk-cache", action="store_true", help="reuse query embeddings cached on disk by earlier runs, and cache this one")
 
     summarize_parser = subparsers.add_parser("summarize", help="Generate multi-document summary")
     summarize_parser.add_argument("query", type=str, help="Search query for summarization")
     summarize_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Maximum number of documents to summarize")
+    summarize_parser.add_argument("--disk-cache", action="store_true", help="reuse query embeddings cached on disk by earlier runs, and cache this one")
 
     citation_parser = subparsers.add_parser("citations", help="Generate answer with citations")
     citation_parser.add_argument("query", type=str, help="Search query for answer generation")
     citation_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Maximum number of documents to summarize")
+    citation_parser.add_argument("--disk-cache", action="store_true", help="reuse query embeddings cached on disk by earlier runs, and cache this one")
 
     question_parser = subparsers.add_parser("question", help="Generate answer of the question asked")
     question_parser.add_argument("query", type=str, help="Question to answer")
     question_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Maximum number of documents to use")
+    question_parser.add_argument("--disk-cache", action="store_true", help="reuse query embeddings cached on disk by earlier runs, and cache this one")
 
     args = parser.parse_args()
+    if getattr(args, "disk_cache", False):
+        QUERY_EMBEDDING_CACHE.enable_disk()
 
     match args.command:
         case "rag":
@@ -64,6 +71,10 @@ def main():
         case _:
             parser.print_help()
 
+    if getattr(args, "disk_cache", False):
+        stats = QUERY_EMBEDDING_CACHE.stats()
+        print(f"Query embedding cache: {stats['hits']} hits ({stats['disk_hits']} from disk), {stats['misses']} misses")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
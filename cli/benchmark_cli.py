@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from lib.benchmark import (
+    analyzer_benchmark_command,
+    ann_benchmark_command,
+    bm25_engines_benchmark_command,
+    SEMANTIC_CLI_STARTUP_COMMANDS,
+    bm25_many_benchmark_command,
+    boolean_benchmark_command,
+    build_workers_benchmark_command,
+    cosine_benchmark_command,
+    posting_codec_benchmark_command,
+    quantization_benchmark_command,
+    semantic_many_benchmark_command,
+    shards_benchmark_command,
+    startup_benchmark_command,
+)
+from lib.posting_codec import POSTING_CODECS
+from lib.quantization import QUANTIZATION_MODES
+from lib.query_engine import BM25_ENGINES
+from lib.search_utils import DEFAULT_SEARCH_LIMIT
+
+
+def print_timings(report: dict) -> None:
+    for name in ("before", "after"):
+        timings = report[name]
+        print(f"{name:>6}: " + ", ".join(f"{key}={value:.4f}" for key, value in timings.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search Benchmark CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    analyzer_parser = subparsers.add_parser("analyzer", help="Compare index build and BM25 query time of the legacy tokenizer and the Analyzer")
+    analyzer_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Number of results per query")
+
+    engines_parser = subparsers.add_parser("bm25-engines", help="Compare BM25 top-k engines on a synthetic corpus and check they agree")
+    engines_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    engines_parser.add_argument("--queries", type=int, default=50, help="Number of synthetic queries")
+    engines_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    codec_parser = subparsers.add_parser("posting-codec", help="Compare raw and bit-packed posting storage size and query latency")
+    codec_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    codec_parser.add_argument("--queries", type=int, default=50, help="Number of synthetic queries")
+    codec_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    workers_parser = subparsers.add_parser("build-workers", help="Compare keyword index build time across worker counts")
+    workers_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    workers_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to compare")
+
+    boolean_parser = subparsers.add_parser("boolean", help="Compare boolean AND queries against Python set intersection")
+    boolean_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    boolean_parser.add_argument("--queries", type=int, default=50, help="Number of synthetic queries")
+
+    many_parser = subparsers.add_parser("bm25-many", help="Compare per-query BM25 search against batched bm25_search_many")
+    many_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    many_parser.add_argument("--queries", type=int, default=500, help="Number of synthetic queries")
+    many_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    shards_parser = subparsers.add_parser("shards", help="Compare sharded scatter-gather BM25 search with the single index")
+    shards_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic documents")
+    shards_parser.add_argument("--queries", type=int, default=50, help="Number of synthetic queries")
+    shards_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+    shards_parser.add_argument("--shards", type=int, nargs="+", default=[2, 4], help="Shard counts to compare")
+    shards_parser.add_argument("--proximity", type=float, default=1.0, help="Proximity weight of the equivalence check")
+
+    cosine_parser = subparsers.add_parser("cosine", help="Compare the per-vector cosine loop with vectorized top-k search on random embeddings")
+    cosine_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Numbers of embeddings to search")
+    cosine_parser.add_argument("--dim", type=int, default=384, help="Embedding dimensions")
+    cosine_parser.add_argument("--queries", type=int, default=5, help="Number of random queries")
+    cosine_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    ann_parser = subparsers.add_parser("ann", help="Compare recall and latency of IVF chunk search with exact search on the golden queries")
+    ann_parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Numbers of IVF lists to scan")
+    ann_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    quantization_parser = subparsers.add_parser("quantization", help="Compare memory, latency and recall of quantized embedding search with rescoring")
+    quantization_parser.add_argument("--docs", type=int, default=100000, help="Number of synthetic embeddings")
+    quantization_parser.add_argument("--dim", type=int, default=384, help="Embedding dimensions")
+    quantization_parser.add_argument("--queries", type=int, default=50, help="Number of synthetic queries")
+    quantization_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+    quantization_parser.add_argument("--recall-target", type=float, default=0.99, help="Recall target the rescoring shortlist is calibrated for")
+
+    semantic_many_parser = subparsers.add_parser("semantic-many", help="Compare per-query semantic ranking against batched rank_many on synthetic embeddings")
+    semantic_many_parser.add_argument("--docs", type=int, default=10000, help="Number of synthetic movies")
+    semantic_many_parser.add_argument("--chunks-per-doc", type=int, default=4, help="Synthetic chunks per movie")
+    semantic_many_parser.add_argument("--dim", type=int, default=384, help="Embedding dimensions")
+    semantic_many_parser.add_argument("--queries", type=int, default=500, help="Number of synthetic queries")
+    semantic_many_parser.add_argument("--limit", type=int, default=10, help="Number of results per query")
+
+    startup_parser = subparsers.add_parser("startup", help="Time each semantic search CLI subcommand from process start to exit")
+    startup_parser.add_argument("--commands", nargs="+", choices=list(SEMANTIC_CLI_STARTUP_COMMANDS), default=[], help="Subcommands to time (default: all)")
+    startup_parser.add_argument("--runs", type=int, default=3, help="Runs per subcommand")
+
+    args = parser.parse_args()
+
+    match args.command:
+        case "analyzer":
+            report = analyzer_benchmark_command(args.limit)
+            print(f"Analyzer benchmark over {report['queries']} golden queries")
+            print_timings(report)
+        case "bm25-engines":
+            report = bm25_engines_benchmark_command(args.docs, args.queries, args.limit)
+            print(f"Built {report['docs']} synthetic docs in {report['build_seconds']:.2f}s, top-{args.limit} over {report['queries']} queries")
+            for engine in BM25_ENGINES:
+                timings = report[engine]
+                print(f"{engine:>6}: {timings['query_ms']:.2f} ms/query, {timings['mismatches']} mismatches")
+        case "posting-codec":
+            report = posting_codec_benchmark_command(args.docs, args.queries, args.limit)
+            print(f"Posting codecs on {report['docs']} synthetic docs, top-{args.limit} over {report['queries']} cold queries")
+            for codec in POSTING_CODECS:
+                timings = report[codec]
+                print(
+                    f"{codec:>8}: postings {timings['posting_bytes'] / 1e6:.2f} MB, file {timings['file_bytes'] / 1e6:.2f} MB, "
+                    f"taat {timings['taat_query_ms']:.2f} ms/query, bmw {timings['bmw_query_ms']:.2f} ms/query"
+                )
+            print(f"Compression ratio: {report['compression_ratio']:.2f}x")
+        case "build-workers":
+            report = build_workers_benchmark_command(args.docs, tuple(args.workers))
+            print(f"Keyword index build of {report['docs']} synthetic docs on {report['cpus']} CPUs")
+            for workers in args.workers:
+                timings = report[workers]
+                print(f"{workers:>3} workers: {timings['build_seconds']:.2f}s, identical to first run: {timings['identical']}")
+        case "boolean":
+            report = boolean_benchmark_command(args.docs, args.queries)
+            print(f"Boolean AND queries on {report['docs']} synthetic docs over {report['queries']} queries")
+            for name in ("set_intersection", "boolean_raw", "boolean_bitpack"):
+                timings = report[name]
+                print(f"{name:>16}: {timings['query_ms']:.2f} ms/query, {timings['mismatches']} mismatches")
+        case "bm25-many":
+            report = bm25_many_benchmark_command(args.docs, args.queries, args.limit)
+            print(f"BM25 top-{args.limit} on {report['docs']} synthetic docs over {report['queries']} queries")
+            print(f" loop: {report['loop_seconds']:.2f}s ({report['queries'] / report['loop_seconds']:.0f} queries/s)")
+            print(f"batch: {report['batch_seconds']:.2f}s ({report['queries'] / report['batch_seconds']:.0f} queries/s)")
+            print(f"Speedup: {report['speedup']:.1f}x, {report['mismatches']} mismatches")
+        case "shards":
+            report = shards_benchmark_command(
+                args.docs, args.queries, args.limit, tuple(args.shards), args.proximity
+            )
+            print(f"BM25 top-{args.limit} on {report['docs']} synthetic docs over {report['queries']} queries, {report['cpus']} CPUs")
+            timings = report["unsharded"]
+            print(f"unsharded: {timings['query_ms']:.2f} ms/query")
+            for shard_count in args.shards:
+                timings = report[shard_count]
+                print(
+                    f"{shard_count:>3} shards: {timings['query_ms']:.2f} ms/query, {timings['mismatches']} mismatches, "
+                    f"{timings['proximity_mismatches']} with proximity"
+                )
+        case "cosine":
+            report = cosine_benchmark_command(tuple(args.sizes), args.dim, args.queries, args.limit)
+            print(f"Cosine top-{args.limit} over {report['queries']} queries, {report['dim']} dimensions")
+            for size in args.sizes:
+                timings = report[size]
+                print(
+                    f"{size:>8} vectors: loop {timings['loop_query_ms']:.2f} ms/query, vectorized {timings['vector_query_ms']:.2f} ms/query "
+                    f"(normalize once {timings['normalize_seconds']:.2f}s), speedup {timings['speedup']:.0f}x, {timings['mismatches']} mismatches"
+                )
+        case "ann":
+            report = ann_benchmark_command(tuple(args.nprobe), args.limit)
+            print(f"Chunk search top-{args.limit} over {report['queries']} golden queries, {report['chunks']} chunks in {report['nlist']} lists")
+            if report["build_seconds"]:
+                print(f"No saved ANN index; built one in {report['build_seconds']:.2f}s")
+            timings = report["exact"]
+            print(f"   exact: {timings['query_ms']:.2f} ms/query")
+            for nprobe in args.nprobe:
+                timings = report[nprobe]
+                print(f"nprobe {nprobe:>3}: {timings['query_ms']:.2f} ms/query, recall@{args.limit} {timings['recall']:.3f}")
+        case "quantization":
+            report = quantization_benchmark_command(args.docs, args.dim, args.queries, args.limit, args.recall_target)
+            print(f"Top-{args.limit} over {report['queries']} queries on {report['docs']} synthetic {args.dim}-dimensional embeddings")
+            timings = report["float32"]
+            print(f"float32: {timings['bytes'] / 1e6:.1f} MB, {timings['query_ms']:.2f} ms/query")
+            for mode in QUANTIZATION_MODES:
+                timings = report[mode]
+                print(
+                    f"{mode:>7}: {timings['bytes'] / 1e6:.1f} MB ({1 - timings['bytes'] / report['float32']['bytes']:.0%} saved), "
+                    f"{timings['query_ms']:.2f} ms/query, shortlist {timings['rescore_multiplier']}x, "
+                    f"recall@{args.limit} {timings['recall']:.3f} (built in {timings['build_seconds']:.2f}s)"
+                )
+        case "semantic-many":
+            report = semantic_many_benchmark_command(args.docs, args.chunks_per_doc, args.dim, args.queries, args.limit)
+            print(f"Top-{args.limit} over {report['queries']} queries on {report['docs']} synthetic movies, {report['chunks']} chunks")
+            for name in ("rank_many", "rank_chunks_many"):
+                timings = report[name]
+                print(
+                    f"{name:>16}: loop {timings['loop_seconds']:.2f}s ({report['queries'] / timings['loop_seconds']:.0f} queries/s), "
+                    f"batch {timings['batch_seconds']:.2f}s ({report['queries'] / timings['batch_seconds']:.0f} queries/s), "
+                    f"speedup {timings['speedup']:.1f}x, {timings['mismatches']} mismatches"
+                )
+        case "startup":
+            report = startup_benchmark_command(tuple(args.commands), args.runs)
+            print(f"semantic_search_cli.py wall-clock time over {args.runs} runs")
+            for name, timings in report.items():
+                status = "" if timings["returncode"] == 0 else f" (exit status {timings['returncode']})"
+                print(f"{name:>15}: first {timings['first_seconds']:.2f}s, best {timings['best_seconds']:.2f}s{status}")
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
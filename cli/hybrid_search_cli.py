@@ -6,6 +6,9 @@ from lib.hybrid_search import (
     rrf_search_command
 )
 
+from lib.query_cache import QUERY_CACHE
+from lib.query_embedding_cache import QUERY_EMBEDDING_CACHE
+
 from lib.search_utils import (
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_ALPHA,
@@ -29,6 +32,7 @@ def main() -> None:
     weighted_search_parser.add_argument("query", type=str, help="Search query")
     weighted_search_parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="alpha to control weighting between the keyword and semantic search")
     weighted_search_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="the number of search results to filter out")
+    weighted_search_parser.add_argument("--disk-cache", action="store_true", help="reuse results and query embeddings cached on disk by earlier runs, and cache this one")
 
     #Command: rrf_search
     rrf_search_parser = subparsers.add_parser("rrf-search", help="Perform Reciprocal Rank Fusion search")
@@ -38,8 +42,12 @@ def main() -> None:
     rrf_search_parser.add_argument("--enhance", type=str, choices=["spell", "rewrite", "expand"], help="Query enhancement method")
     rrf_search_parser.add_argument("--rerank-method", type=str, choices=["individual", "batch", "cross_encoder"], help="search result re-ranking method")
     rrf_search_parser.add_argument("--evaluate", action="store_true", help="rates the search results")
+    rrf_search_parser.add_argument("--disk-cache", action="store_true", help="reuse results and query embeddings cached on disk by earlier runs, and cache this one")
 
     args = parser.parse_args()
+    if getattr(args, "disk_cache", False):
+        QUERY_CACHE.enable_disk()
+        QUERY_EMBEDDING_CACHE.enable_disk()
 
     match args.command:
         case "normalize":
@@ -98,6 +106,12 @@ def main() -> None:
         case _:
             parser.print_help()
 
+    if getattr(args, "disk_cache", False):
+        stats = QUERY_CACHE.stats()
+        print(f"Cache: {stats['hits']} hits ({stats['disk_hits']} from disk), {stats['misses']} misses")
+        stats = QUERY_EMBEDDING_CACHE.stats()
+        print(f"Query embedding cache: {stats['hits']} hits ({stats['disk_hits']} from disk), {stats['misses']} misses")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,7 +5,10 @@
 import argparse
 
 from lib.keyword_search import (
+    autocomplete_command,
     bm25_idf_command,
+    bm25fsearch_command,
+    migrate_command,
     bm25_tf_command,
     bm25search_command,
     build_command,
@@ -14,19 +17,72 @@ from lib.keyword_search import (
     tf_command,
     tfidf_command,
 )
+from lib.posting_codec import POSTING_CODECS
+from lib.query_cache import QUERY_CACHE
+from lib.query_engine import BM25_ENGINES
+from lib.segmented_index import (
+    segments_add_command,
+    segments_bm25search_command,
+    segments_build_command,
+    segments_delete_command,
+    segments_merge_command,
+)
 from lib.search_utils import (
     BM25_B,
     BM25_K1,
+    BM25F_DESCRIPTION_WEIGHT,
+    BM25F_TITLE_WEIGHT,
+    DEFAULT_BM25_ENGINE,
+    DEFAULT_BUILD_WORKERS,
+    DEFAULT_POSTING_CODEC,
+    DEFAULT_SEARCH_LIMIT,
+    DEFAULT_SHARD_COUNT,
 )
+from lib.sharded_index import shards_bm25search_command, shards_build_command
+from lib.spell_correction import spell_command
+
+
+def print_cache_stats() -> None:
+    stats = QUERY_CACHE.stats()
+    print(
+        f"Cache: {stats['hits']} hits ({stats['disk_hits']} from disk), "
+        f"{stats['misses']} misses"
+    )
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
-    subparsers.add_parser("build", help="Build the inverted index")
+    build_parser = subparsers.add_parser("build", help="Build the inverted index")
+    build_parser.add_argument(
+        "--codec",
+        type=str,
+        choices=POSTING_CODECS,
+        default=DEFAULT_POSTING_CODEC,
+        help="Posting list storage: raw arrays or bit-packed blocks",
+    )
+    build_parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_BUILD_WORKERS,
+        help="Processes used to analyze movies (0 = one per CPU)",
+    )
+    build_parser.add_argument(
+        "--positions",
+        action="store_true",
+        help="Also index word positions, for phrase queries and proximity scoring",
+    )
+    subparsers.add_parser(
+        "migrate", help="Convert a pickled inverted index to the binary format"
+    )
 
-    search_parser = subparsers.add_parser("search", help="Search movies using BM25")
-    search_parser.add_argument("query", type=str, help="Search query")
+    search_parser = subparsers.add_parser(
+        "search", help='Search movies by keywords, with AND, OR, NOT, ( ) and "phrases"'
+    )
+    search_parser.add_argument(
+        "query", type=str, help="Search query, e.g. '(space OR alien) AND NOT comedy'"
+    )
 
     tf_parser = subparsers.add_parser(
         "tf", help="Get term frequency for a given document ID and term"
@@ -67,15 +123,132 @@ def main() -> None:
     bm25search_parser = subparsers.add_parser(
         "bm25search", help="Search movies using full BM25 scoring"
     )
-    bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument(
+        "query",
+        type=str,
+        help='Search query; on an index with positions, "quoted phrases" must match verbatim',
+    )
+    bm25search_parser.add_argument(
+        "--engine",
+        type=str,
+        choices=list(BM25_ENGINES),
+        default=DEFAULT_BM25_ENGINE,
+        help="Top-k engine: exhaustive term-at-a-time, WAND or Block-Max WAND",
+    )
+    bm25search_parser.add_argument(
+        "--proximity",
+        type=float,
+        default=0.0,
+        help="Weight of the term proximity score (needs an index built with --positions)",
+    )
+    bm25search_parser.add_argument(
+        "--disk-cache",
+        action="store_true",
+        help="Reuse results cached on disk by earlier runs, and cache this one",
+    )
+    bm25search_index_group = bm25search_parser.add_mutually_exclusive_group()
+    bm25search_index_group.add_argument(
+        "--segmented",
+        action="store_true",
+        help="Search the incrementally updated segmented index",
+    )
+    bm25search_index_group.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Search the sharded index, one worker process per shard",
+    )
+
+    bm25fsearch_parser = subparsers.add_parser(
+        "bm25fsearch", help="Search movies using BM25F over title and description"
+    )
+    bm25fsearch_parser.add_argument("query", type=str, help="Search query")
+    bm25fsearch_parser.add_argument(
+        "--engine",
+        type=str,
+        choices=list(BM25_ENGINES),
+        default=DEFAULT_BM25_ENGINE,
+        help="Top-k engine: exhaustive term-at-a-time, WAND or Block-Max WAND",
+    )
+    bm25fsearch_parser.add_argument(
+        "--title-weight",
+        type=float,
+        default=BM25F_TITLE_WEIGHT,
+        help="Weight of title term frequencies",
+    )
+    bm25fsearch_parser.add_argument(
+        "--description-weight",
+        type=float,
+        default=BM25F_DESCRIPTION_WEIGHT,
+        help="Weight of description term frequencies",
+    )
+
+    subparsers.add_parser(
+        "segments-build", help="Start a segmented index holding the whole catalog"
+    )
+    segments_add_parser = subparsers.add_parser(
+        "segments-add", help="Add or update movies in the segmented index"
+    )
+    segments_add_parser.add_argument(
+        "path", type=str, help="JSON file with a list of movies or a 'movies' key"
+    )
+    segments_delete_parser = subparsers.add_parser(
+        "segments-delete", help="Delete movies from the segmented index"
+    )
+    segments_delete_parser.add_argument(
+        "doc_ids", type=int, nargs="+", help="Document IDs to delete"
+    )
+    subparsers.add_parser(
+        "segments-merge", help="Merge all segments of the segmented index into one"
+    )
+
+    autocomplete_parser = subparsers.add_parser(
+        "autocomplete", help="Complete a partly typed query from titles and index terms"
+    )
+    autocomplete_parser.add_argument("prefix", type=str, help="Text typed so far")
+    autocomplete_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Completions of each kind"
+    )
+
+    shards_build_parser = subparsers.add_parser(
+        "shards-build", help="Build the keyword index split across shards"
+    )
+    shards_build_parser.add_argument(
+        "--shards", type=int, default=DEFAULT_SHARD_COUNT, help="Number of shards"
+    )
+    shards_build_parser.add_argument(
+        "--codec",
+        type=str,
+        choices=POSTING_CODECS,
+        default=DEFAULT_POSTING_CODEC,
+        help="Posting list storage: raw arrays or bit-packed blocks",
+    )
+    shards_build_parser.add_argument(
+        "--positions",
+        action="store_true",
+        help="Also index word positions, for phrase queries and proximity scoring",
+    )
+
+    spell_parser = subparsers.add_parser(
+        "spell", help="Correct query spelling locally, falling back to the LLM"
+    )
+    spell_parser.add_argument("query", type=str, help="Query to correct")
+    spell_parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="Use an offline stub instead of the LLM when no local correction is confident",
+    )
 
     args = parser.parse_args()
 
     match args.command:
         case "build":
             print("Building inverted index...")
-            build_command()
+            build_command(args.codec, args.workers, args.positions)
             print("Inverted index built successfully.")
+        case "migrate":
+            print("Migrating pickled inverted index...")
+            migrate_command()
+            print("Inverted index migrated successfully.")
         case "search":
             print("Searching for:", args.query)
             results = search_command(args.query)
@@ -96,15 +269,79 @@ def main() -> None:
             bm25idf = bm25_idf_command(args.term)
             print(f"BM25 IDF score of '{args.term}': {bm25idf:.2f}")
         case "bm25tf":
-            bm25tf = bm25_tf_command(args.doc_id, args.term, args.k1)
+            bm25tf = bm25_tf_command(args.doc_id, args.term, args.k1, args.b)
             print(
                 f"BM25 TF score of '{args.term}' in document '{args.doc_id}': {bm25tf:.2f}"
             )
         case "bm25search":
             print("Searching for:", args.query)
-            results = bm25search_command(args.query)
+            if args.disk_cache:
+                QUERY_CACHE.enable_disk()
+            try:
+                if args.segmented:
+                    results = segments_bm25search_command(
+                        args.query, engine=args.engine, proximity_weight=args.proximity
+                    )
+                elif args.sharded:
+                    results = shards_bm25search_command(
+                        args.query, engine=args.engine, proximity_weight=args.proximity
+                    )
+                else:
+                    results = bm25search_command(
+                        args.query, engine=args.engine, proximity_weight=args.proximity
+                    )
+            except ValueError as e:
+                if args.proximity <= 0:
+                    raise
+                if args.segmented:
+                    hint = "segments are built without positions, so drop --proximity"
+                elif args.sharded:
+                    hint = "rebuild the shards with `shards-build --positions`"
+                else:
+                    hint = "rebuild the index with `build --positions`"
+                parser.exit(1, f"Error: {e}; {hint}\n")
+            for i, res in enumerate(results, 1):
+                print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']:.2f}")
+            if args.disk_cache:
+                print_cache_stats()
+        case "bm25fsearch":
+            print("Searching for:", args.query)
+            results = bm25fsearch_command(
+                args.query,
+                engine=args.engine,
+                title_weight=args.title_weight,
+                description_weight=args.description_weight,
+            )
             for i, res in enumerate(results, 1):
                 print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']:.2f}")
+        case "segments-build":
+            print("Building segmented index...")
+            segments_build_command()
+            print("Segmented index built successfully.")
+        case "segments-add":
+            count = segments_add_command(args.path)
+            print(f"Added {count} movies to the segmented index.")
+        case "segments-delete":
+            segments_delete_command(args.doc_ids)
+            print(f"Deleted {len(args.doc_ids)} movies from the segmented index.")
+        case "segments-merge":
+            count = segments_merge_command()
+            print(f"Segmented index now has {count} segment(s).")
+        case "autocomplete":
+            result = autocomplete_command(args.prefix, args.limit)
+            print("Titles:")
+            for i, res in enumerate(result["titles"], 1):
+                print(f"{i}. ({res['id']}) {res['title']} - Prior: {res['score']:.2f}")
+            print("Terms:")
+            for i, res in enumerate(result["terms"], 1):
+                print(f"{i}. {res['term']} ({res['doc_freq']} docs)")
+        case "shards-build":
+            print(f"Building sharded index with {args.shards} shards...")
+            shards_build_command(args.shards, args.codec, args.positions)
+            print("Sharded index built successfully.")
+        case "spell":
+            result = spell_command(args.query, args.stub)
+            print(f"'{result['query']}' -> '{result['corrected']}' ({result['source']})")
         case _:
             parser.exit(2, parser.format_help())
 
@@ -0,0 +1,64 @@
+import string
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from nltk.stem import PorterStemmer
+
+from .search_utils import DEFAULT_STEM_CACHE_SIZE, load_stopwords
+
+
+class Analyzer:
+    """
+    Reusable text analyzer for keyword search.
+
+    Stopwords, the punctuation translate table and the stemmer are set up
+    once, and stems are memoized so repeated words are only stemmed once.
+    """
+
+    def __init__(
+        self,
+        stopwords: Optional[Iterable[str]] = None,
+        stem_cache_size: int = DEFAULT_STEM_CACHE_SIZE,
+    ) -> None:
+        if stopwords is None:
+            stopwords = load_stopwords()
+        self.stopwords = frozenset(stopwords)
+        self.punctuation_table = str.maketrans("", "", string.punctuation)
+        self.stemmer = PorterStemmer()
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+    def preprocess(self, text: str) -> str:
+        return text.lower().translate(self.punctuation_table)
+
+    def tokenize(self, text: str) -> list[str]:
+        stop_words = self.stopwords
+        stem = self.stem
+        return [
+            stem(word)
+            for word in self.preprocess(text).split()
+            if word not in stop_words
+        ]
+
+    def tokenize_with_positions(self, text: str) -> list[tuple[str, int]]:
+        """
+        Tokenize like `tokenize`, pairing each token with its word position.
+        Positions count stopwords too, so gaps left by them are kept.
+        """
+        stop_words = self.stopwords
+        stem = self.stem
+        return [
+            (stem(word), position)
+            for position, word in enumerate(self.preprocess(text).split())
+            if word not in stop_words
+        ]
+
+
+_default_analyzer: Optional[Analyzer] = None
+
+
+def get_analyzer() -> Analyzer:
+    """Return the process-wide analyzer, creating it on first use."""
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = Analyzer()
+    return _default_analyzer
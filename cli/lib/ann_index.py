@@ -0,0 +1,155 @@
+"""
+Inverted-file (IVF-flat) approximate nearest neighbour index for embeddings.
+
+Spherical k-means splits the normalized embeddings into `nlist` clusters.
+Every row is filed under its nearest centroid, and the rows of each list are
+stored contiguously:
+
+    centroids      (nlist, dim) float32, unit length
+    list_offsets   (nlist + 1,) start of each list in list_rows
+    list_rows      row numbers, sorted within each list
+
+A query is scored against the centroids only, and the rows of the `nprobe`
+best lists are its candidates, which the caller scores exactly. Raising
+nprobe trades latency for recall; nprobe = nlist is an exact search.
+
+The index is stamped with the generation of the embeddings file it was
+built from, and `load_current` ignores it once that file changes.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+
+from .embedding_store import load_normalized
+from .index_format import read_index_file, write_index_file
+from .query_cache import file_generation
+from .search_utils import (
+    ANN_KMEANS_ITERATIONS,
+    ANN_SCORE_BLOCK_ROWS,
+    ANN_TRAIN_POINTS_PER_LIST,
+    CHUNK_ANN_INDEX_PATH,
+    CHUNK_EMBEDDINGS_PATH,
+)
+from .vector_search import cosine_scores, normalize_rows
+
+
+class IVFIndex:
+    def __init__(self, path: str = CHUNK_ANN_INDEX_PATH) -> None:
+        self.path = path
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.list_rows = np.empty(0, dtype=np.int64)
+        self.generation: list = []
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def default_nlist(rows: int) -> int:
+        return max(1, min(rows, int(4 * np.sqrt(rows))))
+
+    def build(
+        self,
+        embeddings: np.ndarray,
+        nlist: Optional[int] = None,
+        iterations: int = ANN_KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> None:
+        """Cluster L2-normalized `embeddings` and file every row under its centroid."""
+        rows = len(embeddings)
+        if rows == 0:
+            raise ValueError("cannot build an ANN index over no embeddings")
+        nlist = min(nlist or self.default_nlist(rows), rows)
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; assigning every row afterwards costs one more pass.
+        train_count = min(rows, nlist * ANN_TRAIN_POINTS_PER_LIST)
+        train = np.asarray(embeddings[np.sort(rng.choice(rows, train_count, replace=False))])
+        centroids = train[rng.choice(train_count, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, train)
+            counts = np.bincount(assignments, minlength=nlist)
+            # Reseed empty lists with random training points.
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = train[rng.choice(train_count, len(empty))]
+            centroids = normalize_rows(sums)
+
+        assignments = _nearest(embeddings, centroids)
+        self.centroids = centroids
+        self.list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        self.list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=self.list_offsets[1:])
+
+    def save(self, embeddings_path: str = CHUNK_EMBEDDINGS_PATH) -> None:
+        """Write the index, stamped with the current generation of `embeddings_path`."""
+        self.generation = file_generation([embeddings_path])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        arrays = {
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_rows": self.list_rows,
+        }
+        write_index_file(self.path, arrays, {"generation": self.generation})
+
+    def load(self) -> None:
+        arrays, meta = read_index_file(self.path)
+        # Plain ndarray views: every query slices up to nprobe lists.
+        self.centroids = np.asarray(arrays["centroids"])
+        self.list_offsets = np.asarray(arrays["list_offsets"])
+        self.list_rows = np.asarray(arrays["list_rows"])
+        self.generation = meta["generation"]
+
+    @classmethod
+    def load_current(
+        cls, path: str = CHUNK_ANN_INDEX_PATH, embeddings_path: str = CHUNK_EMBEDDINGS_PATH
+    ) -> Optional["IVFIndex"]:
+        """The saved index, or None if there is none or its embeddings changed."""
+        if not os.path.exists(path):
+            return None
+        index = cls(path)
+        index.load()
+        if index.generation != file_generation([embeddings_path]):
+            return None
+        return index
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Sorted rows of the `nprobe` lists whose centroids are closest to `query`."""
+        nprobe = min(nprobe, self.nlist)
+        if nprobe <= 0:
+            return np.empty(0, dtype=np.int64)
+        centroid_scores = cosine_scores(self.centroids, query)
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate(
+            [self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]] for i in probed]
+        )
+        rows.sort()
+        return rows
+
+
+def _nearest(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid of every row, scored a block at a time."""
+    assignments = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), ANN_SCORE_BLOCK_ROWS):
+        block = np.asarray(embeddings[start : start + ANN_SCORE_BLOCK_ROWS])
+        assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def build_ann_command(nlist: Optional[int] = None) -> dict:
+    """Build the chunk ANN index over the saved chunk embeddings."""
+    embeddings = load_normalized(CHUNK_EMBEDDINGS_PATH)
+    index = IVFIndex()
+    index.build(embeddings, nlist)
+    index.save()
+    sizes = np.diff(index.list_offsets)
+    return {
+        "rows": len(embeddings),
+        "nlist": index.nlist,
+        "largest_list": int(sizes.max()),
+        "path": index.path,
+    }
@@ -0,0 +1,325 @@
+"""
+Prefix index for search-as-you-type completions.
+
+Two sorted string arrays are searched with binary search:
+
+    title keys    every word suffix of every normalized title ("dark
+                  knight rises", "knight rises", "rises"), so a prefix
+                  matches a title from any of its words
+    terms         the analyzed terms of the keyword index
+
+Each entry carries a precomputed rank, so the top k completions of a prefix
+are a partial sort over one contiguous slice. Title entries matching from
+the first word of a title come first, then titles with a higher BM25 prior
+(the BM25 score of the movie for the terms of its own title), then shorter
+titles. Terms rank by document frequency.
+
+Short prefixes match slices too long to sort per keystroke, so the best
+AUTOCOMPLETE_PRECOMPUTED completions of every prefix matching more than
+AUTOCOMPLETE_SCAN_LIMIT entries are computed at build time.
+
+The index is written next to the keyword index by `build_command`,
+stamped with the generation of the keyword index files it was built from;
+`load_current` ignores it once they change.
+"""
+
+import os
+from bisect import bisect_left
+from typing import Optional
+
+import numpy as np
+
+from .analyzer import Analyzer, get_analyzer
+from .index_format import (
+    DocumentStore,
+    TermDictionary,
+    read_index_file,
+    write_index_file,
+)
+from .query_cache import file_generation
+from .search_utils import (
+    AUTOCOMPLETE_PRECOMPUTED,
+    AUTOCOMPLETE_SCAN_LIMIT,
+    CACHE_DIR,
+    DEFAULT_SEARCH_LIMIT,
+)
+
+
+class PrefixIndex:
+    def __init__(self, analyzer: Optional[Analyzer] = None) -> None:
+        self.analyzer = analyzer or get_analyzer()
+        self.index_path = os.path.join(CACHE_DIR, "autocomplete.bin")
+        self.title_keys = TermDictionary.from_terms([])
+        self.title_doc_idxs = np.empty(0, dtype=np.int32)
+        self.title_ranks = np.empty(0, dtype=np.int64)
+        self.titles = DocumentStore.from_documents([])
+        self.title_priors = np.empty(0, dtype=np.float64)
+        self.terms = TermDictionary.from_terms([])
+        self.term_doc_freqs = np.empty(0, dtype=np.int64)
+        self.term_ranks = np.empty(0, dtype=np.int64)
+        # prefix -> best entries, for prefixes too common to scan
+        self.title_heavy = _HeavyPrefixes.empty()
+        self.term_heavy = _HeavyPrefixes.empty()
+        self.generation: list = []
+
+    def build(self, index) -> None:
+        """Build completions for the titles and terms of a built or loaded InvertedIndex."""
+        doc_count = len(index.doc_ids)
+        titles = [index.documents[doc_idx]["title"] for doc_idx in range(doc_count)]
+        self.titles = DocumentStore.from_documents(
+            {"id": int(doc_id), "title": title}
+            for doc_id, title in zip(index.doc_ids.tolist(), titles)
+        )
+
+        doc_idxs, _ = index.get_posting_arrays()
+        if index.posting_title_tfs is not None:
+            in_title = np.asarray(index.posting_title_tfs) > 0
+            self.title_priors = np.bincount(
+                doc_idxs[in_title],
+                weights=index.get_bm25_weights()[in_title],
+                minlength=doc_count,
+            )
+        else:
+            self.title_priors = np.zeros(doc_count, dtype=np.float64)
+
+        entries = []
+        for doc_idx, title in enumerate(titles):
+            words = self.normalize(title).split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), doc_idx, start == 0, len(words)))
+        entries.sort(key=lambda entry: entry[0])
+        keys = [entry[0] for entry in entries]
+        self.title_keys = TermDictionary.from_terms(keys)
+        self.title_doc_idxs = np.array([entry[1] for entry in entries], dtype=np.int32)
+        is_start = np.array([entry[2] for entry in entries], dtype=bool)
+        word_counts = np.array([entry[3] for entry in entries], dtype=np.int64)
+        self.title_ranks = _ranks(
+            (
+                self.title_doc_idxs,
+                word_counts,
+                -self.title_priors[self.title_doc_idxs],
+                ~is_start,
+            )
+        )
+        self.title_heavy = _HeavyPrefixes.build(keys, self.title_ranks, self.title_doc_idxs)
+
+        self.terms = TermDictionary(index.terms.blob, index.terms.offsets)
+        self.term_doc_freqs = np.diff(index.posting_offsets)
+        self.term_ranks = _ranks(
+            (np.arange(len(self.term_doc_freqs)), -self.term_doc_freqs)
+        )
+        self.term_heavy = _HeavyPrefixes.build(list(self.terms), self.term_ranks)
+
+    def save(self, keyword_index_paths: list[str]) -> None:
+        """Write the index, stamped with the current generation of `keyword_index_paths`."""
+        self.generation = file_generation(keyword_index_paths)
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        arrays = {
+            "title_key_blob": self.title_keys.blob,
+            "title_key_offsets": self.title_keys.offsets,
+            "title_doc_idxs": self.title_doc_idxs,
+            "title_ranks": self.title_ranks,
+            "title_blob": self.titles.blob,
+            "title_offsets": self.titles.offsets,
+            "title_priors": self.title_priors,
+            "term_blob": self.terms.blob,
+            "term_offsets": self.terms.offsets,
+            "term_doc_freqs": self.term_doc_freqs,
+            "term_ranks": self.term_ranks,
+            **self.title_heavy.arrays("title_heavy"),
+            **self.term_heavy.arrays("term_heavy"),
+        }
+        write_index_file(self.index_path, arrays, {"generation": self.generation})
+
+    def load(self) -> None:
+        arrays, meta = read_index_file(self.index_path)
+        self.title_keys = TermDictionary(arrays["title_key_blob"], arrays["title_key_offsets"])
+        self.title_doc_idxs = arrays["title_doc_idxs"]
+        self.title_ranks = arrays["title_ranks"]
+        self.titles = DocumentStore(arrays["title_blob"], arrays["title_offsets"])
+        self.title_priors = arrays["title_priors"]
+        self.terms = TermDictionary(arrays["term_blob"], arrays["term_offsets"])
+        self.term_doc_freqs = arrays["term_doc_freqs"]
+        self.term_ranks = arrays["term_ranks"]
+        self.title_heavy = _HeavyPrefixes.from_arrays(arrays, "title_heavy")
+        self.term_heavy = _HeavyPrefixes.from_arrays(arrays, "term_heavy")
+        # Indexes written before the stamp never match a generation.
+        self.generation = meta.get("generation")
+
+    @classmethod
+    def load_current(
+        cls, keyword_index_paths: list[str], analyzer: Optional[Analyzer] = None
+    ) -> Optional["PrefixIndex"]:
+        """The saved index, or None if there is none or the keyword index changed."""
+        prefixes = cls(analyzer)
+        if not os.path.exists(prefixes.index_path):
+            return None
+        prefixes.load()
+        if prefixes.generation != file_generation(keyword_index_paths):
+            return None
+        return prefixes
+
+    def normalize(self, text: str) -> str:
+        return " ".join(self.analyzer.preprocess(text).split())
+
+    def complete_titles(self, prefix: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        """Return up to `limit` movies whose title has a word starting with `prefix`."""
+        key = self.normalize(prefix)
+        if not key or limit <= 0:
+            return []
+        entries = self.title_heavy.get(key, limit)
+        if entries is None:
+            start, end = self.title_keys.prefix_range(key)
+            entries = _best_entries(self.title_ranks, start, end, limit, self.title_doc_idxs)
+        results = []
+        for entry in entries:
+            doc_idx = int(self.title_doc_idxs[entry])
+            title = self.titles[doc_idx]
+            results.append(
+                {
+                    "id": title["id"],
+                    "title": title["title"],
+                    "score": float(self.title_priors[doc_idx]),
+                }
+            )
+        return results
+
+    def complete_terms(self, prefix: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        """Return up to `limit` index terms completing the last word of `prefix`."""
+        words = self.analyzer.preprocess(prefix).split()
+        if not words or prefix[-1:].isspace() or limit <= 0:
+            return []
+        entries = self.term_heavy.get(words[-1], limit)
+        if entries is None:
+            start, end = self.terms.prefix_range(words[-1])
+            entries = _best_entries(self.term_ranks, start, end, limit)
+        return [
+            {"term": self.terms[term_id], "doc_freq": int(self.term_doc_freqs[term_id])}
+            for term_id in entries
+        ]
+
+
+class _HeavyPrefixes:
+    """Best entries of every prefix matching more than AUTOCOMPLETE_SCAN_LIMIT keys."""
+
+    def __init__(self, prefixes: TermDictionary, best: np.ndarray) -> None:
+        self.prefixes = prefixes
+        # One row per prefix, padded with -1.
+        self.best = best
+
+    @classmethod
+    def empty(cls) -> "_HeavyPrefixes":
+        return cls(
+            TermDictionary.from_terms([]),
+            np.empty((0, AUTOCOMPLETE_PRECOMPUTED), dtype=np.int64),
+        )
+
+    @classmethod
+    def build(
+        cls, keys: list[str], ranks: np.ndarray, group_ids: Optional[np.ndarray] = None
+    ) -> "_HeavyPrefixes":
+        """
+        Walk the prefixes of the sorted `keys` depth first; only prefixes
+        matching more than AUTOCOMPLETE_SCAN_LIMIT keys are kept or expanded.
+        """
+        heavy = {}
+        pending = [("", 0, len(keys))]
+        while pending:
+            prefix, start, end = pending.pop()
+            if end - start <= AUTOCOMPLETE_SCAN_LIMIT:
+                continue
+            if prefix:
+                row = np.full(AUTOCOMPLETE_PRECOMPUTED, -1, dtype=np.int64)
+                best = _best_entries(ranks, start, end, AUTOCOMPLETE_PRECOMPUTED, group_ids)
+                row[: len(best)] = best
+                heavy[prefix] = row
+            depth = len(prefix)
+            i = start
+            while i < end:
+                if len(keys[i]) <= depth:
+                    i += 1
+                    continue
+                child = keys[i][: depth + 1]
+                # The first key past every key starting with `child`.
+                child_end = bisect_left(keys, child[:-1] + chr(ord(child[-1]) + 1), i, end)
+                pending.append((child, i, child_end))
+                i = child_end
+
+        prefixes = sorted(heavy)
+        if not prefixes:
+            return cls.empty()
+        return cls(TermDictionary.from_terms(prefixes), np.stack([heavy[p] for p in prefixes]))
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], name: str) -> "_HeavyPrefixes":
+        return cls(
+            TermDictionary(arrays[f"{name}_blob"], arrays[f"{name}_offsets"]),
+            arrays[f"{name}_best"],
+        )
+
+    def arrays(self, name: str) -> dict[str, np.ndarray]:
+        return {
+            f"{name}_blob": self.prefixes.blob,
+            f"{name}_offsets": self.prefixes.offsets,
+            f"{name}_best": self.best,
+        }
+
+    def get(self, prefix: str, limit: int) -> Optional[list[int]]:
+        """The best `limit` entries of `prefix`, or None if they must be scanned."""
+        if limit > AUTOCOMPLETE_PRECOMPUTED:
+            return None
+        prefix_id = self.prefixes.get(prefix)
+        if prefix_id < 0:
+            return None
+        row = self.best[prefix_id][:limit]
+        return row[row >= 0].tolist()
+
+
+def _ranks(sort_keys: tuple[np.ndarray, ...]) -> np.ndarray:
+    """Rank of every entry under `sort_keys`, last key primary, as for np.lexsort."""
+    order = np.lexsort(sort_keys)
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+    return ranks
+
+
+def _best_entries(
+    ranks: np.ndarray,
+    start: int,
+    end: int,
+    limit: int,
+    group_ids: Optional[np.ndarray] = None,
+) -> list[int]:
+    """
+    Positions of the `limit` best ranked entries in [start, end), best
+    first. With `group_ids`, only the best entry of each group is kept
+    (a title can match at several of its words); the partially sorted
+    window doubles until it holds `limit` groups.
+    """
+    ranks = ranks[start:end]
+    take = limit
+    while True:
+        best, seen = [], set()
+        for entry in _top_ranked(ranks, take):
+            if group_ids is not None:
+                group = int(group_ids[start + entry])
+                if group in seen:
+                    continue
+                seen.add(group)
+            best.append(start + entry)
+            if len(best) == limit:
+                return best
+        if take >= len(ranks):
+            return best
+        take *= 2
+
+
+def _top_ranked(ranks: np.ndarray, count: int) -> list[int]:
+    """Positions of the `count` lowest ranks, best first."""
+    if count <= 0:
+        return []
+    if count < len(ranks):
+        positions = np.argpartition(ranks, count - 1)[:count]
+    else:
+        positions = np.arange(len(ranks))
+    return positions[np.argsort(ranks[positions])].tolist()
@@ -0,0 +1,519 @@
+"""
+Benchmarks for the search engines, run against the local movie corpus.
+"""
+
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import accumulate
+
+import numpy as np
+from nltk.stem import PorterStemmer
+
+from .analyzer import Analyzer
+from .ann_index import IVFIndex
+from .keyword_search import InvertedIndex
+from .posting_codec import POSTING_CODECS
+from .quantization import QUANTIZATION_MODES, QuantizedEmbeddings, rescore
+from .query_engine import BM25_ENGINES
+from .sharded_index import ShardedIndex
+from .vector_search import (
+    cosine_scores,
+    cosine_similarity,
+    group_starts,
+    normalize_rows,
+    top_k_indices,
+)
+from .search_utils import (
+    DEFAULT_SEARCH_LIMIT,
+    load_golden_dataset,
+    load_movies,
+    load_stopwords,
+)
+
+
+class LegacyAnalyzer:
+    """The original per-call tokenizer, kept only as a benchmark baseline."""
+
+    def tokenize(self, text: str) -> list[str]:
+        text = text.lower()
+        text = text.translate(str.maketrans("", "", string.punctuation))
+        stop_words = load_stopwords()
+        stemmer = PorterStemmer()
+        return [stemmer.stem(word) for word in text.split() if word not in stop_words]
+
+
+def time_call(fn, *args, **kwargs) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def load_benchmark_queries() -> list[str]:
+    return [test_case["query"] for test_case in load_golden_dataset()]
+
+
+def analyzer_benchmark_command(limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+    queries = load_benchmark_queries()
+    report = {}
+    for name, analyzer in (("before", LegacyAnalyzer()), ("after", Analyzer())):
+        idx = InvertedIndex(analyzer=analyzer)
+        build_time, _ = time_call(idx.build)
+        query_time = 0.0
+        for query in queries:
+            elapsed, _ = time_call(idx.bm25_search, query, limit)
+            query_time += elapsed
+        report[name] = {
+            "build_seconds": build_time,
+            "query_seconds": query_time / len(queries) if queries else 0.0,
+        }
+    report["queries"] = len(queries)
+    return report
+
+
+def synthetic_movies(
+    count: int, vocab_size: int = 50000, words_per_doc: int = 60, seed: int = 42
+) -> list[dict]:
+    """Generate movies whose words follow a Zipf distribution."""
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(vocab_size)]
+    cum_weights = list(accumulate(1 / (rank + 1) for rank in range(vocab_size)))
+    movies = []
+    for doc_id in range(1, count + 1):
+        length = rng.randint(words_per_doc // 2, words_per_doc * 2)
+        words = rng.choices(vocab, cum_weights=cum_weights, k=length)
+        movies.append(
+            {
+                "id": doc_id,
+                "title": " ".join(words[:3]),
+                "description": " ".join(words[3:]),
+            }
+        )
+    return movies
+
+
+def synthetic_queries(
+    count: int, vocab_size: int = 50000, seed: int = 7
+) -> list[str]:
+    """Mix frequent and rare terms, like real multi-word queries."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        words = [f"term{rng.randint(0, 100)}" for _ in range(rng.randint(1, 2))]
+        words += [f"term{rng.randint(100, vocab_size - 1)}" for _ in range(rng.randint(1, 2))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def bm25_engines_benchmark_command(
+    doc_count: int = 100000, query_count: int = 50, limit: int = 10
+) -> dict:
+    idx = InvertedIndex(analyzer=Analyzer(stopwords=()))
+    build_time, _ = time_call(idx.build, synthetic_movies(doc_count))
+    queries = synthetic_queries(query_count)
+    # Warm the per-term postings so only ranking is measured.
+    for query in queries:
+        idx.bm25_search(query, limit)
+
+    report = {"build_seconds": build_time, "docs": doc_count, "queries": query_count}
+    baseline = {}
+    for engine in BM25_ENGINES:
+        elapsed = 0.0
+        mismatches = 0
+        for query in queries:
+            query_time, results = time_call(idx.bm25_search, query, limit, engine)
+            elapsed += query_time
+            ranked = [(r["id"], r["score"]) for r in results]
+            if engine == "taat":
+                baseline[query] = ranked
+            elif ranked != baseline[query]:
+                mismatches += 1
+        report[engine] = {
+            "query_ms": elapsed / query_count * 1000,
+            "mismatches": mismatches,
+        }
+    return report
+
+
+def posting_codec_benchmark_command(
+    doc_count: int = 100000, query_count: int = 50, limit: int = 10
+) -> dict:
+    analyzer = Analyzer(stopwords=())
+    idx = InvertedIndex(analyzer=analyzer)
+    idx.build(synthetic_movies(doc_count))
+    queries = synthetic_queries(query_count)
+
+    report = {"docs": doc_count, "queries": query_count}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for codec in POSTING_CODECS:
+            idx.index_path = os.path.join(tmp_dir, f"{codec}.bin")
+            idx.save(codec)
+            loaded = InvertedIndex(analyzer=analyzer)
+            loaded.index_path = idx.index_path
+            loaded.load()
+            if loaded.compressed_postings is not None:
+                posting_bytes = loaded.compressed_postings.nbytes
+            else:
+                posting_bytes = loaded.posting_doc_idxs.nbytes + loaded.posting_tfs.nbytes
+
+            codec_report = {
+                "posting_bytes": posting_bytes,
+                "file_bytes": os.path.getsize(idx.index_path),
+            }
+            for engine in ("taat", "bmw"):
+                elapsed = 0.0
+                for query in queries:
+                    # Every query starts cold, as in a one-shot CLI process.
+                    loaded.bm25_postings = {}
+                    query_time, _ = time_call(loaded.bm25_search, query, limit, engine)
+                    elapsed += query_time
+                codec_report[f"{engine}_query_ms"] = elapsed / query_count * 1000
+            report[codec] = codec_report
+
+    report["compression_ratio"] = (
+        report["raw"]["posting_bytes"] / report["bitpack"]["posting_bytes"]
+    )
+    return report
+
+
+def build_workers_benchmark_command(
+    doc_count: int = 100000, worker_counts: tuple[int, ...] = (1, 2, 4, 8)
+) -> dict:
+    movies = synthetic_movies(doc_count)
+    report = {"docs": doc_count, "cpus": os.cpu_count()}
+    reference = None
+    for workers in worker_counts:
+        # A fresh analyzer per run, so every build starts with a cold stem cache.
+        idx = InvertedIndex(analyzer=Analyzer(stopwords=()))
+        elapsed, _ = time_call(idx.build, movies, workers)
+        arrays = (idx.posting_offsets, idx.posting_doc_idxs, idx.posting_tfs, idx.doc_lengths)
+        if reference is None:
+            reference = arrays
+        identical = all(np.array_equal(a, b) for a, b in zip(arrays, reference))
+        report[workers] = {"build_seconds": elapsed, "identical": identical}
+    return report
+
+
+def boolean_benchmark_command(doc_count: int = 100000, query_count: int = 50) -> dict:
+    analyzer = Analyzer(stopwords=())
+    idx = InvertedIndex(analyzer=analyzer)
+    idx.build(synthetic_movies(doc_count))
+    rng = random.Random(11)
+    # Conjunctions of frequent terms, optionally narrowed by a rarer one.
+    queries = []
+    for _ in range(query_count):
+        words = [f"term{rng.randint(0, 20)}" for _ in range(rng.randint(2, 3))]
+        if rng.random() < 0.5:
+            words.append(f"term{rng.randint(100, 5000)}")
+        queries.append(" AND ".join(words))
+
+    def set_intersection(query: str) -> list[int]:
+        matches = None
+        for word in query.split(" AND "):
+            doc_idxs = set(idx.get_postings(word)[0].tolist())
+            matches = doc_idxs if matches is None else matches & doc_idxs
+        return sorted(matches)
+
+    report = {"docs": doc_count, "queries": query_count}
+    elapsed = 0.0
+    expected = {}
+    for query in queries:
+        query_time, expected[query] = time_call(set_intersection, query)
+        elapsed += query_time
+    report["set_intersection"] = {"query_ms": elapsed / query_count * 1000, "mismatches": 0}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for codec in POSTING_CODECS:
+            idx.index_path = os.path.join(tmp_dir, f"{codec}.bin")
+            idx.save(codec)
+            loaded = InvertedIndex(analyzer=analyzer)
+            loaded.index_path = idx.index_path
+            loaded.load()
+            elapsed = 0.0
+            mismatches = 0
+            for query in queries:
+                query_time, matches = time_call(loaded.boolean_search, query)
+                elapsed += query_time
+                mismatches += matches.tolist() != expected[query]
+            report[f"boolean_{codec}"] = {
+                "query_ms": elapsed / query_count * 1000,
+                "mismatches": mismatches,
+            }
+    return report
+
+
+def bm25_many_benchmark_command(
+    doc_count: int = 100000, query_count: int = 500, limit: int = 10
+) -> dict:
+    idx = InvertedIndex(analyzer=Analyzer(stopwords=()))
+    idx.build(synthetic_movies(doc_count))
+    queries = synthetic_queries(query_count)
+    # Warm the per-term caches so both sides time scoring alone.
+    idx.bm25_search_many(queries[:1], limit)
+    idx.bm25_search(queries[0], limit)
+
+    loop_seconds, expected = time_call(lambda: [idx.bm25_search(q, limit) for q in queries])
+    batch_seconds, results = time_call(idx.bm25_search_many, queries, limit)
+    return {
+        "docs": doc_count,
+        "queries": query_count,
+        "loop_seconds": loop_seconds,
+        "batch_seconds": batch_seconds,
+        "speedup": loop_seconds / batch_seconds,
+        "mismatches": sum(a != b for a, b in zip(expected, results)),
+    }
+
+
+def shards_benchmark_command(
+    doc_count: int = 100000,
+    query_count: int = 50,
+    limit: int = 10,
+    shard_counts: tuple[int, ...] = (2, 4),
+    proximity_weight: float = 1.0,
+) -> dict:
+    movies = synthetic_movies(doc_count)
+    queries = synthetic_queries(query_count)
+    idx = InvertedIndex()
+    idx.build(movies, positions=True)
+    elapsed = 0.0
+    expected = {}
+    for query in queries:
+        query_time, expected[query] = time_call(idx.bm25_rank, query, limit)
+        elapsed += query_time
+    expected_proximity = {
+        query: idx.bm25_rank(query, limit, proximity_weight=proximity_weight)
+        for query in queries
+    }
+    report = {
+        "docs": doc_count,
+        "queries": query_count,
+        "cpus": os.cpu_count(),
+        "unsharded": {"query_ms": elapsed / query_count * 1000, "mismatches": 0},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for shard_count in shard_counts:
+            with ShardedIndex(os.path.join(tmp_dir, str(shard_count))) as sharded:
+                sharded.build(shard_count, movies, positions=True)
+                # The first query starts the worker processes and opens the shards.
+                sharded.bm25_rank(queries[0], limit)
+                elapsed = 0.0
+                mismatches = 0
+                for query in queries:
+                    query_time, ranked = time_call(sharded.bm25_rank, query, limit)
+                    elapsed += query_time
+                    mismatches += ranked != expected[query]
+                proximity_mismatches = sum(
+                    sharded.bm25_rank(query, limit, proximity_weight=proximity_weight)
+                    != expected_proximity[query]
+                    for query in queries
+                )
+            report[shard_count] = {
+                "query_ms": elapsed / query_count * 1000,
+                "mismatches": mismatches,
+                "proximity_mismatches": proximity_mismatches,
+            }
+    return report
+
+
+def cosine_benchmark_command(
+    sizes: tuple[int, ...] = (10000, 100000, 1000000),
+    dim: int = 384,
+    query_count: int = 5,
+    limit: int = 10,
+) -> dict:
+    """Per-vector cosine_similarity loop and full sort vs. one product and argpartition."""
+    rng = np.random.default_rng(5)
+    queries = rng.standard_normal((query_count, dim), dtype=np.float32)
+    report = {"dim": dim, "queries": query_count}
+    for size in sizes:
+        embeddings = rng.standard_normal((size, dim), dtype=np.float32)
+
+        def loop_search(query):
+            scores = [(cosine_similarity(query, row), i) for i, row in enumerate(embeddings)]
+            scores.sort(key=lambda x: x[0], reverse=True)
+            return [i for _, i in scores[:limit]]
+
+        loop_seconds, expected = time_call(lambda: [loop_search(q) for q in queries])
+        normalize_seconds, normalized = time_call(normalize_rows, embeddings)
+        vector_seconds, results = time_call(
+            lambda: [top_k_indices(cosine_scores(normalized, q), limit).tolist() for q in queries]
+        )
+        report[size] = {
+            "loop_query_ms": loop_seconds / query_count * 1000,
+            "vector_query_ms": vector_seconds / query_count * 1000,
+            "normalize_seconds": normalize_seconds,
+            "speedup": loop_seconds / vector_seconds,
+            "mismatches": sum(a != b for a, b in zip(expected, results)),
+        }
+        del embeddings, normalized
+    return report
+
+
+def ann_benchmark_command(
+    nprobes: tuple[int, ...] = (1, 2, 4, 8, 16, 32), limit: int = 10
+) -> dict:
+    """Recall and latency of IVF chunk search against the exact search, on the golden queries."""
+    # Imported here so the keyword benchmarks run without the encoder installed.
+    from .chunked_semantic_search import ChunkedSemanticSearch
+
+    search = ChunkedSemanticSearch()
+    search.load_or_create_chunk_embeddings(load_movies())
+    report = {"chunks": len(search.chunk_embeddings), "build_seconds": 0.0}
+    if search.ann_index is None:
+        index = IVFIndex()
+        report["build_seconds"], _ = time_call(index.build, search.chunk_embeddings)
+        search.ann_index = index
+    report["nlist"] = search.ann_index.nlist
+
+    queries = [case["query"] for case in load_golden_dataset()]
+    report["queries"] = len(queries)
+    query_embeddings = search.model.encode(queries)
+
+    def run(nprobe: int) -> tuple[float, list]:
+        search.nprobe = nprobe
+        return time_call(lambda: [search.rank_chunks(q, limit) for q in query_embeddings])
+
+    exact_seconds, expected = run(0)
+    report["exact"] = {"query_ms": exact_seconds / len(queries) * 1000, "recall": 1.0}
+    for nprobe in nprobes:
+        seconds, results = run(nprobe)
+        recalls = [
+            len({m for m, _ in got} & {m for m, _ in want}) / len(want)
+            for got, want in zip(results, expected)
+            if want
+        ]
+        report[nprobe] = {
+            "query_ms": seconds / len(queries) * 1000,
+            "recall": sum(recalls) / len(recalls) if recalls else 1.0,
+        }
+    return report
+
+
+def synthetic_embeddings(count: int, dim: int, clusters: int = 256, seed: int = 7) -> np.ndarray:
+    """Normalized float32 vectors scattered around random cluster centres, like topical text."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    embeddings = centres[rng.integers(0, clusters, count)]
+    embeddings += rng.standard_normal((count, dim), dtype=np.float32)
+    return normalize_rows(embeddings)
+
+
+def quantization_benchmark_command(
+    doc_count: int = 100000,
+    dim: int = 384,
+    query_count: int = 50,
+    limit: int = 10,
+    recall_target: float = 0.99,
+) -> dict:
+    # Queries come from the same clusters as the documents.
+    embeddings = synthetic_embeddings(doc_count + query_count, dim)
+    embeddings, queries = embeddings[:doc_count], embeddings[doc_count:]
+    exact_seconds, expected = time_call(
+        lambda: [top_k_indices(cosine_scores(embeddings, q), limit) for q in queries]
+    )
+    report = {
+        "docs": doc_count,
+        "queries": query_count,
+        "float32": {"bytes": embeddings.nbytes, "query_ms": exact_seconds / query_count * 1000},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in QUANTIZATION_MODES:
+            quantized = QuantizedEmbeddings(os.path.join(tmp_dir, f"{mode}.bin"), mode)
+            build_seconds, _ = time_call(quantized.build, embeddings, recall_target)
+
+            def search(query):
+                shortlist = top_k_indices(
+                    quantized.scores(query), quantized.shortlist_size(limit)
+                )
+                rows, scores = rescore(embeddings, query, shortlist)
+                return rows[top_k_indices(scores, limit)]
+
+            seconds, results = time_call(lambda: [search(q) for q in queries])
+            recall = np.mean([np.isin(want, got).mean() for got, want in zip(results, expected)])
+            report[mode] = {
+                "bytes": quantized.nbytes(),
+                "build_seconds": build_seconds,
+                "rescore_multiplier": quantized.rescore_multiplier,
+                "query_ms": seconds / query_count * 1000,
+                "recall": float(recall),
+            }
+    return report
+
+
+def semantic_many_benchmark_command(
+    doc_count: int = 10000,
+    chunks_per_doc: int = 4,
+    dim: int = 384,
+    query_count: int = 500,
+    limit: int = 10,
+) -> dict:
+    """Per-query `rank` and `rank_chunks` vs. batched `rank_many` and `rank_chunks_many`."""
+    from .chunked_semantic_search import ChunkedSemanticSearch
+    from .semantic_search import SemanticSearch
+
+    embeddings = synthetic_embeddings(doc_count * chunks_per_doc + query_count, dim)
+    chunks, queries = embeddings[: doc_count * chunks_per_doc], embeddings[doc_count * chunks_per_doc :]
+    report = {"docs": doc_count, "chunks": len(chunks), "queries": query_count}
+
+    search = SemanticSearch()
+    search.embeddings = chunks[::chunks_per_doc]
+    chunk_search = ChunkedSemanticSearch(nprobe=0)
+    chunk_search.chunk_embeddings = chunks
+    chunk_search.chunk_movie_idxs = np.arange(len(chunks)) // chunks_per_doc
+    chunk_search.chunk_movie_starts = group_starts(chunk_search.chunk_movie_idxs)
+
+    for name, rank, rank_many in (
+        ("rank_many", search.rank, search.rank_many),
+        ("rank_chunks_many", chunk_search.rank_chunks, chunk_search.rank_chunks_many),
+    ):
+        loop_seconds, expected = time_call(lambda: [rank(q, limit) for q in queries])
+        batch_seconds, results = time_call(rank_many, queries, limit)
+        report[name] = {
+            "loop_seconds": loop_seconds,
+            "batch_seconds": batch_seconds,
+            "speedup": loop_seconds / batch_seconds,
+            "mismatches": sum(
+                [i for i, _ in got] != [i for i, _ in want] for got, want in zip(results, expected)
+            ),
+        }
+    return report
+
+
+# semantic_search_cli.py invocations timed by the startup benchmark.
+SEMANTIC_CLI_STARTUP_COMMANDS = {
+    "help": ["--help"],
+    "chunk": ["chunk", "A short text to split into chunks."],
+    "semantic_chunk": ["semantic_chunk", "One sentence. Another sentence."],
+    "verify": ["verify"],
+    "embed_text": ["embed_text", "space adventure"],
+    "embedquery": ["embedquery", "space adventure"],
+    "search": ["search", "space adventure"],
+    "search_chunked": ["search_chunked", "space adventure"],
+}
+
+
+def startup_benchmark_command(commands: tuple[str, ...] = (), runs: int = 3) -> dict:
+    """Wall-clock time of semantic_search_cli.py subcommands, each in a fresh process."""
+    cli = os.path.join(os.path.dirname(os.path.dirname(__file__)), "semantic_search_cli.py")
+    report = {}
+    for name in commands or SEMANTIC_CLI_STARTUP_COMMANDS:
+        timings = []
+        for _ in range(runs):
+            elapsed, completed = time_call(
+                subprocess.run,
+                [sys.executable, cli, *SEMANTIC_CLI_STARTUP_COMMANDS[name]],
+                capture_output=True,
+            )
+            timings.append(elapsed)
+        report[name] = {
+            "first_seconds": timings[0],
+            "best_seconds": min(timings),
+            "returncode": completed.returncode,
+        }
+    return report
@@ -0,0 +1,181 @@
+"""
+Boolean retrieval over the keyword index.
+
+Queries combine words and "quoted phrases" with AND, OR, NOT and
+parentheses. NOT binds tightest, then AND, then OR; words placed next to
+each other without an operator are ORed, as in plain keyword search.
+Operators must be written in upper case, since lower-case "and", "or" and
+"not" are ordinary (stop)words.
+
+Queries are parsed into tuples:
+
+    ("term", token) | ("phrase", text) | ("and", [nodes]) | ("or", [nodes])
+    | ("not", node)
+
+and evaluated to sorted arrays of doc idxs. Conjunctions never walk whole
+posting lists: the rarest operand is materialized and every other term only
+probes its postings for those candidates (see InvertedIndex.contains).
+"""
+
+import re
+from typing import Optional
+
+import numpy as np
+
+from .analyzer import Analyzer
+
+BOOLEAN_OPERATORS = ("AND", "OR", "NOT")
+QUERY_TOKEN_PATTERN = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+
+
+def lex_boolean_query(query: str) -> list[str]:
+    return QUERY_TOKEN_PATTERN.findall(query)
+
+
+def is_boolean_query(query: str) -> bool:
+    """Whether `query` uses any boolean syntax beyond plain words."""
+    return any(
+        token in BOOLEAN_OPERATORS or token in ("(", ")") or token.startswith('"')
+        for token in lex_boolean_query(query)
+    )
+
+
+def parse_boolean_query(query: str, analyzer: Analyzer) -> Optional[tuple]:
+    """
+    Parse `query` into a node tree, or None if it has no indexed words.
+    Words are analyzed as at index time; words that analyze to nothing
+    (stopwords) drop out of the tree.
+    """
+    return _Parser(lex_boolean_query(query), analyzer).parse()
+
+
+class _Parser:
+    def __init__(self, tokens: list[str], analyzer: Analyzer) -> None:
+        self.tokens = tokens
+        self.pos = 0
+        self.analyzer = analyzer
+
+    def parse(self) -> Optional[tuple]:
+        node = self.__or()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"unexpected {self.tokens[self.pos]!r} in boolean query")
+        return node
+
+    def __peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def __or(self) -> Optional[tuple]:
+        children = [self.__and()]
+        while self.__peek() not in (None, ")"):
+            if self.__peek() == "OR":
+                self.pos += 1
+            children.append(self.__and())
+        return _combine("or", children)
+
+    def __and(self) -> Optional[tuple]:
+        children = [self.__not()]
+        while self.__peek() == "AND":
+            self.pos += 1
+            children.append(self.__not())
+        return _combine("and", children)
+
+    def __not(self) -> Optional[tuple]:
+        if self.__peek() == "NOT":
+            self.pos += 1
+            child = self.__not()
+            return None if child is None else ("not", child)
+        return self.__primary()
+
+    def __primary(self) -> Optional[tuple]:
+        token = self.__peek()
+        if token is None:
+            raise ValueError("unexpected end of boolean query")
+        if token in BOOLEAN_OPERATORS or token == ")":
+            raise ValueError(f"unexpected {token!r} in boolean query")
+        self.pos += 1
+        if token == "(":
+            node = self.__or()
+            if self.__peek() != ")":
+                raise ValueError("missing ')' in boolean query")
+            self.pos += 1
+            return node
+        if token.startswith('"'):
+            phrase = token.strip('"')
+            return ("phrase", phrase) if self.analyzer.tokenize(phrase) else None
+        return _combine("or", [("term", t) for t in self.analyzer.tokenize(token)])
+
+
+def _combine(op: str, children: list[Optional[tuple]]) -> Optional[tuple]:
+    children = [child for child in children if child is not None]
+    if not children:
+        return None
+    if len(children) == 1:
+        return children[0]
+    return (op, children)
+
+
+def evaluate(node: Optional[tuple], index) -> np.ndarray:
+    """Return the sorted doc idxs of `index` matching `node`."""
+    if node is None:
+        return np.empty(0, dtype=np.int64)
+    op = node[0]
+    if op == "term":
+        return index.get_postings(node[1])[0].astype(np.int64)
+    if op == "phrase":
+        if index.positions is not None:
+            return index.phrase_doc_idxs(node[1]).astype(np.int64)
+        # Without positions a phrase can only require all of its words.
+        terms = [("term", token) for token in index.analyzer.tokenize(node[1])]
+        return evaluate(_combine("and", terms), index)
+    if op == "or":
+        matches = [evaluate(child, index) for child in node[1]]
+        return np.unique(np.concatenate(matches))
+    if op == "not":
+        all_docs = _all_docs(index)
+        return all_docs[~_contains(node[1], index, all_docs)]
+    return _evaluate_and(node[1], index)
+
+
+def _evaluate_and(children: list[tuple], index) -> np.ndarray:
+    positive = [child for child in children if child[0] != "not"]
+    negative = [child[1] for child in children if child[0] == "not"]
+
+    # Materialize the cheapest operand: the rarest term, unless a compound
+    # operand turns out smaller once evaluated.
+    terms = sorted(
+        (child for child in positive if child[0] == "term"),
+        key=lambda child: index.get_doc_freq(child[1]),
+    )
+    others = [evaluate(child, index) for child in positive if child[0] != "term"]
+    if terms and (not others or index.get_doc_freq(terms[0][1]) <= min(map(len, others))):
+        candidates = evaluate(terms.pop(0), index)
+    elif others:
+        others.sort(key=len)
+        candidates = others.pop(0)
+    else:
+        candidates = _all_docs(index)
+
+    for child in terms:
+        if len(candidates) == 0:
+            break
+        candidates = candidates[index.contains(child[1], candidates)]
+    for matches in others:
+        candidates = candidates[np.isin(candidates, matches, assume_unique=True)]
+    for child in negative:
+        if len(candidates) == 0:
+            break
+        candidates = candidates[~_contains(child, index, candidates)]
+    return candidates
+
+
+def _contains(node: tuple, index, candidates: np.ndarray) -> np.ndarray:
+    """Boolean mask of the `candidates` matching `node`."""
+    if node[0] == "term":
+        return index.contains(node[1], candidates)
+    if node[0] == "not":
+        return ~_contains(node[1], index, candidates)
+    return np.isin(candidates, evaluate(node, index), assume_unique=True)
+
+
+def _all_docs(index) -> np.ndarray:
+    return np.arange(len(index.doc_ids), dtype=np.int64)
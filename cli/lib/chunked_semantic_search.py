@@ -1,120 +1,268 @@
 import json
 import os
+from itertools import batched, chain
 import numpy as np
+from .ann_index import IVFIndex
+from .embedding_cache import content_hash, content_hasher, text_key
+from .embedding_store import EmbeddingWriter, load_normalized
 from .semantic_search import (
     SemanticSearch,
     semantic_chunking,
-    cosine_similarity
+)
+from .quantization import rescore
+from .vector_search import (
+    cosine_scores,
+    group_rows,
+    group_starts,
+    normalize_rows,
+    top_k_groups,
 )
 
 from .search_utils import (
+    ANN_DEFAULT_NPROBE,
     CHUNK_EMBEDDINGS_PATH,
+    DEFAULT_EMBEDDING_STORAGE,
+    DEFAULT_RECALL_TARGET,
     CHUNK_METADATA_PATH,
     DEFAULT_SEMANTIC_CHUNK_SIZE,
     DEFAULT_CHUNK_OVERLAP,
     DOCUMENT_PREVIEW_LENGTH,
+    EMBEDDING_BATCH_SIZE,
+    MovieCatalog,
+    SEMANTIC_BATCH_CELLS,
     load_movies,
     format_search_result
 )
 
+# Part of the chunk content hash: other settings chunk the same descriptions differently.
+CHUNKING_PARAMS = f"semantic_chunking:{DEFAULT_SEMANTIC_CHUNK_SIZE}:{DEFAULT_CHUNK_OVERLAP}"
+
 class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name = "all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
+    def __init__(
+        self,
+        model_name = "all-MiniLM-L6-v2",
+        nprobe: int = ANN_DEFAULT_NPROBE,
+        storage: str = DEFAULT_EMBEDDING_STORAGE,
+        recall_target: float = DEFAULT_RECALL_TARGET,
+    ) -> None:
+        """
+        `nprobe` is the number of ANN lists scanned per query when an ANN
+        index was built for the chunk embeddings; 0 always searches exactly.
+        `storage` and `recall_target` are as for SemanticSearch.
+        """
+        super().__init__(model_name, storage, recall_target)
         self.chunk_embeddings = None
-        self.chunk_metadata = None
-
-    def build_chunk_embeddings(self, documents):
-        self.documents = documents
-        self.document_map = {}
-
-        for doc in documents:
-            self.document_map[doc['id']] = doc
-
-        all_chunks = []
-        chunk_metadata = []
-
-        for doc_idx, doc in enumerate(documents):
-            if not doc['description'] or not doc['description'].strip():
-                continue
-             
-            chunks = semantic_chunking(
-                doc['description'], 
-                max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
-                overlap=DEFAULT_CHUNK_OVERLAP
-            )
+        # movie_idx of every chunk, and where each movie's chunks start; the
+        # rest of the chunk metadata stays on disk
+        self.chunk_movie_idxs = None
+        self.chunk_movie_starts = None
+        self.nprobe = nprobe
+        self.ann_index = None
+        self.quantized_chunks = None
+
+    def build_chunk_embeddings(self, documents, batch_size=EMBEDDING_BATCH_SIZE):
+        """
+        Chunk and embed documents `batch_size` at a time, flushing the
+        embeddings and chunk metadata of every batch to disk, so any
+        iterable of movies can be embedded with bounded memory; only the
+        movie_idx of every chunk is kept. Chunks embedded by earlier builds
+        come from the embedding cache. A list of documents is kept for
+        search, as in `build_embeddings`.
+        """
+        self.set_documents(documents)
+        hasher = content_hasher(self.model_name)
+        hasher.update(text_key(CHUNKING_PARAMS))
+        total_chunks = 0
+        movie_idx_batches = [np.empty(0, dtype=np.int64)]
+        metadata_tmp_path = f"{CHUNK_METADATA_PATH}.tmp"
+        os.makedirs(os.path.dirname(CHUNK_METADATA_PATH), exist_ok=True)
+
+        try:
+            with EmbeddingWriter(CHUNK_EMBEDDINGS_PATH) as writer, open(metadata_tmp_path, 'w') as f:
+                f.write('{"chunks": [')
+                for batch in batched(enumerate(documents), batch_size):
+                    batch_chunks = []
+                    chunk_metadata = []
+
+                    for doc_idx, doc in batch:
+                        hasher.update(text_key(doc['description'] or ""))
+                        if not doc['description'] or not doc['description'].strip():
+                            continue
+
+                        chunks = semantic_chunking(
+                            doc['description'],
+                            max_chunk_size=DEFAULT_SEMANTIC_CHUNK_SIZE,
+                            overlap=DEFAULT_CHUNK_OVERLAP
+                        )
+
+                        for chunk_idx, chunk in enumerate(chunks):
+                            batch_chunks.append(chunk)
+                            chunk_metadata.append({
+                                'movie_idx': doc_idx,
+                                'chunk_idx': chunk_idx,
+                                'total_chunks': len(chunks)
+                            })
+
+                    if batch_chunks:
+                        writer.write(self.encode_cached(batch_chunks))
+                    movie_idx_batches.append(
+                        np.array([metadata['movie_idx'] for metadata in chunk_metadata], dtype=np.int64)
+                    )
+                    for metadata in chunk_metadata:
+                        f.write(",\n" if total_chunks else "\n")
+                        f.write(json.dumps(metadata))
+                        total_chunks += 1
+                f.write(f'\n], "total_chunks": {total_chunks}, ')
+                f.write(f'"model": {json.dumps(self.model_name)}, "content_hash": "{hasher.hexdigest()}"}}\n')
+        except BaseException:
+            # As EmbeddingWriter.abort does for the embeddings.
+            if os.path.exists(metadata_tmp_path):
+                os.remove(metadata_tmp_path)
+            raise
+        os.replace(metadata_tmp_path, CHUNK_METADATA_PATH)
+
+        self.chunk_embeddings = np.load(CHUNK_EMBEDDINGS_PATH, mmap_mode="r")
+        self.__index_chunk_movies(np.concatenate(movie_idx_batches))
+        # Any ANN index on disk was built from the old embeddings.
+        self.ann_index = None
+        self.quantized_chunks = self.load_quantized(CHUNK_EMBEDDINGS_PATH)
 
-            for chunk_idx, chunk in enumerate(chunks):
-                 all_chunks.append(chunk)
-                 chunk_metadata.append({
-                    'movie_idx': doc_idx,
-                    'chunk_idx': chunk_idx,
-                    'total_chunks': len(chunks)
-                })
-                 
-        self.chunk_embeddings = self.model.encode(all_chunks, show_progress_bar=True)
-        self.chunk_metadata = chunk_metadata
-
-        os.makedirs(os.path.dirname(CHUNK_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(CHUNK_EMBEDDINGS_PATH, self.chunk_embeddings)
-
-        with open(CHUNK_METADATA_PATH, 'w') as f:
-            json.dump(
-                {"chunks": chunk_metadata, "total_chunks": len(all_chunks)}, f, indent=2
-            )
-        
         return self.chunk_embeddings
-    
-    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
-        self.documents = documents
-        self.document_map = {}
 
-        for doc in documents:
-            self.document_map[doc['id']] = doc
+    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
+        """As `load_or_create_embeddings`, `documents` must be re-iterable."""
+        if iter(documents) is documents:
+            raise TypeError("load_or_create_chunk_embeddings needs re-iterable documents, not an iterator")
+        self.set_documents(documents)
 
+        data = None
         if os.path.exists(CHUNK_EMBEDDINGS_PATH) and os.path.exists(CHUNK_METADATA_PATH):
-            self.chunk_embeddings = np.load(CHUNK_EMBEDDINGS_PATH)
-
             with open(CHUNK_METADATA_PATH, 'r') as f:
                 data = json.load(f)
-                self.chunk_metadata = data['chunks']
+
+        if data is not None and self.__chunk_embeddings_current(data, documents):
+            self.chunk_embeddings = load_normalized(CHUNK_EMBEDDINGS_PATH)
+            self.__index_chunk_movies(
+                np.array([metadata['movie_idx'] for metadata in data['chunks']], dtype=np.int64)
+            )
+            self.ann_index = IVFIndex.load_current()
+            self.quantized_chunks = self.load_quantized(CHUNK_EMBEDDINGS_PATH)
             
             return self.chunk_embeddings
 
         return self.build_chunk_embeddings(documents)
     
+    def __chunk_embeddings_current(self, data: dict, documents: list[dict]) -> bool:
+        """Whether the saved chunks were built by this model from exactly these descriptions."""
+        texts = chain([CHUNKING_PARAMS], (doc['description'] or "" for doc in documents))
+        return data.get("model") == self.model_name and data.get("content_hash") == content_hash(
+            self.model_name, texts
+        )
+
     def search_chunks(self, query: str, limit: int = 10):
         if self.chunk_embeddings is None or self.chunk_embeddings.size == 0:
             raise ValueError("No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` first.")
 
-        if self.chunk_metadata is None or len(self.chunk_metadata) == 0:
+        if self.chunk_movie_idxs is None or len(self.chunk_movie_idxs) == 0:
             raise ValueError(
                 "No chunk metadata loaded. Call `load_or_create_chunk_embeddings` first."
             )
+
+        if self.documents is None or len(self.documents) == 0:
+            raise ValueError(
+                "No documents loaded. Build from a list of documents or call `load_or_create_chunk_embeddings` first."
+            )
         
         query_embedding = self.generate_embedding(query)
+        return self.__format_movies(self.rank_chunks(query_embedding, limit))
 
-        chunk_scores = []          
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            similarity = cosine_similarity(query_embedding, chunk_embedding)
-            
-            chunk_scores.append({
-                    "chunk_idx": i,
-                    "movie_idx": self.chunk_metadata[i]["movie_idx"],
-                    "score": similarity,
-            })
-
-        movie_scores = {}
-        for chunk in chunk_scores:
-            movie_idx = chunk['movie_idx']
-            score = chunk['score']
-
-            if movie_idx not in movie_scores or movie_scores[movie_idx] < score:
-                movie_scores[movie_idx] = score
-        
-        sorted_movies = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
-        
+    def search_chunks_many(self, queries: list[str], limit: int = 10) -> list[list[dict]]:
+        """`search_chunks` for every query, with one batched encode and scoring pass."""
+        if self.chunk_embeddings is None or self.chunk_embeddings.size == 0:
+            raise ValueError("No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` first.")
+
+        if self.chunk_movie_idxs is None or len(self.chunk_movie_idxs) == 0:
+            raise ValueError(
+                "No chunk metadata loaded. Call `load_or_create_chunk_embeddings` first."
+            )
+
+        if self.documents is None or len(self.documents) == 0:
+            raise ValueError(
+                "No documents loaded. Build from a list of documents or call `load_or_create_chunk_embeddings` first."
+            )
+        if not queries:
+            return []
+
+        query_embeddings = self.generate_embeddings(queries)
+        return [self.__format_movies(ranked) for ranked in self.rank_chunks_many(query_embeddings, limit)]
+
+    def rank_chunks(self, query_embedding: np.ndarray, limit: int) -> list[tuple[int, float]]:
+        """
+        Return the (movie_idx, score) of the `limit` movies with the chunks
+        closest to `query_embedding`, best first. With an ANN index, only
+        the chunks of the `nprobe` nearest lists are scored; if they hold
+        too few movies to fill `limit`, the search falls back to all chunks.
+        """
+        if self.ann_index is not None and self.nprobe > 0:
+            rows = self.ann_index.candidates(query_embedding, self.nprobe)
+            ranked = self.__rank_rows(query_embedding, limit, rows)
+            if len(ranked) >= min(limit, len(self.chunk_movie_starts)):
+                return ranked
+        return self.__rank_rows(query_embedding, limit)
+
+    def rank_chunks_many(self, query_embeddings: np.ndarray, limit: int) -> list[list[tuple[int, float]]]:
+        """
+        `rank_chunks` for every row of `query_embeddings`. Exact search
+        scores a block of queries against all chunks with one matrix
+        product, at most SEMANTIC_BATCH_CELLS scores per block; ANN and
+        quantized search score per query.
+        """
+        if (self.ann_index is not None and self.nprobe > 0) or self.quantized_chunks is not None:
+            return [self.rank_chunks(query_embedding, limit) for query_embedding in query_embeddings]
+
+        queries = normalize_rows(query_embeddings)
+        block_size = max(1, SEMANTIC_BATCH_CELLS // max(len(self.chunk_embeddings), 1))
+        ranked = []
+        for start in range(0, len(queries), block_size):
+            block_scores = queries[start : start + block_size] @ self.chunk_embeddings.T
+            for scores in block_scores:
+                found, found_scores = top_k_groups(
+                    scores, self.chunk_movie_idxs, self.chunk_movie_starts, limit
+                )
+                ranked.append(list(zip(found.tolist(), found_scores)))
+        return ranked
+
+    def __rank_rows(self, query_embedding, limit, rows=None) -> list[tuple[int, float]]:
+        """Rank movies by their best chunk among `rows`, or among all chunks."""
+        if rows is None:
+            movie_idxs, starts = self.chunk_movie_idxs, self.chunk_movie_starts
+        else:
+            movie_idxs = self.chunk_movie_idxs[rows]
+            starts = group_starts(movie_idxs)
+
+        if self.quantized_chunks is None:
+            embeddings = self.chunk_embeddings if rows is None else self.chunk_embeddings[rows]
+            scores = cosine_scores(embeddings, query_embedding)
+        else:
+            # Shortlist movies on the quantized chunks, then rescore every
+            # chunk of the shortlisted movies at full precision.
+            shortlist, _ = top_k_groups(
+                self.quantized_chunks.scores(query_embedding, rows),
+                movie_idxs,
+                starts,
+                self.quantized_chunks.shortlist_size(limit),
+            )
+            shortlist_rows = group_rows(self.chunk_movie_idxs, self.chunk_movie_starts, shortlist)
+            _, scores = rescore(self.chunk_embeddings, query_embedding, shortlist_rows)
+            movie_idxs = self.chunk_movie_idxs[shortlist_rows]
+            starts = group_starts(movie_idxs)
+
+        found, found_scores = top_k_groups(scores, movie_idxs, starts, limit)
+        return list(zip(found.tolist(), found_scores))
+
+    def __format_movies(self, ranked: list[tuple[int, float]]) -> list[dict]:
         results = []
-        for movie_idx, score in sorted_movies:
+        for movie_idx, score in ranked:
             doc = self.documents[movie_idx]
             results.append(
                 format_search_result(
@@ -124,11 +272,16 @@ class ChunkedSemanticSearch(SemanticSearch):
                     score=score,
                 )
             )
-
         return results
+
+    def __index_chunk_movies(self, chunk_movie_idxs: np.ndarray) -> None:
+        # Chunks are written movie by movie, so the chunks of a movie are
+        # contiguous and its best chunk is a segment max.
+        self.chunk_movie_idxs = chunk_movie_idxs
+        self.chunk_movie_starts = group_starts(self.chunk_movie_idxs)
             
 def embed_chunks():
-    documents = load_movies()
+    documents = MovieCatalog()
 
     chunk_semantic_search = ChunkedSemanticSearch()
     embeddings = chunk_semantic_search.load_or_create_chunk_embeddings(documents)
@@ -136,9 +289,9 @@ def embed_chunks():
     print(f"Generated {len(embeddings)} chunked embeddings")
 
 
-def search_chunked(query, limit):
+def search_chunked(query, limit, nprobe=ANN_DEFAULT_NPROBE, storage=DEFAULT_EMBEDDING_STORAGE):
     documents = load_movies()
-    chunk_semantic_search = ChunkedSemanticSearch()
+    chunk_semantic_search = ChunkedSemanticSearch(nprobe=nprobe, storage=storage)
     chunk_semantic_search.load_or_create_chunk_embeddings(documents)
 
     results = chunk_semantic_search.search_chunks(query, limit)
@@ -0,0 +1,129 @@
+"""
+Persistent cache of text embeddings keyed by model and text content.
+
+Every text is keyed by the SHA-1 digest of its exact UTF-8 bytes, and each
+model has its own directory, so a changed text or another model never hits
+a stale vector:
+
+    cache/embedding_cache/<model digest>/meta.json    {"model": ..., "dim": 384}
+    cache/embedding_cache/<model digest>/keys.bin     20-byte digests, one per row
+    cache/embedding_cache/<model digest>/vectors.bin  float32 rows, L2-normalized
+
+Both files are append-only. Vectors are written before their keys, so a row
+is only visible once complete; a torn append is truncated away on open.
+
+Builds look every text up here and only encode the misses, so editing one
+description re-encodes one movie. `content_hash` fingerprints the texts of
+a whole embeddings file, which is how a build's output is checked against
+the current documents.
+"""
+
+import hashlib
+import json
+import os
+from typing import Callable, Iterable
+
+import numpy as np
+
+from .search_utils import EMBEDDING_CACHE_DIR
+from .vector_search import normalize_rows
+
+KEY_SIZE = 20
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def content_hasher(model_name: str):
+    """A hash to `update` with the `text_key` of every text, in order."""
+    return hashlib.sha1(model_name.encode("utf-8"))
+
+
+def content_hash(model_name: str, texts: Iterable[str]) -> str:
+    """Fingerprint of `model_name` and the exact sequence of `texts`."""
+    digest = content_hasher(model_name)
+    for text in texts:
+        digest.update(text_key(text))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, directory: str = EMBEDDING_CACHE_DIR) -> None:
+        self.model_name = model_name
+        model_digest = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(directory, model_digest)
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self.vectors_path = os.path.join(self.directory, "vectors.bin")
+        self.dim = 0
+        # digest -> row
+        self.rows: dict[bytes, int] = {}
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self.__open()
+
+    def embed(self, texts: list[str], encode: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return the normalized embeddings of `texts`, calling `encode` once
+        with the distinct texts that are not cached yet.
+        """
+        keys = [text_key(text) for text in texts]
+        missing: dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self.rows:
+                missing.setdefault(key, text)
+        if missing:
+            self.__append(list(missing), normalize_rows(encode(list(missing.values()))))
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        if not keys:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.asarray(self.vectors[[self.rows[key] for key in keys]])
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.rows)}
+
+    def __open(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["model"] != self.model_name:
+            return
+        self.dim = meta["dim"]
+        keys = np.fromfile(self.keys_path, dtype=np.uint8)
+        key_count = len(keys) // KEY_SIZE
+        vector_count = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        count = min(key_count, vector_count)
+        # Drop the tail of an append that did not finish.
+        os.truncate(self.keys_path, count * KEY_SIZE)
+        os.truncate(self.vectors_path, count * 4 * self.dim)
+        keys = keys[: count * KEY_SIZE].reshape(count, KEY_SIZE)
+        self.rows = {key.tobytes(): row for row, key in enumerate(keys)}
+        self.__map_vectors()
+
+    def __append(self, keys: list[bytes], vectors: np.ndarray) -> None:
+        if not self.rows and self.dim == 0:
+            os.makedirs(self.directory, exist_ok=True)
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, "w") as f:
+                json.dump({"model": self.model_name, "dim": self.dim}, f)
+            for path in (self.keys_path, self.vectors_path):
+                open(path, "wb").close()
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.keys_path, "ab") as f:
+            f.write(b"".join(keys))
+        for key in keys:
+            self.rows[key] = len(self.rows)
+        self.__map_vectors()
+
+    def __map_vectors(self) -> None:
+        if not self.rows:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            return
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim)
+        )
@@ -0,0 +1,107 @@
+"""
+On-disk storage helpers for embedding matrices.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+from .vector_search import normalize_rows
+
+NPY_MAGIC = b"\x93NUMPY"
+# Room for a version 1.0 .npy header of any realistic 2-D shape; data
+# starts right after it, 64-byte aligned like numpy's own files.
+NPY_HEADER_SIZE = 128
+# Rows read to tell normalized files from ones written by older builds.
+NORMALIZED_SAMPLE_ROWS = 64
+NORMALIZE_BLOCK_ROWS = 65536
+
+
+class EmbeddingWriter:
+    """
+    Write a 2-D .npy file batch by batch, without knowing the row count.
+
+    Rows go straight to disk after a reserved header, which is filled in on
+    close. The file is written under a temporary name and moved into place
+    only when complete.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.rows = 0
+        self.dim = 0
+        self.dtype = np.dtype(np.float32)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.f = open(self.tmp_path, "wb")
+        self.f.write(b"\x00" * NPY_HEADER_SIZE)
+
+    def write(self, embeddings: np.ndarray) -> None:
+        embeddings = np.ascontiguousarray(embeddings)
+        if len(embeddings) == 0:
+            return
+        if self.rows == 0:
+            self.dim = embeddings.shape[1]
+            self.dtype = embeddings.dtype
+        elif embeddings.shape[1] != self.dim or embeddings.dtype != self.dtype:
+            raise ValueError(
+                f"expected {self.dim}-dimensional {self.dtype} embeddings, "
+                f"got {embeddings.shape[1]}-dimensional {embeddings.dtype}"
+            )
+        self.f.write(embeddings.tobytes())
+        self.rows += len(embeddings)
+
+    def close(self) -> None:
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.rows, self.dim),
+            }
+        ).encode("latin1")
+        prefix = NPY_MAGIC + bytes((1, 0))
+        header_length = NPY_HEADER_SIZE - len(prefix) - 2
+        if len(header) + 1 > header_length:
+            raise ValueError(f"shape {(self.rows, self.dim)} does not fit the header")
+        self.f.seek(0)
+        self.f.write(prefix + struct.pack("<H", header_length))
+        self.f.write(header.ljust(header_length - 1) + b"\n")
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        self.f.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self) -> "EmbeddingWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_normalized(path: str) -> np.ndarray:
+    """
+    Memory-map an embeddings file with L2-normalized rows.
+
+    Builds write normalized rows; files written by older builds hold the
+    rows as the model returned them and are normalized on disk once, a
+    block at a time. A file is entirely one or the other, so a few rows
+    at each end tell them apart without reading it all.
+    """
+    embeddings = np.load(path, mmap_mode="r")
+    sample = np.concatenate(
+        [embeddings[:NORMALIZED_SAMPLE_ROWS], embeddings[-NORMALIZED_SAMPLE_ROWS:]]
+    )
+    norms = np.linalg.norm(sample, axis=1)
+    if np.all((np.abs(norms - 1) < 1e-3) | (norms == 0)):
+        return embeddings
+
+    with EmbeddingWriter(path) as writer:
+        for start in range(0, len(embeddings), NORMALIZE_BLOCK_ROWS):
+            writer.write(normalize_rows(embeddings[start : start + NORMALIZE_BLOCK_ROWS]))
+    return np.load(path, mmap_mode="r")
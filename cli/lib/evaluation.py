@@ -48,10 +48,11 @@ def evaluate_command(limit: int = 5) -> dict:
 
     total_precision = 0
     results_by_query = {}
-    for test_case in test_cases:
+    queries = [test_case["query"] for test_case in test_cases]
+    batch_results = hybrid_search.rrf_search_many(queries, k=60, limit=limit)
+    for test_case, search_results in zip(test_cases, batch_results):
         query = test_case["query"]
         relevant_docs = set(test_case["relevant_docs"])
-        search_results = hybrid_search.rrf_search(query, k=60, limit=limit)
 
         retrieved_docs = []
         for result in search_results:
@@ -61,12 +62,12 @@ def evaluate_command(limit: int = 5) -> dict:
 
         precision = precision_at_k(retrieved_docs, relevant_docs, limit)
         recall = recall_at_k(retrieved_docs, relevant_docs, limit)
-        f1_score = f1_score(precision, recall)
+        f1 = f1_score(precision, recall)
 
         results_by_query[query] = {
             "precision": precision,
             "recall": recall,
-            "f1_score": f1_score,
+            "f1_score": f1,
             "retrieved": retrieved_docs[:limit],
             "relevant": list(relevant_docs),
         }
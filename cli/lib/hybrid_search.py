@@ -8,7 +8,15 @@ from .chunked_semantic_search import (
     ChunkedSemanticSearch,
     load_movies
 )
+from .query_cache import (
+    QUERY_CACHE,
+    QueryCache,
+    normalize_query
+)
 from .search_utils import (
+    CHUNK_EMBEDDINGS_PATH,
+    CHUNK_METADATA_PATH,
+    DATA_PATH,
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_ALPHA,
     DEFAULT_RRF_K,
@@ -52,6 +60,17 @@ class HybridSearch:
 
         combined = reciprocal_rank_fusion(bm25_results, semantic_results, k)
         return combined[:limit]
+
+    def rrf_search_many(self, queries, k, limit):
+        # BM25 and semantic search each take the whole batch in one pass.
+        self.idx.load()
+        bm25_batches = self.idx.bm25_search_many(queries, limit * 500)
+        semantic_batches = self.semantic_search.search_chunks_many(queries, limit * 500)
+        results = []
+        for bm25_results, semantic_results in zip(bm25_batches, semantic_batches):
+            combined = reciprocal_rank_fusion(bm25_results, semantic_results, k)
+            results.append(combined[:limit])
+        return results
         
 def combine_search_results(
     bm25_results: list[dict], semantic_results: list[dict], alpha: float = DEFAULT_ALPHA
@@ -140,7 +159,25 @@ def normalize_search_result_score(search_results):
 def hybrid_score(bm25_score, semantic_score, alpha=0.5):
     return alpha * bm25_score + (1 - alpha) * semantic_score
 
-def weighted_search_command(query, alpha, limit):
+def hybrid_generation_paths() -> list[str]:
+    """Files whose changes invalidate cached hybrid search results."""
+    return [
+        InvertedIndex().index_path,
+        CHUNK_EMBEDDINGS_PATH,
+        CHUNK_METADATA_PATH,
+        DATA_PATH,
+    ]
+
+def weighted_search_command(query, alpha, limit, cache: QueryCache = QUERY_CACHE):
+    return cache.get_or_compute(
+        "weighted",
+        normalize_query(query),
+        {"alpha": alpha, "limit": limit},
+        hybrid_generation_paths(),
+        lambda: _weighted_search(query, alpha, limit),
+    )
+
+def _weighted_search(query, alpha, limit):
     original_query = query
     movies = load_movies()
     hybrid_search = HybridSearch(movies)
@@ -211,6 +248,23 @@ def rrf_search_command(
     enhance: Optional[str] = None,
     rerank_method: Optional[str] = None,
     limit: int = DEFAULT_SEARCH_LIMIT,
+    cache: QueryCache = QUERY_CACHE,
+) -> dict:
+    return cache.get_or_compute(
+        "rrf",
+        normalize_query(query),
+        {"k": k, "enhance": enhance, "rerank_method": rerank_method, "limit": limit},
+        hybrid_generation_paths(),
+        lambda: _rrf_search(query, k, enhance, rerank_method, limit),
+    )
+
+
+def _rrf_search(
+    query: str,
+    k: int,
+    enhance: Optional[str],
+    rerank_method: Optional[str],
+    limit: int,
 ) -> dict:
     movies = load_movies()
     hybrid_search = HybridSearch(movies)
@@ -0,0 +1,179 @@
+"""
+Versioned, memory-mappable on-disk format for the keyword index.
+
+An index file is a small header followed by named, 64-byte aligned numpy
+arrays. The header is:
+
+    magic (8 bytes) | format version (uint32) | meta length (uint32) | meta JSON
+
+where meta JSON holds scalar statistics and, under "arrays", the dtype,
+shape and byte offset of every array. Arrays are opened with numpy.memmap,
+so loading only reads the header and pages are shared between processes.
+"""
+
+import json
+import os
+import struct
+from bisect import bisect_left
+from typing import Iterable
+
+import numpy as np
+
+INDEX_MAGIC = b"SNIPIDX\x00"
+INDEX_FORMAT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+
+_HEADER = struct.Struct("<8sII")
+
+
+def write_index_file(path: str, arrays: dict[str, np.ndarray], meta: dict) -> None:
+    """Write `arrays` and `meta` to `path`, replacing it atomically."""
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset += array.nbytes
+
+    # The data offsets are relative to the end of the header, whose size
+    # is only known once the layout is serialized.
+    meta_bytes = json.dumps({**meta, "arrays": layout}).encode("utf-8")
+    data_start = _align(_HEADER.size + len(meta_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, len(meta_bytes)))
+        f.write(meta_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_index_file(path: str) -> tuple[dict[str, np.ndarray], dict]:
+    """Open an index file, returning read-only memmapped arrays and its meta."""
+    with open(path, "rb") as f:
+        magic, version, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a keyword index file")
+        if version != INDEX_FORMAT_VERSION:
+            raise ValueError(
+                f"unsupported index format version {version} in {path}, "
+                f"expected {INDEX_FORMAT_VERSION}; rebuild the index"
+            )
+        meta = json.loads(f.read(meta_length).decode("utf-8"))
+
+    data_start = _align(_HEADER.size + meta_length)
+    arrays = {}
+    for name, spec in meta.pop("arrays").items():
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=dtype)
+            continue
+        arrays[name] = np.memmap(
+            path, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape
+        )
+    return arrays, meta
+
+
+def _align(offset: int) -> int:
+    return (offset + ARRAY_ALIGNMENT - 1) // ARRAY_ALIGNMENT * ARRAY_ALIGNMENT
+
+
+def encode_strings(strings: Iterable[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Pack strings into a UTF-8 blob and an offsets array of length n + 1."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.array([len(b) for b in encoded], dtype=np.int64), out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+class TermDictionary:
+    """
+    Sorted term dictionary over a UTF-8 blob, searched with binary search.
+
+    Terms are sorted by their UTF-8 bytes, which is also code point order,
+    so a term's id is its position in sorted order.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+        self._ids: dict[str, int] = {}
+
+    @classmethod
+    def from_terms(cls, sorted_terms: list[str]) -> "TermDictionary":
+        blob, offsets = encode_strings(sorted_terms)
+        dictionary = cls(blob, offsets)
+        dictionary._ids = {term: i for i, term in enumerate(sorted_terms)}
+        return dictionary
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, term_id: int) -> str:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for term_id in range(len(self)):
+            yield self[term_id]
+
+    def get(self, term: str) -> int:
+        """Return the id of `term`, or -1 if it is not in the dictionary."""
+        term_id = self._ids.get(term)
+        if term_id is not None:
+            return term_id
+        term_id = bisect_left(_TermKeys(self), term.encode("utf-8"))
+        if term_id < len(self) and self[term_id] == term:
+            self._ids[term] = term_id
+            return term_id
+        return -1
+
+    def prefix_range(self, prefix: str) -> tuple[int, int]:
+        """Return the [start, end) id range of the terms starting with `prefix`."""
+        keys = _TermKeys(self)
+        encoded = prefix.encode("utf-8")
+        start = bisect_left(keys, encoded)
+        # 0xff never occurs in UTF-8, so it sorts after every continuation.
+        return start, bisect_left(keys, encoded + b"\xff", lo=start)
+
+
+class _TermKeys:
+    """Sequence view of the encoded terms, for bisect."""
+
+    def __init__(self, dictionary: TermDictionary) -> None:
+        # Plain ndarray views: slicing a memmap is several times slower.
+        self.blob = np.asarray(dictionary.blob)
+        self.offsets = np.asarray(dictionary.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, term_id: int) -> bytes:
+        return self.blob[self.offsets[term_id] : self.offsets[term_id + 1]].tobytes()
+
+
+class DocumentStore:
+    """Movie dicts stored as JSON in a UTF-8 blob, decoded on access."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray) -> None:
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "DocumentStore":
+        return cls(*encode_strings(json.dumps(doc) for doc in documents))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, doc_idx: int) -> dict:
+        start, end = self.offsets[doc_idx], self.offsets[doc_idx + 1]
+        return json.loads(self.blob[start:end].tobytes())
@@ -1,143 +1,842 @@
+import json
 import math
 import os
 import pickle
-import string
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import batched
+from typing import Iterable, Optional, Sequence
 
-from nltk.stem import PorterStemmer
+import numpy as np
 
+from .analyzer import Analyzer, get_analyzer
+from .autocomplete import PrefixIndex
+from .boolean_query import evaluate, is_boolean_query, parse_boolean_query
+from .index_format import (
+    DocumentStore,
+    TermDictionary,
+    read_index_file,
+    write_index_file,
+)
 from .search_utils import (
     BM25_B,
     BM25_K1,
+    BM25F_DESCRIPTION_WEIGHT,
+    BM25F_TITLE_WEIGHT,
+    BM25_BATCH_CELLS,
+    BUILD_QUEUE_DEPTH,
     CACHE_DIR,
+    DEFAULT_BM25_ENGINE,
+    DEFAULT_BUILD_WORKERS,
+    DEFAULT_POSTING_CODEC,
     DEFAULT_SEARCH_LIMIT,
+    INGEST_BATCH_SIZE,
+    PROXIMITY_CANDIDATE_MULTIPLIER,
+    TOP_K_BLOCK_SIZE,
     format_search_result,
-    load_movies,
-    load_stopwords,
+    iter_movies,
+)
+from .posting_codec import (
+    POSTING_CODECS,
+    CompressedPostingList,
+    CompressedPostings,
+    encode_postings,
 )
+from .proximity import parse_phrases, phrase_doc_idxs, proximity_scores
+from .query_cache import QUERY_CACHE, QueryCache
+from .query_engine import BM25_ENGINES, PostingList
 
 
 class InvertedIndex:
-    def __init__(self) -> None:
-        self.index = defaultdict(set)
-        self.docmap: dict[int, dict] = {}
-        self.index_path = os.path.join(CACHE_DIR, "index.pkl")
-        self.docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
-        self.tf_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
-        self.doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
-        self.term_frequencies = defaultdict(Counter)
-        self.doc_lengths = {}
-
-    def build(self) -> None:
-        movies = load_movies()
-        for m in movies:
-            doc_id = m["id"]
-            doc_description = f"{m['title']} {m['description']}"
-            self.docmap[doc_id] = m
-            self.__add_document(doc_id, doc_description)
-
-    def save(self) -> None:
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(self.index_path, "wb") as f:
-            pickle.dump(self.index, f)
-        with open(self.docmap_path, "wb") as f:
-            pickle.dump(self.docmap, f)
-        with open(self.tf_path, "wb") as f:
-            pickle.dump(self.term_frequencies, f)
-        with open(self.doc_lengths_path, "wb") as f:
-            pickle.dump(self.doc_lengths, f)
+    """
+    BM25 keyword index stored column-wise.
+
+    Documents get a dense index (doc_idx) in build order. Terms live in a
+    sorted dictionary, and each term id owns a slice of the CSR-style posting
+    arrays, `posting_doc_idxs` and `posting_tfs`, delimited by
+    `posting_offsets`. Per-document data (movie id, length, BM25 length norm)
+    are arrays indexed by doc_idx.
+
+    Every posting also records how many of its occurrences are in the
+    title (`posting_title_tfs`), and `title_lengths` holds each document's
+    title length, so title and description can be scored as separate BM25F
+    fields; the description counts are the remainders.
+
+    Indexes built with positions also keep the word positions of every
+    posting in `positions`, in posting order; a term's positions start at
+    `term_position_offsets[term_id]`.
+    """
+
+    def __init__(self, analyzer: Optional[Analyzer] = None) -> None:
+        self.analyzer = analyzer or get_analyzer()
+        self.index_path = os.path.join(CACHE_DIR, "keyword_index.bin")
+        self.legacy_index_path = os.path.join(CACHE_DIR, "index.pkl")
+        self.legacy_docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
+        self.legacy_tf_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
+        self.legacy_doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
+        self.terms = TermDictionary.from_terms([])
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        self.posting_doc_idxs = np.empty(0, dtype=np.int32)
+        self.posting_tfs = np.empty(0, dtype=np.int32)
+        self.compressed_postings: Optional[CompressedPostings] = None
+        self.posting_title_tfs: Optional[np.ndarray] = None
+        self.title_lengths: Optional[np.ndarray] = None
+        self.positions: Optional[np.ndarray] = None
+        self.term_position_offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int64)
+        self.doc_lengths = np.empty(0, dtype=np.int32)
+        self.documents = DocumentStore.from_documents([])
+        self.idf = np.empty(0, dtype=np.float64)
+        self.avg_doc_length = 0.0
+        self.length_norms = np.empty(0, dtype=np.float64)
+        self.bm25_postings: dict[str, PostingList] = {}
+        self.bm25f_postings: dict[tuple[str, float, float], PostingList] = {}
+        self.bm25_weights: Optional[np.ndarray] = None
+        self.field_length_norms: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self.doc_idx_by_id: Optional[dict[int, int]] = None
+
+    def build(
+        self,
+        movies: Optional[Iterable[dict]] = None,
+        workers: int = DEFAULT_BUILD_WORKERS,
+        batch_size: int = INGEST_BATCH_SIZE,
+        positions: bool = False,
+    ) -> None:
+        """
+        Index `movies`, streamed from the catalog file by default.
+
+        Movies are analyzed `batch_size` at a time into compact postings, so
+        only one batch per worker is held as Python objects. With `workers`
+        other than 1, batches are analyzed in a process pool; 0 means one
+        worker per CPU. `positions` also records word positions, needed for
+        phrase queries and proximity scoring.
+        """
+        if movies is None:
+            movies = iter_movies()
+        batches = batched(movies, batch_size)
+        if workers == 1:
+            shards = [ShardPostings(batch, self.analyzer, positions) for batch in batches]
+        else:
+            shards = self.__analyze_parallel(
+                batches, workers or os.cpu_count() or 1, positions
+            )
+        self.__merge_shards(shards)
+        self.compute_bm25_stats()
+
+    def __analyze_parallel(
+        self, batches: Iterable[tuple[dict, ...]], workers: int, positions: bool
+    ) -> list["ShardPostings"]:
+        # Batches are contiguous and results are collected in submission
+        # order, so every movie keeps the doc_idx of a serial build. Only a
+        # few batches per worker are in flight at once.
+        shards = []
+        pending = deque()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_build_worker,
+            initargs=(self.analyzer.stopwords,),
+        ) as executor:
+            for batch in batches:
+                pending.append(executor.submit(_analyze_shard, batch, positions))
+                if len(pending) >= workers * BUILD_QUEUE_DEPTH:
+                    shards.append(pending.popleft().result())
+            shards.extend(future.result() for future in pending)
+        return shards
+
+    def __merge_shards(self, shards: list["ShardPostings"]) -> None:
+        sorted_terms = sorted(set().union(*(shard.terms for shard in shards)))
+        term_ids = {term: term_id for term_id, term in enumerate(sorted_terms)}
+
+        posting_term_ids = []
+        doc_base = 0
+        blob_base = 0
+        document_offsets = [np.zeros(1, dtype=np.int64)]
+        for shard in shards:
+            shard_term_ids = np.array(
+                [term_ids[term] for term in shard.terms], dtype=np.int64
+            )
+            posting_term_ids.append(np.repeat(shard_term_ids, shard.doc_freqs))
+            shard.doc_idxs += doc_base
+            document_offsets.append(shard.document_offsets[1:] + blob_base)
+            doc_base += len(shard.doc_ids)
+            blob_base += len(shard.document_blob)
+
+        # Shards are in doc_idx order, so a stable sort by term id leaves
+        # every posting list sorted by doc_idx.
+        posting_term_ids = np.concatenate([np.empty(0, dtype=np.int64)] + posting_term_ids)
+        order = np.argsort(posting_term_ids, kind="stable")
+        self.terms = TermDictionary.from_terms(sorted_terms)
+        self.posting_offsets = np.zeros(len(sorted_terms) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(posting_term_ids, minlength=len(sorted_terms)),
+            out=self.posting_offsets[1:],
+        )
+        shard_tfs = _concatenate([shard.tfs for shard in shards], np.int32)
+        self.posting_doc_idxs = _concatenate(
+            [shard.doc_idxs for shard in shards], np.int32
+        )[order]
+        self.posting_tfs = shard_tfs[order]
+        self.compressed_postings = None
+        self.posting_title_tfs = _smallest_uint(
+            _concatenate([shard.title_tfs for shard in shards], np.int32)[order]
+        )
+        self.title_lengths = _concatenate(
+            [shard.title_lengths for shard in shards], np.int32
+        )
+        if shards and shards[0].positions is not None:
+            # Every posting owns tf positions; move them along with it.
+            position_starts = np.zeros(len(shard_tfs), dtype=np.int64)
+            np.cumsum(shard_tfs[:-1], out=position_starts[1:])
+            positions = _concatenate([shard.positions for shard in shards], np.uint32)[
+                _ranges(position_starts[order], self.posting_tfs)
+            ]
+            self.set_positions(positions)
+        else:
+            self.positions = None
+        self.doc_ids = _concatenate([shard.doc_ids for shard in shards], np.int64)
+        self.doc_lengths = _concatenate([shard.doc_lengths for shard in shards], np.int32)
+        self.documents = DocumentStore(
+            _concatenate([shard.document_blob for shard in shards], np.uint8),
+            np.concatenate(document_offsets),
+        )
+
+    def set_positions(self, positions: np.ndarray) -> None:
+        """Attach posting-ordered positions, stored in the smallest dtype."""
+        self.positions = _smallest_uint(positions)
+        position_ends = np.zeros(len(self.posting_tfs) + 1, dtype=np.int64)
+        np.cumsum(self.posting_tfs, out=position_ends[1:])
+        self.term_position_offsets = position_ends[self.posting_offsets]
+
+    def __set_postings(
+        self,
+        doc_postings: dict[str, list[int]],
+        term_frequencies: dict[str, list[int]],
+    ) -> None:
+        sorted_terms = sorted(doc_postings)
+        self.terms = TermDictionary.from_terms(sorted_terms)
+        doc_freqs = np.array(
+            [len(doc_postings[term]) for term in sorted_terms], dtype=np.int64
+        )
+        self.posting_offsets = np.zeros(len(sorted_terms) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=self.posting_offsets[1:])
+        self.posting_doc_idxs = np.fromiter(
+            (doc_idx for term in sorted_terms for doc_idx in doc_postings[term]),
+            dtype=np.int32,
+            count=int(self.posting_offsets[-1]),
+        )
+        self.posting_tfs = np.fromiter(
+            (tf for term in sorted_terms for tf in term_frequencies[term]),
+            dtype=np.int32,
+            count=int(self.posting_offsets[-1]),
+        )
+        self.compressed_postings = None
+        self.posting_title_tfs = None
+        self.title_lengths = None
+        self.positions = None
+
+    def get_posting_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the full CSR doc idx and tf arrays, decoding them if compressed."""
+        if self.compressed_postings is None:
+            return self.posting_doc_idxs, self.posting_tfs
+        decoded = [
+            self.compressed_postings.decode_term(term_id)
+            for term_id in range(len(self.terms))
+        ]
+        return (
+            np.concatenate(
+                [np.empty(0, dtype=np.int32)] + [doc_idxs for doc_idxs, _ in decoded]
+            ),
+            np.concatenate([np.empty(0, dtype=np.int32)] + [tfs for _, tfs in decoded]),
+        )
+
+    def __decompress_postings(self) -> None:
+        self.posting_doc_idxs, self.posting_tfs = self.get_posting_arrays()
+        self.compressed_postings = None
+
+    def save(self, posting_codec: str = DEFAULT_POSTING_CODEC) -> None:
+        if posting_codec not in POSTING_CODECS:
+            raise ValueError(f"unknown posting codec: {posting_codec}")
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        self.__decompress_postings()
+        if posting_codec == "bitpack":
+            posting_idfs = np.repeat(self.idf, np.diff(self.posting_offsets))
+            scores = (
+                bm25_tf(self.posting_tfs, self.length_norms[self.posting_doc_idxs])
+                * posting_idfs
+            )
+            posting_arrays = encode_postings(
+                self.posting_offsets, self.posting_doc_idxs, self.posting_tfs, scores
+            )
+        else:
+            posting_arrays = {
+                "posting_doc_idxs": self.posting_doc_idxs,
+                "posting_tfs": self.posting_tfs,
+            }
+        arrays = {
+            "term_blob": self.terms.blob,
+            "term_offsets": self.terms.offsets,
+            "posting_offsets": self.posting_offsets,
+            **posting_arrays,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths,
+            "document_blob": self.documents.blob,
+            "document_offsets": self.documents.offsets,
+            "idf": self.idf,
+            "length_norms": self.length_norms,
+        }
+        if self.posting_title_tfs is not None:
+            arrays["posting_title_tfs"] = self.posting_title_tfs
+            arrays["title_lengths"] = self.title_lengths
+        if self.positions is not None:
+            arrays["term_position_offsets"] = self.term_position_offsets
+            arrays["positions"] = self.positions
+        meta = {
+            "avg_doc_length": self.avg_doc_length,
+            "b": BM25_B,
+            "k1": BM25_K1,
+            "posting_codec": posting_codec,
+        }
+        write_index_file(self.index_path, arrays, meta)
 
     def load(self) -> None:
-        with open(self.index_path, "rb") as f:
-            self.index = pickle.load(f)
-        with open(self.docmap_path, "rb") as f:
-            self.docmap = pickle.load(f)
-        with open(self.tf_path, "rb") as f:
-            self.term_frequencies = pickle.load(f)
-        with open(self.doc_lengths_path, "rb") as f:
-            self.doc_lengths = pickle.load(f)
+        if not os.path.exists(self.index_path) and os.path.exists(
+            self.legacy_index_path
+        ):
+            self.load_legacy()
+            return
+
+        arrays, meta = read_index_file(self.index_path)
+        self.terms = TermDictionary(arrays["term_blob"], arrays["term_offsets"])
+        self.posting_offsets = arrays["posting_offsets"]
+        if meta["posting_codec"] == "bitpack":
+            self.posting_doc_idxs = np.empty(0, dtype=np.int32)
+            self.posting_tfs = np.empty(0, dtype=np.int32)
+            self.compressed_postings = CompressedPostings(arrays, self.posting_offsets)
+        else:
+            self.posting_doc_idxs = arrays["posting_doc_idxs"]
+            self.posting_tfs = arrays["posting_tfs"]
+            self.compressed_postings = None
+        self.posting_title_tfs = arrays.get("posting_title_tfs")
+        self.title_lengths = arrays.get("title_lengths")
+        self.positions = arrays.get("positions")
+        if self.positions is not None:
+            self.term_position_offsets = arrays["term_position_offsets"]
+        self.doc_ids = arrays["doc_ids"]
+        self.doc_lengths = arrays["doc_lengths"]
+        self.documents = DocumentStore(
+            arrays["document_blob"], arrays["document_offsets"]
+        )
+        self.idf = arrays["idf"]
+        self.avg_doc_length = meta["avg_doc_length"]
+        self.length_norms = arrays["length_norms"]
+        # Stored block maxima were computed for the saved k1 and b; files
+        # from before k1 was recorded may have used any k1.
+        if meta["b"] != BM25_B or meta.get("k1") != BM25_K1:
+            self.__decompress_postings()
+        if meta["b"] != BM25_B:
+            self.length_norms = self.get_length_norms(BM25_B)
+        self.__reset_query_state()
+
+    def load_legacy(self) -> None:
+        """Load an index saved as the four pickles used before keyword_index.bin."""
+        with open(self.legacy_index_path, "rb") as f:
+            index = pickle.load(f)
+        with open(self.legacy_docmap_path, "rb") as f:
+            docmap = pickle.load(f)
+        with open(self.legacy_tf_path, "rb") as f:
+            term_frequencies = pickle.load(f)
+        with open(self.legacy_doc_lengths_path, "rb") as f:
+            doc_lengths = pickle.load(f)
+
+        doc_ids = list(docmap)
+        doc_idx_by_id = {doc_id: doc_idx for doc_idx, doc_id in enumerate(doc_ids)}
+        doc_postings = {}
+        term_tfs = {}
+        for term, term_doc_ids in index.items():
+            if not term_doc_ids:
+                continue
+            doc_idxs = sorted(doc_idx_by_id[doc_id] for doc_id in term_doc_ids)
+            doc_postings[term] = doc_idxs
+            term_tfs[term] = [
+                term_frequencies[doc_ids[doc_idx]][term] for doc_idx in doc_idxs
+            ]
+
+        self.__set_postings(doc_postings, term_tfs)
+        self.doc_ids = np.array(doc_ids, dtype=np.int64)
+        self.doc_lengths = np.array(
+            [doc_lengths.get(doc_id, 0) for doc_id in doc_ids], dtype=np.int32
+        )
+        self.documents = DocumentStore.from_documents(docmap.values())
+        self.compute_bm25_stats()
+
+    def __reset_query_state(self) -> None:
+        self.bm25_postings = {}
+        self.bm25f_postings = {}
+        self.bm25_weights = None
+        self.field_length_norms = None
+        self.doc_idx_by_id = None
+
+    def compute_bm25_stats(
+        self,
+        doc_count: Optional[int] = None,
+        avg_doc_length: Optional[float] = None,
+        doc_freqs: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Precompute BM25 IDF per term, the average document length and each
+        document's length normalization for the default b.
+
+        The collection statistics default to this index's own. A shard of a
+        larger collection passes the collection's document count, average
+        document length and per-term document frequencies instead, so its
+        scores equal those of one index over the whole collection.
+        """
+        if doc_count is None:
+            doc_count = len(self.doc_ids)
+        if doc_freqs is None:
+            doc_freqs = np.diff(self.posting_offsets)
+        self.idf = np.array(
+            [bm25_idf(doc_count, int(df)) for df in doc_freqs], dtype=np.float64
+        )
+        if avg_doc_length is not None:
+            self.avg_doc_length = avg_doc_length
+        elif doc_count > 0:
+            self.avg_doc_length = int(self.doc_lengths.sum()) / doc_count
+        else:
+            self.avg_doc_length = 0.0
+        self.length_norms = np.empty(0, dtype=np.float64)
+        self.length_norms = self.get_length_norms(BM25_B)
+        self.__reset_query_state()
+
+    def get_length_norms(self, b: float = BM25_B) -> np.ndarray:
+        """Return per-document length normalization, indexed by doc_idx, for `b`."""
+        if b == BM25_B and len(self.length_norms) == len(self.doc_ids):
+            return self.length_norms
+        return bm25_length_norm(self.doc_lengths, self.avg_doc_length, b)
+
+    def get_field_length_norms(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the title and description BM25 length norms, by doc_idx."""
+        if self.title_lengths is None:
+            raise ValueError("index has no per-field data; rebuild it")
+        if self.field_length_norms is None:
+            doc_count = len(self.doc_ids)
+            title_lengths = self.title_lengths.astype(np.int64)
+            description_lengths = self.doc_lengths - title_lengths
+            self.field_length_norms = tuple(
+                bm25_length_norm(
+                    lengths,
+                    int(lengths.sum()) / doc_count if doc_count > 0 else 0.0,
+                )
+                for lengths in (title_lengths, description_lengths)
+            )
+        return self.field_length_norms
+
+    def get_field_postings(
+        self, token: str
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the doc indexes and title and description tfs of a token."""
+        if self.posting_title_tfs is None:
+            raise ValueError("index has no per-field data; rebuild it")
+        doc_idxs, tfs = self.get_postings(token)
+        term_id = self.terms.get(token)
+        if term_id < 0:
+            return doc_idxs, tfs, tfs
+        start = self.posting_offsets[term_id]
+        end = self.posting_offsets[term_id + 1]
+        title_tfs = self.posting_title_tfs[start:end].astype(np.int32)
+        return doc_idxs, title_tfs, tfs - title_tfs
+
+    def get_postings(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the doc indexes and term frequencies of an analyzed token."""
+        term_id = self.terms.get(token)
+        if term_id < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        if self.compressed_postings is not None:
+            return self.compressed_postings.decode_term(term_id)
+        start = self.posting_offsets[term_id]
+        end = self.posting_offsets[term_id + 1]
+        return self.posting_doc_idxs[start:end], self.posting_tfs[start:end]
+
+    def get_doc_freq(self, token: str) -> int:
+        term_id = self.terms.get(token)
+        if term_id < 0:
+            return 0
+        return int(self.posting_offsets[term_id + 1] - self.posting_offsets[term_id])
+
+    def contains(self, token: str, doc_idxs: np.ndarray) -> np.ndarray:
+        """
+        Return a mask of the sorted `doc_idxs` that contain `token`.
+
+        Postings are probed by binary search, and compressed postings only
+        decode the blocks their skip data points at, so the cost grows with
+        the number of probes rather than with the posting list length.
+        """
+        mask = np.zeros(len(doc_idxs), dtype=bool)
+        term_id = self.terms.get(token)
+        if term_id < 0 or len(doc_idxs) == 0:
+            return mask
+        if self.compressed_postings is None:
+            start = self.posting_offsets[term_id]
+            end = self.posting_offsets[term_id + 1]
+            postings = self.posting_doc_idxs[start:end]
+            found = np.searchsorted(postings, doc_idxs)
+            inside = found < len(postings)
+            mask[inside] = postings[found[inside]] == doc_idxs[inside]
+            return mask
+
+        first_block, end_block = self.compressed_postings.term_blocks(term_id)
+        block_last_doc_idxs = self.compressed_postings.block_last_doc_idxs[
+            first_block:end_block
+        ]
+        blocks = np.searchsorted(block_last_doc_idxs, doc_idxs)
+        inside = np.flatnonzero(blocks < len(block_last_doc_idxs))
+        # doc_idxs are sorted, so probes of the same block are contiguous.
+        for probes in np.split(inside, np.flatnonzero(np.diff(blocks[inside])) + 1):
+            if len(probes) == 0:
+                continue
+            block_doc_idxs, _ = self.compressed_postings.decode_block(
+                term_id, first_block + int(blocks[probes[0]])
+            )
+            mask[probes] = np.isin(doc_idxs[probes], block_doc_idxs, assume_unique=True)
+        return mask
+
+    def boolean_search(self, query: str) -> np.ndarray:
+        """Return the sorted doc idxs matching a boolean query."""
+        return evaluate(parse_boolean_query(query, self.analyzer), self)
+
+    def get_positions(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the doc idx and word position of every occurrence of an
+        analyzed token.
+        """
+        if self.positions is None:
+            raise ValueError("index was built without positions; rebuild it with positions")
+        term_id = self.terms.get(token)
+        if term_id < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=self.positions.dtype)
+        doc_idxs, tfs = self.get_postings(token)
+        start = self.term_position_offsets[term_id]
+        end = self.term_position_offsets[term_id + 1]
+        return np.repeat(doc_idxs, tfs), self.positions[start:end]
+
+    def phrase_doc_idxs(self, phrase: str) -> Optional[np.ndarray]:
+        """
+        Return the sorted doc idxs containing `phrase`, or None when the
+        phrase has no indexed words and so does not restrict anything.
+        """
+        token_positions = self.analyzer.tokenize_with_positions(phrase)
+        if not token_positions:
+            return None
+        first_position = token_positions[0][1]
+        return phrase_doc_idxs(
+            [
+                (position - first_position, *self.get_positions(token))
+                for token, position in token_positions
+            ]
+        )
+
+    def proximity_scores(
+        self, query_tokens: list[str], doc_idxs: np.ndarray
+    ) -> np.ndarray:
+        """Proximity score of `doc_idxs` for the distinct query tokens."""
+        term_positions = []
+        for token in dict.fromkeys(query_tokens):
+            term_id = self.terms.get(token)
+            if term_id >= 0:
+                term_positions.append((self.idf[term_id], *self.get_positions(token)))
+        return proximity_scores(doc_idxs, term_positions, self.length_norms[doc_idxs])
+
+    def query_proximity_scores(self, query: str, doc_idxs: np.ndarray) -> np.ndarray:
+        """Proximity score of `doc_idxs` for `query`, as `bm25_rank` adds it."""
+        if self.positions is None:
+            raise ValueError("proximity scoring needs an index built with positions")
+        query, _ = parse_phrases(query)
+        return self.proximity_scores(self.analyzer.tokenize(query), doc_idxs)
 
     def get_documents(self, term: str) -> list[int]:
-        doc_ids = self.index.get(term, set())
-        return sorted(list(doc_ids))
+        doc_idxs, _ = self.get_postings(term)
+        return self.doc_ids[doc_idxs].tolist()
 
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokens = tokenize_text(text)
-        for token in set(tokens):
-            self.index[token].add(doc_id)
-        self.term_frequencies[doc_id].update(tokens)
-        self.doc_lengths[doc_id] = len(tokens)
+    def get_doc_idx(self, doc_id: int) -> int:
+        """Return the index position of a movie id, or -1 if it is not indexed."""
+        if self.doc_idx_by_id is None:
+            self.doc_idx_by_id = {
+                doc_id: doc_idx for doc_idx, doc_id in enumerate(self.doc_ids.tolist())
+            }
+        return self.doc_idx_by_id.get(doc_id, -1)
 
     def get_tf(self, doc_id: int, term: str) -> int:
-        tokens = tokenize_text(term)
+        tokens = self.analyzer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        return self.term_frequencies[doc_id][token]
+        doc_idx = self.get_doc_idx(doc_id)
+        doc_idxs, tfs = self.get_postings(token)
+        pos = int(np.searchsorted(doc_idxs, doc_idx))
+        if doc_idx < 0 or pos >= len(doc_idxs) or doc_idxs[pos] != doc_idx:
+            return 0
+        return int(tfs[pos])
 
     def get_idf(self, term: str) -> float:
-        tokens = tokenize_text(term)
+        tokens = self.analyzer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
+        doc_count = len(self.doc_ids)
+        term_doc_count = len(self.get_postings(token)[0])
         return math.log((doc_count + 1) / (term_doc_count + 1))
 
     def get_bm25_idf(self, term: str) -> float:
-        tokens = tokenize_text(term)
+        tokens = self.analyzer.tokenize(term)
         if len(tokens) != 1:
             raise ValueError("term must be a single token")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
-        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+        term_id = self.terms.get(token)
+        if term_id >= 0:
+            return float(self.idf[term_id])
+        return bm25_idf(len(self.doc_ids), 0)
 
     def get_bm25_tf(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
     ) -> float:
         tf = self.get_tf(doc_id, term)
-        doc_length = self.doc_lengths.get(doc_id, 0)
-        avg_doc_length = self.__get_avg_doc_length()
-        if avg_doc_length > 0:
-            length_norm = 1 - b + b * (doc_length / avg_doc_length)
+        doc_idx = self.get_doc_idx(doc_id)
+        if doc_idx >= 0 and b == BM25_B:
+            length_norm = float(self.length_norms[doc_idx])
         else:
-            length_norm = 1
-        return (tf * (k1 + 1)) / (tf + k1 * length_norm)
+            doc_length = int(self.doc_lengths[doc_idx]) if doc_idx >= 0 else 0
+            length_norm = bm25_length_norm(doc_length, self.avg_doc_length, b)
+        return bm25_tf(tf, length_norm, k1)
 
     def get_tf_idf(self, doc_id: int, term: str) -> float:
         tf = self.get_tf(doc_id, term)
         idf = self.get_idf(term)
         return tf * idf
 
-    def __get_avg_doc_length(self) -> float:
-        if not self.doc_lengths or len(self.doc_lengths) == 0:
-            return 0.0
-        total_length = 0
-        for length in self.doc_lengths.values():
-            total_length += length
-        return total_length / len(self.doc_lengths)
-
     def bm25(self, doc_id: int, term: str) -> float:
         tf_component = self.get_bm25_tf(doc_id, term)
         idf_component = self.get_bm25_idf(term)
         return tf_component * idf_component
 
-    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        query_tokens = tokenize_text(query)
+    def get_bm25_postings(self, token: str) -> PostingList:
+        """
+        Return the doc indexes and per-document BM25 scores of an analyzed
+        token.
+
+        The contributions are computed once per token and reused by every
+        later query against this index.
+        """
+        postings = self.bm25_postings.get(token)
+        if postings is not None:
+            return postings
+
+        term_id = self.terms.get(token)
+        idf = self.idf[term_id] if term_id >= 0 else 0.0
+        if self.compressed_postings is not None and term_id >= 0:
+            postings = CompressedPostingList(
+                self.compressed_postings,
+                term_id,
+                lambda doc_idxs, tfs: bm25_tf(tfs, self.length_norms[doc_idxs]) * idf,
+            )
+        else:
+            postings = self.__score_postings(token, *self.get_postings(token))
+        self.bm25_postings[token] = postings
+        return postings
+
+    def __score_postings(
+        self, token: str, doc_idxs: np.ndarray, tfs: np.ndarray
+    ) -> PostingList:
+        term_id = self.terms.get(token)
+        idf = self.idf[term_id] if term_id >= 0 else 0.0
+        scores = bm25_tf(tfs, self.length_norms[doc_idxs]) * idf
+        return PostingList(doc_idxs.tolist(), scores.tolist())
+
+    def get_bm25f_postings(
+        self,
+        token: str,
+        title_weight: float = BM25F_TITLE_WEIGHT,
+        description_weight: float = BM25F_DESCRIPTION_WEIGHT,
+    ) -> PostingList:
+        """Return the doc indexes and BM25F scores of an analyzed token."""
+        key = (token, title_weight, description_weight)
+        postings = self.bm25f_postings.get(key)
+        if postings is not None:
+            return postings
+
+        term_id = self.terms.get(token)
+        idf = self.idf[term_id] if term_id >= 0 else 0.0
+        doc_idxs, title_tfs, description_tfs = self.get_field_postings(token)
+        title_norms, description_norms = self.get_field_length_norms()
+        field_tf = (
+            title_weight * title_tfs / title_norms[doc_idxs]
+            + description_weight * description_tfs / description_norms[doc_idxs]
+        )
+        scores = bm25f_tf(field_tf) * idf
+        postings = PostingList(doc_idxs.tolist(), scores.tolist())
+        self.bm25f_postings[key] = postings
+        return postings
+
+    def get_bm25_weights(self) -> np.ndarray:
+        """
+        Return the BM25 contribution of every posting, aligned with the
+        posting arrays: the doc-term weight matrix in CSR form.
+        """
+        if self.bm25_weights is None:
+            doc_idxs, tfs = self.get_posting_arrays()
+            posting_idfs = np.repeat(self.idf, np.diff(self.posting_offsets))
+            self.bm25_weights = bm25_tf(tfs, self.length_norms[doc_idxs]) * posting_idfs
+        return self.bm25_weights
 
-        scores = {}
-        for doc_id in self.docmap:
-            score = 0.0
+    def bm25_search_many(
+        self, queries: list[str], limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[list[dict]]:
+        """
+        Rank documents by BM25 for a batch of queries at once.
+
+        Each chunk of queries is a sparse query-term matrix multiplied by the
+        CSR doc-term weight matrix with one `np.bincount`, giving a dense
+        block of query x document scores that is cut to the top `limit` per
+        row. Chunks hold at most BM25_BATCH_CELLS scores. Results equal
+        `bm25_search` for each query, including the zero-score padding.
+        """
+        doc_count = len(self.doc_ids)
+        doc_idxs, _ = self.get_posting_arrays()
+        weights = self.get_bm25_weights()
+        chunk_size = max(1, BM25_BATCH_CELLS // max(doc_count, 1))
+
+        results = []
+        for chunk_start in range(0, len(queries), chunk_size):
+            chunk = queries[chunk_start : chunk_start + chunk_size]
+            cells = [np.empty(0, dtype=np.int64)]
+            cell_weights = [np.empty(0, dtype=np.float64)]
+            for row, query in enumerate(chunk):
+                # Cells of one query stay in token order, so every score is
+                # summed in the same order as term-at-a-time scoring.
+                for token in self.analyzer.tokenize(query):
+                    term_id = self.terms.get(token)
+                    if term_id < 0:
+                        continue
+                    start = self.posting_offsets[term_id]
+                    end = self.posting_offsets[term_id + 1]
+                    cells.append(row * doc_count + doc_idxs[start:end].astype(np.int64))
+                    cell_weights.append(weights[start:end])
+            scores = np.bincount(
+                np.concatenate(cells),
+                weights=np.concatenate(cell_weights),
+                minlength=len(chunk) * doc_count,
+            ).reshape(len(chunk), doc_count)
+            for ranked in top_k_rows(scores, limit):
+                results.append(self.__format_ranked(ranked))
+        return results
+
+    def bm25f_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        title_weight: float = BM25F_TITLE_WEIGHT,
+        description_weight: float = BM25F_DESCRIPTION_WEIGHT,
+    ) -> list[dict]:
+        """
+        Rank documents by BM25F over the title and description fields.
+
+        Field term frequencies are length-normalized per field, weighted and
+        summed before the BM25 saturation, so a title hit outweighs the same
+        word in a long description without needing repetition.
+        """
+        if engine not in BM25_ENGINES:
+            raise ValueError(f"unknown BM25 engine: {engine}")
+        posting_lists = [
+            self.get_bm25f_postings(token, title_weight, description_weight)
+            for token in self.analyzer.tokenize(query)
+        ]
+        ranked = BM25_ENGINES[engine](posting_lists, limit)
+        return self.__format_ranked(ranked)
+
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        proximity_weight: float = 0.0,
+    ) -> list[dict]:
+        """
+        Rank documents by BM25.
+
+        On an index with positions, quoted phrases in `query` must appear
+        verbatim in every result, and a `proximity_weight` above zero adds
+        that multiple of the proximity score to the best BM25 candidates.
+        """
+        return self.__format_ranked(
+            self.bm25_rank(query, limit, engine, proximity_weight)
+        )
+
+    def bm25_rank(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        proximity_weight: float = 0.0,
+    ) -> list[tuple[int, float]]:
+        """`bm25_search` as (doc_idx, score) pairs, best first."""
+        if engine not in BM25_ENGINES:
+            raise ValueError(f"unknown BM25 engine: {engine}")
+        phrase_filter = None
+        if self.positions is not None:
+            query, phrases = parse_phrases(query)
+            for phrase in phrases:
+                matches = self.phrase_doc_idxs(phrase)
+                if matches is not None:
+                    phrase_filter = (
+                        matches
+                        if phrase_filter is None
+                        else np.intersect1d(phrase_filter, matches, assume_unique=True)
+                    )
+        elif proximity_weight > 0:
+            raise ValueError("proximity scoring needs an index built with positions")
+
+        query_tokens = self.analyzer.tokenize(query)
+        if phrase_filter is None:
+            posting_lists = [self.get_bm25_postings(token) for token in query_tokens]
+        else:
+            posting_lists = []
             for token in query_tokens:
-                score += self.bm25(doc_id, token)
-            scores[doc_id] = score
+                doc_idxs, tfs = self.get_postings(token)
+                keep = np.isin(doc_idxs, phrase_filter, assume_unique=True)
+                posting_lists.append(
+                    self.__score_postings(token, doc_idxs[keep], tfs[keep])
+                )
 
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        if proximity_weight > 0:
+            ranked = BM25_ENGINES[engine](
+                posting_lists, limit * PROXIMITY_CANDIDATE_MULTIPLIER
+            )
+            candidates = np.array([doc_idx for doc_idx, _ in ranked], dtype=np.int64)
+            proximity = self.proximity_scores(query_tokens, candidates)
+            rescored = [
+                (doc_idx, score + proximity_weight * float(bonus))
+                for (doc_idx, score), bonus in zip(ranked, proximity)
+            ]
+            rescored.sort(key=lambda item: (-item[1], item[0]))
+            ranked = rescored[:limit]
+        else:
+            ranked = BM25_ENGINES[engine](posting_lists, limit)
+
+        if len(ranked) < limit and phrase_filter is None:
+            # Documents without any query term score 0.0; callers that ask for
+            # deep result lists still get them, in index order.
+            matched = {doc_idx for doc_idx, _ in ranked}
+            for doc_idx in range(len(self.doc_ids)):
+                if len(ranked) >= limit:
+                    break
+                if doc_idx not in matched:
+                    ranked.append((doc_idx, 0.0))
+        return ranked
 
+    def __format_ranked(self, ranked: list[tuple[int, float]]) -> list[dict]:
         results = []
-        for doc_id, score in sorted_docs[:limit]:
-            doc = self.docmap[doc_id]
+        for doc_idx, score in ranked:
+            doc = self.documents[doc_idx]
             formatted_result = format_search_result(
                 doc_id=doc["id"],
                 title=doc["title"],
@@ -149,24 +848,186 @@ class InvertedIndex:
         return results
 
 
-def build_command() -> None:
+class ShardPostings:
+    """Postings of one build shard, with doc idxs local to the shard."""
+
+    def __init__(
+        self, movies: Sequence[dict], analyzer: Analyzer, positions: bool = False
+    ) -> None:
+        doc_postings = defaultdict(list)
+        term_frequencies = defaultdict(list)
+        term_positions = defaultdict(list)
+        term_title_frequencies = defaultdict(list)
+        doc_lengths = []
+        title_lengths = []
+        for doc_idx, m in enumerate(movies):
+            title_tokens = Counter(analyzer.tokenize(m["title"]))
+            title_lengths.append(title_tokens.total())
+            text = f"{m['title']} {m['description']}"
+            if positions:
+                token_positions = defaultdict(list)
+                for token, position in analyzer.tokenize_with_positions(text):
+                    token_positions[token].append(position)
+                for token, occurrences in token_positions.items():
+                    doc_postings[token].append(doc_idx)
+                    term_frequencies[token].append(len(occurrences))
+                    term_title_frequencies[token].append(title_tokens[token])
+                    term_positions[token].extend(occurrences)
+                doc_lengths.append(sum(map(len, token_positions.values())))
+                continue
+            tokens = analyzer.tokenize(text)
+            for token, tf in Counter(tokens).items():
+                doc_postings[token].append(doc_idx)
+                term_frequencies[token].append(tf)
+                term_title_frequencies[token].append(title_tokens[token])
+            doc_lengths.append(len(tokens))
+
+        self.terms = list(doc_postings)
+        self.doc_freqs = np.array(
+            [len(doc_postings[term]) for term in self.terms], dtype=np.int64
+        )
+        self.doc_idxs = _concatenate(doc_postings.values(), np.int32)
+        self.tfs = _concatenate(term_frequencies.values(), np.int32)
+        self.title_tfs = _concatenate(term_title_frequencies.values(), np.int32)
+        self.title_lengths = np.array(title_lengths, dtype=np.int32)
+        self.positions = (
+            _concatenate((term_positions[term] for term in self.terms), np.uint32)
+            if positions
+            else None
+        )
+        self.doc_ids = np.array([m["id"] for m in movies], dtype=np.int64)
+        self.doc_lengths = np.array(doc_lengths, dtype=np.int32)
+        documents = DocumentStore.from_documents(movies)
+        self.document_blob = documents.blob
+        self.document_offsets = documents.offsets
+
+
+_build_worker_analyzer: Optional[Analyzer] = None
+
+
+def _init_build_worker(stopwords: frozenset[str]) -> None:
+    global _build_worker_analyzer
+    _build_worker_analyzer = Analyzer(stopwords)
+
+
+def _analyze_shard(movies: Sequence[dict], positions: bool) -> ShardPostings:
+    return ShardPostings(movies, _build_worker_analyzer, positions)
+
+
+def _smallest_uint(values: np.ndarray) -> np.ndarray:
+    """Store small non-negative counts in the narrowest unsigned dtype."""
+    for dtype in (np.uint8, np.uint16):
+        if len(values) == 0 or values.max() <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint32)
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Indexes of the ranges [start, start + length), concatenated."""
+    ends = np.cumsum(lengths, dtype=np.int64)
+    return np.arange(ends[-1] if len(ends) else 0, dtype=np.int64) + np.repeat(
+        starts - (ends - lengths), lengths
+    )
+
+
+def _concatenate(arrays: Iterable, dtype) -> np.ndarray:
+    return np.concatenate(
+        [np.empty(0, dtype=dtype)] + [np.asarray(a, dtype=dtype) for a in arrays]
+    )
+
+
+def bm25_idf(doc_count: int, term_doc_count: int) -> float:
+    return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+
+
+def bm25_length_norm(doc_length, avg_doc_length: float, b: float = BM25_B):
+    """Length normalization of one document length or of an array of them."""
+    if avg_doc_length > 0:
+        return 1 - b + b * (doc_length / avg_doc_length)
+    if isinstance(doc_length, np.ndarray):
+        return np.ones(doc_length.shape, dtype=np.float64)
+    return 1.0
+
+
+def bm25_tf(tf, length_norm, k1: float = BM25_K1):
+    """BM25 saturated term frequency; works on scalars and numpy arrays."""
+    return (tf * (k1 + 1)) / (tf + k1 * length_norm)
+
+
+def top_k_rows(scores: np.ndarray, limit: int) -> list[list[tuple[int, float]]]:
+    """
+    Return the `limit` best (column, score) pairs of every row of a dense
+    score matrix, ties broken by the lower column.
+    """
+    rows, cols = scores.shape
+    k = min(limit, cols)
+    if k <= 0:
+        return [[] for _ in range(rows)]
+    # Bound each row's k-th best score from below by its k-th best block
+    # maximum (the k best blocks hold k scores at least that high), so only
+    # the few columns above the bound need an exact sort.
+    block_count = cols // TOP_K_BLOCK_SIZE
+    if block_count >= k:
+        block_maxima = (
+            scores[:, : block_count * TOP_K_BLOCK_SIZE]
+            .reshape(rows, block_count, TOP_K_BLOCK_SIZE)
+            .max(axis=2)
+        )
+        thresholds = np.partition(block_maxima, block_count - k, axis=1)[:, block_count - k]
+    else:
+        thresholds = np.partition(scores, cols - k, axis=1)[:, cols - k]
+    candidate_rows, candidates = np.nonzero(scores >= thresholds[:, None])
+    row_candidates = np.split(candidates, np.searchsorted(candidate_rows, np.arange(1, rows)))
+
+    ranked_rows = []
+    for row, columns in zip(scores, row_candidates):
+        columns = columns[np.lexsort((columns, -row[columns]))[:k]]
+        ranked_rows.append(list(zip(columns.tolist(), row[columns].tolist())))
+    return ranked_rows
+
+
+def bm25f_tf(field_tf, k1: float = BM25_K1):
+    """
+    BM25F saturation of the weighted sum of length-normalized field tfs;
+    works on scalars and numpy arrays.
+    """
+    return (field_tf * (k1 + 1)) / (field_tf + k1)
+
+
+def build_command(
+    posting_codec: str = DEFAULT_POSTING_CODEC,
+    workers: int = DEFAULT_BUILD_WORKERS,
+    positions: bool = False,
+) -> None:
     idx = InvertedIndex()
-    idx.build()
-    idx.save()
+    idx.build(workers=workers, positions=positions)
+    idx.save(posting_codec)
+    prefixes = PrefixIndex(idx.analyzer)
+    prefixes.build(idx)
+    prefixes.save([idx.index_path, idx.legacy_index_path])
 
 
 def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+    """
+    Return movies matching `query`. Queries using AND, OR, NOT, parentheses
+    or quoted phrases are evaluated as boolean queries and return matches in
+    index order; plain word lists return documents with any of the words.
+    """
     idx = InvertedIndex()
     idx.load()
-    query_tokens = tokenize_text(query)
+    if is_boolean_query(query):
+        matches = idx.boolean_search(query)[:limit]
+        return [idx.documents[doc_idx] for doc_idx in matches.tolist()]
+
+    query_tokens = idx.analyzer.tokenize(query)
     seen, results = set(), []
     for query_token in query_tokens:
-        matching_doc_ids = idx.get_documents(query_token)
-        for doc_id in matching_doc_ids:
-            if doc_id in seen:
+        matching_doc_idxs, _ = idx.get_postings(query_token)
+        for doc_idx in matching_doc_idxs.tolist():
+            if doc_idx in seen:
                 continue
-            seen.add(doc_id)
-            doc = idx.docmap[doc_id]
+            seen.add(doc_idx)
+            doc = idx.documents[doc_idx]
             if not doc:
                 continue
             results.append(doc)
@@ -177,28 +1038,11 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
 
 
 def preprocess_text(text: str) -> str:
-    text = text.lower()
-    text = text.translate(str.maketrans("", "", string.punctuation))
-    return text
+    return get_analyzer().preprocess(text)
 
 
 def tokenize_text(text: str) -> list[str]:
-    text = preprocess_text(text)
-    tokens = text.split()
-    valid_tokens = []
-    for token in tokens:
-        if token:
-            valid_tokens.append(token)
-    stop_words = load_stopwords()
-    filtered_words = []
-    for word in valid_tokens:
-        if word not in stop_words:
-            filtered_words.append(word)
-    stemmer = PorterStemmer()
-    stemmed_words = []
-    for word in filtered_words:
-        stemmed_words.append(stemmer.stem(word))
-    return stemmed_words
+    return get_analyzer().tokenize(text)
 
 
 def tf_command(doc_id: int, term: str) -> int:
@@ -233,7 +1077,68 @@ def tfidf_command(doc_id: int, term: str) -> float:
     return idx.get_tf_idf(doc_id, term)
 
 
-def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+def analyzed_query_key(analyzer: Analyzer, query: str) -> str:
+    """
+    Cache key text for a BM25 query: its analyzed terms and phrases, so
+    queries differing only in case, stopwords or inflection share an entry.
+    Every engine returns the same ranking, so callers leave it out too.
+    """
+    text, phrases = parse_phrases(query)
+    analyzed = [analyzer.tokenize(text)] + [analyzer.tokenize(p) for p in phrases]
+    return json.dumps(analyzed)
+
+
+def bm25search_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    engine: str = DEFAULT_BM25_ENGINE,
+    proximity_weight: float = 0.0,
+    cache: QueryCache = QUERY_CACHE,
+) -> list[dict]:
+    idx = InvertedIndex()
+
+    def search() -> list[dict]:
+        idx.load()
+        return idx.bm25_search(query, limit, engine, proximity_weight)
+
+    return cache.get_or_compute(
+        "bm25",
+        analyzed_query_key(idx.analyzer, query),
+        {"limit": limit, "proximity_weight": proximity_weight},
+        [idx.index_path, idx.legacy_index_path],
+        search,
+    )
+
+
+def bm25fsearch_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    engine: str = DEFAULT_BM25_ENGINE,
+    title_weight: float = BM25F_TITLE_WEIGHT,
+    description_weight: float = BM25F_DESCRIPTION_WEIGHT,
+) -> list[dict]:
     idx = InvertedIndex()
     idx.load()
-    return idx.bm25_search(query, limit)
\ No newline at end of file
+    return idx.bm25f_search(query, limit, engine, title_weight, description_weight)
+
+
+def autocomplete_command(prefix: str, limit: int = DEFAULT_SEARCH_LIMIT) -> dict:
+    idx = InvertedIndex()
+    keyword_index_paths = [idx.index_path, idx.legacy_index_path]
+    prefixes = PrefixIndex.load_current(keyword_index_paths, idx.analyzer)
+    if prefixes is None:
+        # Indexes built before autocomplete existed, or rebuilt since.
+        idx.load()
+        prefixes = PrefixIndex(idx.analyzer)
+        prefixes.build(idx)
+        prefixes.save(keyword_index_paths)
+    return {
+        "titles": prefixes.complete_titles(prefix, limit),
+        "terms": prefixes.complete_terms(prefix, limit),
+    }
+
+
+def migrate_command() -> None:
+    idx = InvertedIndex()
+    idx.load_legacy()
+    idx.save()
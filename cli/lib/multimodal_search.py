@@ -1,19 +1,26 @@
+from itertools import batched
+
+import numpy as np
 from PIL import Image
 from sentence_transformers import SentenceTransformer
 
-from .search_utils import load_movies
-from .semantic_search import cosine_similarity
+from .search_utils import EMBEDDING_BATCH_SIZE, load_movies
+from .vector_search import cosine_scores, normalize_rows, top_k_indices
 
 class MultimodalSearch:
     def __init__(self, documents, model_name="clip-ViT-B-32"):
         self.model = SentenceTransformer(model_name)
         self.documents = documents
 
-        self.texts = []
-        for doc in documents:
-            self.texts.append(f"{doc['title']}: {doc['description']}")
-
-        self.text_embeddings = self.model.encode(self.texts, show_progress_bar=True)
+        # Encode in batches so the texts of the whole catalog are never
+        # held at once.
+        batch_embeddings = []
+        for batch in batched(documents, EMBEDDING_BATCH_SIZE):
+            texts = [f"{doc['title']}: {doc['description']}" for doc in batch]
+            batch_embeddings.append(self.model.encode(texts))
+        self.text_embeddings = normalize_rows(
+            np.concatenate(batch_embeddings) if batch_embeddings else np.empty((0, 0))
+        )
 
     def embed_image(self, image_path):
         image = Image.open(image_path)
@@ -25,19 +32,18 @@ class MultimodalSearch:
     def search_with_image(self, image_path):
         image_embedding = self.embed_image(image_path)
 
+        scores = cosine_scores(self.text_embeddings, image_embedding)
+
         results = []
-        for i, text_embedding in enumerate(self.text_embeddings):
-           score = cosine_similarity(image_embedding, text_embedding)
-           doc = self.documents[i]
-           results.append({
+        for i in top_k_indices(scores, 5):
+            doc = self.documents[i]
+            results.append({
                 'id': doc['id'],
-                'score': score,
+                'score': scores[i],
                 'title': doc['title'],
                 'description': doc['description']
-           })
-        
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:5]
+            })
+        return results
 
 def verify_image_embedding(image_path):
     multimodal_search = MultimodalSearch()
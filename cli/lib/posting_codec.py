@@ -0,0 +1,189 @@
+"""
+Block bit-packed posting list codec for the keyword index.
+
+Each term's postings are cut into blocks of POSTING_BLOCK_SIZE. A block is
+stored as two header bytes (doc gap bit width, tf bit width) followed by the
+bit-packed doc idx gaps minus one and the bit-packed term frequencies minus
+one. Gaps of the first block of a term are taken from -1, gaps of later
+blocks from the previous block's last doc idx, so every block decodes on its
+own given the skip data kept next to it:
+
+    block_offsets         byte offset of each block in block_data
+    block_last_doc_idxs   last doc idx of each block
+    block_max_scores      max BM25 score in each block, for the default k1/b
+    term_block_offsets    first block of each term id
+"""
+
+import numpy as np
+
+from .query_engine import PostingList
+from .search_utils import POSTING_BLOCK_SIZE
+
+POSTING_CODECS = ("raw", "bitpack")
+
+
+def pack_bits(values: np.ndarray, width: int) -> bytes:
+    """Pack non-negative integers into `width` bits each, little-endian."""
+    if width == 0:
+        return b""
+    shifts = np.arange(width, dtype=np.uint32)
+    bits = (values.astype(np.uint32)[:, None] >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8).ravel(), bitorder="little").tobytes()
+
+
+def unpack_bits(data: np.ndarray, count: int, width: int) -> np.ndarray:
+    """Inverse of `pack_bits` for `count` values."""
+    if width == 0:
+        return np.zeros(count, dtype=np.int64)
+    bits = np.unpackbits(data, count=count * width, bitorder="little")
+    weights = np.left_shift(1, np.arange(width, dtype=np.int64))
+    return bits.reshape(count, width).astype(np.int64) @ weights
+
+
+def bit_width(values: np.ndarray) -> int:
+    return int(values.max()).bit_length() if len(values) > 0 else 0
+
+
+def encode_postings(
+    posting_offsets: np.ndarray,
+    doc_idxs: np.ndarray,
+    tfs: np.ndarray,
+    scores: np.ndarray,
+    block_size: int = POSTING_BLOCK_SIZE,
+) -> dict[str, np.ndarray]:
+    """Compress CSR postings into the arrays described in the module docstring."""
+    chunks = []
+    block_offsets = [0]
+    block_last_doc_idxs = []
+    block_max_scores = []
+    term_block_offsets = [0]
+
+    for term_id in range(len(posting_offsets) - 1):
+        start, end = int(posting_offsets[term_id]), int(posting_offsets[term_id + 1])
+        previous = -1
+        for block_start in range(start, end, block_size):
+            block_end = min(block_start + block_size, end)
+            block_doc_idxs = doc_idxs[block_start:block_end].astype(np.int64)
+            gaps = np.diff(block_doc_idxs, prepend=previous) - 1
+            block_tfs = tfs[block_start:block_end].astype(np.int64) - 1
+            gap_width, tf_width = bit_width(gaps), bit_width(block_tfs)
+
+            chunk = bytes((gap_width, tf_width))
+            chunk += pack_bits(gaps, gap_width) + pack_bits(block_tfs, tf_width)
+            chunks.append(chunk)
+            block_offsets.append(block_offsets[-1] + len(chunk))
+            previous = int(block_doc_idxs[-1])
+            block_last_doc_idxs.append(previous)
+            block_max_scores.append(scores[block_start:block_end].max())
+        term_block_offsets.append(len(block_last_doc_idxs))
+
+    return {
+        "block_data": np.frombuffer(b"".join(chunks), dtype=np.uint8),
+        "block_offsets": np.array(block_offsets, dtype=np.int64),
+        "block_last_doc_idxs": np.array(block_last_doc_idxs, dtype=np.int32),
+        "block_max_scores": np.array(block_max_scores, dtype=np.float64),
+        "term_block_offsets": np.array(term_block_offsets, dtype=np.int64),
+    }
+
+
+class CompressedPostings:
+    """Read access to postings written by `encode_postings`."""
+
+    def __init__(
+        self,
+        arrays: dict[str, np.ndarray],
+        posting_offsets: np.ndarray,
+        block_size: int = POSTING_BLOCK_SIZE,
+    ) -> None:
+        self.block_data = arrays["block_data"]
+        self.block_offsets = arrays["block_offsets"]
+        self.block_last_doc_idxs = arrays["block_last_doc_idxs"]
+        self.block_max_scores = arrays["block_max_scores"]
+        self.term_block_offsets = arrays["term_block_offsets"]
+        self.posting_offsets = posting_offsets
+        self.block_size = block_size
+
+    def term_blocks(self, term_id: int) -> tuple[int, int]:
+        """Return the [first, end) global block range of a term."""
+        return (
+            int(self.term_block_offsets[term_id]),
+            int(self.term_block_offsets[term_id + 1]),
+        )
+
+    def decode_block(self, term_id: int, block: int) -> tuple[np.ndarray, np.ndarray]:
+        """Decode one global block of `term_id` into doc idxs and tfs."""
+        first_block, _ = self.term_blocks(term_id)
+        block_start = int(self.posting_offsets[term_id]) + (block - first_block) * self.block_size
+        count = min(self.block_size, int(self.posting_offsets[term_id + 1]) - block_start)
+        previous = -1 if block == first_block else int(self.block_last_doc_idxs[block - 1])
+
+        data = self.block_data[self.block_offsets[block] : self.block_offsets[block + 1]]
+        gap_width, tf_width = int(data[0]), int(data[1])
+        gap_bytes = (count * gap_width + 7) // 8
+        gaps = unpack_bits(data[2 : 2 + gap_bytes], count, gap_width)
+        tfs = unpack_bits(data[2 + gap_bytes :], count, tf_width) + 1
+        doc_idxs = previous + np.cumsum(gaps + 1)
+        return doc_idxs.astype(np.int32), tfs.astype(np.int32)
+
+    def decode_term(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """Decode every block of `term_id`."""
+        first_block, end_block = self.term_blocks(term_id)
+        if first_block == end_block:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        decoded = [self.decode_block(term_id, block) for block in range(first_block, end_block)]
+        return (
+            np.concatenate([doc_idxs for doc_idxs, _ in decoded]),
+            np.concatenate([tfs for _, tfs in decoded]),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.block_data,
+                self.block_offsets,
+                self.block_last_doc_idxs,
+                self.block_max_scores,
+                self.term_block_offsets,
+            )
+        )
+
+
+class CompressedPostingList(PostingList):
+    """
+    Posting list over compressed blocks. Skip data comes straight from the
+    index, and blocks are decoded and scored only when a cursor enters them.
+    """
+
+    def __init__(self, postings: CompressedPostings, term_id: int, scorer) -> None:
+        self.compressed = postings
+        self.term_id = term_id
+        self.scorer = scorer
+        self.first_block, end_block = postings.term_blocks(term_id)
+        self.length = int(
+            postings.posting_offsets[term_id + 1] - postings.posting_offsets[term_id]
+        )
+        self.block_size = postings.block_size
+        self.block_last_doc_idxs = postings.block_last_doc_idxs[
+            self.first_block : end_block
+        ].tolist()
+        self.block_max_scores = postings.block_max_scores[
+            self.first_block : end_block
+        ].tolist()
+        self.max_score = max(self.block_max_scores, default=0.0)
+        self.decoded_blocks: dict[int, tuple[list[int], list[float]]] = {}
+
+    def __iter__(self):
+        for block_idx in range(len(self.block_last_doc_idxs)):
+            yield from zip(*self.block(block_idx))
+
+    def block(self, block_idx: int) -> tuple[list[int], list[float]]:
+        decoded = self.decoded_blocks.get(block_idx)
+        if decoded is None:
+            doc_idxs, tfs = self.compressed.decode_block(
+                self.term_id, self.first_block + block_idx
+            )
+            decoded = doc_idxs.tolist(), self.scorer(doc_idxs, tfs).tolist()
+            self.decoded_blocks[block_idx] = decoded
+        return decoded
@@ -0,0 +1,102 @@
+"""
+Phrase matching and term proximity scoring over positional postings.
+
+Positions are word offsets in a document's analyzed text, counting
+stopwords (see Analyzer.tokenize_with_positions). The positions of a term
+are stored posting by posting, so a posting with term frequency tf owns the
+next tf positions. Both features work on flat (doc idx, position) pairs
+packed into int64 keys, so they run as a few vectorized set operations
+instead of a loop over documents.
+"""
+
+import re
+
+import numpy as np
+
+from .search_utils import BM25_K1, PROXIMITY_WINDOW
+
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+
+
+def parse_phrases(query: str) -> tuple[str, list[str]]:
+    """Return `query` without quotes and the quoted phrases it contains."""
+    phrases = [phrase for phrase in PHRASE_PATTERN.findall(query) if phrase.strip()]
+    return query.replace('"', " "), phrases
+
+
+def position_keys(doc_idxs: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """Pack (doc idx, position) pairs into sortable int64 keys."""
+    return (doc_idxs.astype(np.int64) << 32) | positions.astype(np.int64)
+
+
+def phrase_doc_idxs(
+    term_positions: list[tuple[int, np.ndarray, np.ndarray]],
+) -> np.ndarray:
+    """
+    Return the sorted doc idxs that contain a phrase.
+
+    `term_positions` holds, for each phrase term, its offset in the phrase
+    and the doc idx and position of every occurrence of the term. A document
+    matches when some start position has every term at start + offset.
+    """
+    starts = None
+    # Rarest terms first, so the running intersection stays small.
+    for offset, doc_idxs, positions in sorted(term_positions, key=lambda t: len(t[2])):
+        valid = positions >= offset
+        keys = position_keys(doc_idxs[valid], positions[valid] - offset)
+        if starts is None:
+            starts = keys
+        else:
+            starts = np.intersect1d(starts, keys, assume_unique=True)
+        if len(starts) == 0:
+            break
+    if starts is None:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(starts >> 32)
+
+
+def proximity_scores(
+    candidates: np.ndarray,
+    term_positions: list[tuple[float, np.ndarray, np.ndarray]],
+    length_norms: np.ndarray,
+    window: int = PROXIMITY_WINDOW,
+    k1: float = BM25_K1,
+) -> np.ndarray:
+    """
+    BM25TP-style proximity score of each candidate doc idx.
+
+    `term_positions` holds the IDF and the occurrences (doc idxs, positions)
+    of each distinct query term. Every pair of query terms occurring within
+    `window` words of each other adds 1 / distance**2 to the pair's
+    accumulator, which is saturated like a BM25 term frequency and weighted
+    by the smaller IDF of the two terms. `length_norms` are the BM25 length
+    norms of the candidates.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    scores = np.zeros(len(candidates), dtype=np.float64)
+    if len(candidates) == 0 or len(term_positions) < 2:
+        return scores
+
+    sorter = np.argsort(candidates)
+    sorted_candidates = candidates[sorter]
+    terms = []
+    for idf, doc_idxs, positions in term_positions:
+        in_candidates = np.isin(doc_idxs, sorted_candidates)
+        terms.append((idf, position_keys(doc_idxs[in_candidates], positions[in_candidates])))
+
+    for i, (idf_a, keys_a) in enumerate(terms):
+        for idf_b, keys_b in terms[i + 1 :]:
+            if len(keys_a) == 0 or len(keys_b) == 0:
+                continue
+            accumulator = np.zeros(len(candidates), dtype=np.float64)
+            for distance in range(1, window + 1):
+                for shifted, other in ((keys_a + distance, keys_b), (keys_b + distance, keys_a)):
+                    hits = shifted[np.isin(shifted, other, assume_unique=True)] >> 32
+                    slots = sorter[np.searchsorted(sorted_candidates, hits)]
+                    accumulator += np.bincount(slots, minlength=len(candidates)) / distance**2
+            scores += (
+                min(idf_a, idf_b)
+                * (accumulator * (k1 + 1))
+                / (accumulator + k1 * length_norms)
+            )
+    return scores
@@ -0,0 +1,265 @@
+"""
+Quantized copies of embedding matrices for a cheaper first scoring pass.
+
+The float32 embeddings stay on disk as the source of truth. Next to them a
+quantized copy is stored in one of these modes:
+
+    float16   half precision, 2 bytes per dimension
+    int8      per-dimension scalar quantization, 1 byte per dimension:
+              x ~= offset + scale * (code + 128), with offset and scale
+              the minimum and range / 255 of each dimension
+    binary    the sign of each dimension, 1 bit per dimension, packed into
+              uint64 words; rows are scored by Hamming distance to the
+              query's signs, XOR and popcount over 6 words for 384 dims
+
+Search scores every row on the quantized copy, keeps a shortlist of
+`rescore_multiplier * limit` rows and rescores only those against the
+float32 rows, which are memory-mapped so only the shortlist is paged in.
+The multiplier is calibrated at build time: the smallest power of two whose
+shortlist holds the exact top QUANTIZATION_CALIBRATION_LIMIT rows at the
+requested average recall, over QUANTIZATION_CALIBRATION_QUERIES sample
+queries (midpoints of random pairs of rows).
+
+Like the ANN index, a quantized copy is stamped with the generation of its
+embeddings file and rebuilt once that file changes.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+
+from .index_format import read_index_file, write_index_file
+from .query_cache import file_generation
+from .search_utils import (
+    CHUNK_EMBEDDINGS_PATH,
+    DEFAULT_RECALL_TARGET,
+    HAMMING_SCORE_BLOCK_ROWS,
+    MOVIE_EMBEDDINGS_PATH,
+    QUANTIZATION_BUILD_BLOCK_ROWS,
+    QUANTIZATION_CALIBRATION_LIMIT,
+    QUANTIZATION_CALIBRATION_QUERIES,
+    QUANTIZATION_MAX_MULTIPLIER,
+    QUANTIZED_SCORE_BLOCK_ROWS,
+)
+from .vector_search import cosine_scores, normalize_rows, top_k_indices
+
+QUANTIZATION_MODES = ("float16", "int8", "binary")
+# float32 searches the embeddings themselves.
+EMBEDDING_STORAGE_MODES = ("float32",) + QUANTIZATION_MODES
+
+
+def quantized_path(embeddings_path: str, mode: str) -> str:
+    return f"{os.path.splitext(embeddings_path)[0]}.{mode}.bin"
+
+
+class QuantizedEmbeddings:
+    def __init__(self, path: str, mode: str) -> None:
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"unknown quantization mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.codes = np.empty((0, 0), dtype=np.int8)
+        # int8 only: per-dimension dequantization
+        self.offset = np.empty(0, dtype=np.float32)
+        self.scale = np.empty(0, dtype=np.float32)
+        self.rescore_multiplier = 1
+        self.recall_target = DEFAULT_RECALL_TARGET
+        self.generation: list = []
+
+    def build(self, embeddings: np.ndarray, recall_target: float = DEFAULT_RECALL_TARGET) -> None:
+        """Quantize `embeddings` (normalized here, a block at a time) and calibrate."""
+        if self.mode == "int8":
+            bounds = [(block.min(axis=0), block.max(axis=0)) for block in _blocks(embeddings)]
+            minimum = np.min([low for low, _ in bounds], axis=0)
+            maximum = np.max([high for _, high in bounds], axis=0)
+            self.offset = minimum.astype(np.float32)
+            self.scale = np.where(maximum > minimum, (maximum - minimum) / 255, 1).astype(np.float32)
+        self.codes = np.concatenate([self.__encode(block) for block in _blocks(embeddings)])
+        self.recall_target = recall_target
+        self.rescore_multiplier = self.__calibrate(embeddings, recall_target)
+
+    def save(self, embeddings_path: str) -> None:
+        self.generation = file_generation([embeddings_path])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        arrays = {"codes": self.codes, "offset": self.offset, "scale": self.scale}
+        meta = {
+            "mode": self.mode,
+            "generation": self.generation,
+            "recall_target": self.recall_target,
+            "rescore_multiplier": self.rescore_multiplier,
+        }
+        write_index_file(self.path, arrays, meta)
+
+    def load(self) -> None:
+        arrays, meta = read_index_file(self.path)
+        # The codes stay memory-mapped; they are read a block at a time.
+        self.codes = arrays["codes"]
+        self.offset = np.asarray(arrays["offset"])
+        self.scale = np.asarray(arrays["scale"])
+        self.generation = meta["generation"]
+        self.recall_target = meta["recall_target"]
+        self.rescore_multiplier = meta["rescore_multiplier"]
+
+    @classmethod
+    def load_or_build(
+        cls,
+        embeddings_path: str,
+        mode: str,
+        recall_target: float = DEFAULT_RECALL_TARGET,
+    ) -> "QuantizedEmbeddings":
+        """The saved copy of `embeddings_path`, rebuilt if stale or calibrated for another target."""
+        quantized = cls(quantized_path(embeddings_path, mode), mode)
+        if os.path.exists(quantized.path):
+            quantized.load()
+            if (
+                quantized.generation == file_generation([embeddings_path])
+                and quantized.recall_target == recall_target
+            ):
+                return quantized
+        quantized.build(np.load(embeddings_path, mmap_mode="r"), recall_target)
+        quantized.save(embeddings_path)
+        return quantized
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offset.nbytes + self.scale.nbytes
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate cosine similarity of `query` with every row, or with
+        `rows`. Binary codes give 1 - 2 * (fraction of differing signs).
+        """
+        query = normalize_rows(query)
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.mode == "binary":
+            return _hamming_scores(codes, _pack_signs(query[np.newaxis])[0])
+        if self.mode == "int8":
+            weights = query * self.scale
+            bias = np.float32(query @ self.offset + 128 * weights.sum())
+        else:
+            # _decode_float16 yields the values scaled by 2**-112.
+            weights, bias = query * np.float32(2.0**112), np.float32(0)
+        scores = np.empty(len(codes), dtype=np.float32)
+        # Decode into small reused buffers: large blocks spill out of cache
+        # and the conversion, not the product, dominates.
+        shape = (min(len(codes), QUANTIZED_SCORE_BLOCK_ROWS), codes.shape[1])
+        buffer = np.empty(shape, dtype=np.uint32)
+        signs = np.empty(shape, dtype=np.uint32) if self.mode == "float16" else None
+        for start in range(0, len(codes), QUANTIZED_SCORE_BLOCK_ROWS):
+            block = codes[start : start + QUANTIZED_SCORE_BLOCK_ROWS]
+            if self.mode == "int8":
+                decoded = buffer[: len(block)].view(np.float32)
+                decoded[...] = block
+            else:
+                decoded = _decode_float16(block, buffer[: len(block)], signs[: len(block)])
+            scores[start : start + len(block)] = decoded @ weights
+        return scores + bias
+
+    def shortlist_size(self, limit: int) -> int:
+        return limit * self.rescore_multiplier
+
+    def __encode(self, block: np.ndarray) -> np.ndarray:
+        if self.mode == "binary":
+            return _pack_signs(block)
+        if self.mode == "float16":
+            return block.astype(np.float16)
+        codes = np.rint((block - self.offset) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def __calibrate(self, embeddings: np.ndarray, recall_target: float) -> int:
+        rows = len(embeddings)
+        limit = min(QUANTIZATION_CALIBRATION_LIMIT, rows)
+        if limit == 0:
+            return 1
+        rng = np.random.default_rng(0)
+        pairs = rng.integers(0, rows, (QUANTIZATION_CALIBRATION_QUERIES, 2))
+        queries = normalize_rows(
+            normalize_rows(embeddings[np.sort(pairs[:, 0])])
+            + normalize_rows(embeddings[np.sort(pairs[:, 1])])
+        )
+        multipliers = [1]
+        while multipliers[-1] < QUANTIZATION_MAX_MULTIPLIER:
+            multipliers.append(multipliers[-1] * 2)
+        exact_scores = np.concatenate([block @ queries.T for block in _blocks(embeddings)])
+        found = np.zeros(len(multipliers))
+        for query, scores in zip(queries, exact_scores.T):
+            exact = top_k_indices(scores, limit)
+            approximate = self.scores(query)
+            for i, multiplier in enumerate(multipliers):
+                shortlist = top_k_indices(approximate, limit * multiplier)
+                found[i] += np.isin(exact, shortlist).sum()
+        recalls = found / (len(queries) * limit)
+        for multiplier, recall in zip(multipliers, recalls):
+            if recall >= recall_target:
+                return multiplier
+        return multipliers[-1]
+
+
+def quantize_command(mode: str, recall_target: float = DEFAULT_RECALL_TARGET) -> list[dict]:
+    """Build the quantized copies of the saved movie and chunk embeddings."""
+    reports = []
+    for embeddings_path in (MOVIE_EMBEDDINGS_PATH, CHUNK_EMBEDDINGS_PATH):
+        if not os.path.exists(embeddings_path):
+            continue
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        quantized = QuantizedEmbeddings.load_or_build(embeddings_path, mode, recall_target)
+        float32_bytes = embeddings.shape[0] * embeddings.shape[1] * 4
+        reports.append(
+            {
+                "embeddings": embeddings_path,
+                "rows": len(embeddings),
+                "float32_bytes": float32_bytes,
+                "quantized_bytes": quantized.nbytes(),
+                "saving": 1 - quantized.nbytes() / float32_bytes if float32_bytes else 0.0,
+                "rescore_multiplier": quantized.rescore_multiplier,
+            }
+        )
+    return reports
+
+
+def rescore(
+    embeddings: np.ndarray, query: np.ndarray, rows: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exact cosine scores of the float32 `rows`, returned sorted by row."""
+    rows = np.sort(rows)
+    return rows, cosine_scores(normalize_rows(embeddings[rows]), query)
+
+
+def _pack_signs(block: np.ndarray) -> np.ndarray:
+    """One bit per positive dimension, each row padded to whole uint64 words."""
+    bits = np.packbits(block > 0, axis=1)
+    padded = np.zeros((len(block), -(-bits.shape[1] // 8) * 8), dtype=np.uint8)
+    padded[:, : bits.shape[1]] = bits
+    return padded
+
+
+def _hamming_scores(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    words = codes.view(np.uint64)
+    query_words = query_bits.view(np.uint64)
+    distances = np.empty(len(words), dtype=np.int64)
+    for start in range(0, len(words), HAMMING_SCORE_BLOCK_ROWS):
+        block = words[start : start + HAMMING_SCORE_BLOCK_ROWS]
+        distances[start : start + len(block)] = np.bitwise_count(block ^ query_words).sum(axis=1)
+    return (1 - distances * (2 / (codes.shape[1] * 8))).astype(np.float32)
+
+
+def _decode_float16(block: np.ndarray, bits: np.ndarray, signs: np.ndarray) -> np.ndarray:
+    """
+    Widen float16 values to float32 with integer ops, several times faster
+    than numpy's cast without hardware support. Moving the exponent and
+    mantissa bits up 13 places yields the value times 2**-112 (the
+    difference of the exponent biases), subnormals included; the sign bit
+    moves up 16 places.
+    """
+    bits[...] = block.view(np.uint16)
+    np.bitwise_and(bits, 0x8000, out=signs)
+    bits ^= signs
+    bits <<= 13
+    signs <<= 16
+    bits |= signs
+    return bits.view(np.float32)
+
+
+def _blocks(embeddings: np.ndarray):
+    for start in range(0, len(embeddings), QUANTIZATION_BUILD_BLOCK_ROWS):
+        yield normalize_rows(embeddings[start : start + QUANTIZATION_BUILD_BLOCK_ROWS])
@@ -0,0 +1,186 @@
+"""
+Result cache for the search commands.
+
+Entries are keyed on the search mode, the normalized query and the search
+parameters, and stamped with the generation of the files the results were
+computed from: the size and modification time of each index, embedding and
+data file. Rebuilding any of them changes the generation, so stale entries
+are dropped the next time they are looked up.
+
+The memory tier is an LRU of at most QUERY_CACHE_SIZE entries. An optional
+disk tier keeps one JSON file per entry, so results survive across CLI runs.
+Results are stored as JSON text and decoded on every hit; callers may modify
+what they get back without touching the cache.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .search_utils import QUERY_CACHE_DIR, QUERY_CACHE_DISK_ENTRIES, QUERY_CACHE_SIZE
+
+
+def file_generation(paths: list[str]) -> list:
+    """Identify the current contents of `paths` by size and mtime."""
+    generation = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            generation.append([path, None, None])
+            continue
+        generation.append([path, stat.st_size, stat.st_mtime_ns])
+    return generation
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace, for modes that embed the query text verbatim."""
+    return " ".join(query.split())
+
+
+class QueryCache:
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_SIZE,
+        disk_dir: Optional[str] = None,
+        max_disk_entries: int = QUERY_CACHE_DISK_ENTRIES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        # key -> (generation, results as JSON text)
+        self.entries: OrderedDict[str, tuple[list, str]] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def enable_disk(self, disk_dir: str = QUERY_CACHE_DIR) -> None:
+        self.disk_dir = disk_dir
+
+    def get_or_compute(
+        self,
+        mode: str,
+        query: str,
+        params: dict,
+        paths: list[str],
+        compute: Callable[[], object],
+    ):
+        """
+        Return the cached results of `mode` for `query` and `params`, or
+        compute and cache them. `paths` are the files the results depend on.
+        """
+        key = self.key(mode, query, params)
+        cached = self.get(key, file_generation(paths))
+        if cached is not None:
+            return cached
+        results = compute()
+        # Stamp after computing: the search may have built missing files.
+        self.put(key, file_generation(paths), results)
+        return results
+
+    def key(self, mode: str, query: str, params: dict) -> str:
+        text = json.dumps([mode, query, params], sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, generation: list):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] == generation:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            del self.entries[key]
+
+        entry = self.__read_disk(key)
+        if entry is not None:
+            if entry[0] == generation:
+                self.__remember(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return json.loads(entry[1])
+            os.remove(self.__disk_path(key))
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, generation: list, results) -> None:
+        try:
+            text = json.dumps(results, default=_json_scalar)
+        except TypeError:
+            return
+        entry = (generation, text)
+        self.__remember(key, entry)
+        self.__write_disk(key, entry)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        if self.disk_dir is not None and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+    def __remember(self, key: str, entry: tuple[list, str]) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def __read_disk(self, key: str) -> Optional[tuple[list, str]]:
+        if self.disk_dir is None:
+            return None
+        path = self.__disk_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Touch the file so disk pruning evicts least recently used first.
+        os.utime(path)
+        return entry["generation"], entry["results"]
+
+    def __write_disk(self, key: str, entry: tuple[list, str]) -> None:
+        if self.disk_dir is None:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self.__disk_path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"generation": entry[0], "results": entry[1]}, f)
+        os.replace(tmp_path, path)
+        self.__prune_disk()
+
+    def __prune_disk(self) -> None:
+        names = [name for name in os.listdir(self.disk_dir) if name.endswith(".json")]
+        if len(names) <= self.max_disk_entries:
+            return
+        paths = sorted(
+            (os.path.join(self.disk_dir, name) for name in names), key=os.path.getmtime
+        )
+        for path in paths[: len(paths) - self.max_disk_entries]:
+            os.remove(path)
+
+
+def _json_scalar(value):
+    # numpy scalars, e.g. cross-encoder scores
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Shared by the search commands of one process.
+QUERY_CACHE = QueryCache()
@@ -0,0 +1,251 @@
+"""
+Cache of query embeddings, so repeated queries skip the encoder.
+
+Entries are keyed on the model name and the whitespace-normalized query,
+and the normalized query is what gets encoded, so queries that differ only
+in spacing share one embedding.
+
+The memory tier is an LRU of at most QUERY_EMBEDDING_CACHE_SIZE vectors.
+The optional disk tier keeps, per model, a fixed-size ring of the last
+QUERY_EMBEDDING_DISK_ENTRIES embeddings, so popular queries stay cached
+across CLI runs:
+
+    cache/query_embeddings/<model digest>/meta.json    {"model", "dim", "capacity", "next"}
+    cache/query_embeddings/<model digest>/keys.bin     20-byte digest per slot, zero if empty
+    cache/query_embeddings/<model digest>/vectors.bin  float32 vector per slot
+
+Both files are memory-mapped and written in place. A slot's vector is
+written before its key, so a reader never pairs a key with a torn vector.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+from .query_cache import normalize_query
+from .search_utils import (
+    QUERY_EMBEDDING_CACHE_DIR,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_DISK_ENTRIES,
+)
+
+KEY_SIZE = 20
+EMPTY_KEY = bytes(KEY_SIZE)
+
+
+class QueryEmbeddingCache:
+    def __init__(
+        self,
+        max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+        disk_dir: Optional[str] = None,
+        disk_entries: int = QUERY_EMBEDDING_DISK_ENTRIES,
+    ) -> None:
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_entries = disk_entries
+        # key -> embedding
+        self.entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        # model name -> its ring on disk
+        self.rings: dict[str, _DiskRing] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def enable_disk(self, disk_dir: str = QUERY_EMBEDDING_CACHE_DIR) -> None:
+        self.disk_dir = disk_dir
+        self.rings = {}
+
+    def get_or_compute(
+        self, model_name: str, query: str, encode: Callable[[str], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Return the embedding of `query` under `model_name`, calling
+        `encode` with the normalized query only on a miss.
+        """
+        query = normalize_query(query)
+        key = _query_key(model_name, query)
+        embedding = self.__lookup(model_name, key)
+        if embedding is None:
+            embedding = self.__store(model_name, key, encode(query))
+        return embedding.copy()
+
+    def get_or_compute_many(
+        self, model_name: str, queries: list[str], encode: Callable[[list[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Embeddings of `queries`, one row each, calling `encode` once with
+        the distinct normalized queries that miss both tiers.
+        """
+        queries = [normalize_query(query) for query in queries]
+        keys = [_query_key(model_name, query) for query in queries]
+        found: dict[bytes, np.ndarray] = {}
+        missing: dict[bytes, str] = {}
+        for key, query in zip(keys, queries):
+            if key in found or key in missing:
+                # A repeat within the batch is served by the first one.
+                self.hits += 1
+                continue
+            embedding = self.__lookup(model_name, key)
+            if embedding is None:
+                missing[key] = query
+            else:
+                found[key] = embedding
+        if missing:
+            for key, embedding in zip(missing, encode(list(missing.values()))):
+                found[key] = self.__store(model_name, key, embedding)
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.array([found[key] for key in keys], dtype=np.float32)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        for ring in self.rings.values():
+            ring.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+    def __lookup(self, model_name: str, key: bytes) -> Optional[np.ndarray]:
+        """The cached embedding for `key`, counting the hit or the miss."""
+        embedding = self.entries.get(key)
+        if embedding is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+        ring = self.__ring(model_name)
+        embedding = ring.get(key) if ring is not None else None
+        if embedding is None:
+            self.misses += 1
+            return None
+        self.__remember(key, embedding)
+        self.hits += 1
+        self.disk_hits += 1
+        return embedding
+
+    def __store(self, model_name: str, key: bytes, embedding) -> np.ndarray:
+        embedding = np.array(embedding, dtype=np.float32)
+        self.__remember(key, embedding)
+        ring = self.__ring(model_name)
+        if ring is not None:
+            ring.put(key, embedding)
+        return embedding
+
+    def __remember(self, key: bytes, embedding: np.ndarray) -> None:
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __ring(self, model_name: str) -> Optional["_DiskRing"]:
+        if self.disk_dir is None:
+            return None
+        ring = self.rings.get(model_name)
+        if ring is None:
+            model_digest = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+            ring = _DiskRing(os.path.join(self.disk_dir, model_digest), model_name, self.disk_entries)
+            self.rings[model_name] = ring
+        return ring
+
+
+def _query_key(model_name: str, query: str) -> bytes:
+    return hashlib.sha1(f"{model_name}\0{query}".encode("utf-8")).digest()
+
+
+class _DiskRing:
+    """Fixed number of slots overwritten oldest first."""
+
+    def __init__(self, directory: str, model_name: str, capacity: int) -> None:
+        self.directory = directory
+        self.model_name = model_name
+        self.capacity = capacity
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.keys_path = os.path.join(directory, "keys.bin")
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.dim = 0
+        self.next = 0
+        self.keys: Optional[np.memmap] = None
+        self.vectors: Optional[np.memmap] = None
+        # digest -> slot
+        self.slots: dict[bytes, int] = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["model"] == model_name and meta["capacity"] == capacity:
+                self.dim = meta["dim"]
+                self.next = meta["next"]
+                self.__map()
+                for slot, key in enumerate(self.keys):
+                    key = key.tobytes()
+                    if key != EMPTY_KEY:
+                        self.slots[key] = slot
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        return np.array(self.vectors[slot])
+
+    def put(self, key: bytes, embedding: np.ndarray) -> None:
+        if self.vectors is None:
+            self.__create(len(embedding))
+        if len(embedding) != self.dim:
+            return
+        slot = self.next
+        old_key = self.keys[slot].tobytes()
+        if old_key != EMPTY_KEY:
+            self.slots.pop(old_key, None)
+        self.keys[slot] = np.frombuffer(EMPTY_KEY, dtype=np.uint8)
+        self.vectors[slot] = embedding
+        self.vectors.flush()
+        self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        self.keys.flush()
+        self.slots[key] = slot
+        self.next = (slot + 1) % self.capacity
+        self.__write_meta()
+
+    def clear(self) -> None:
+        if self.keys is not None:
+            self.keys[:] = 0
+            self.keys.flush()
+        self.slots.clear()
+
+    def __create(self, dim: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.dim = dim
+        self.next = 0
+        for path, size in ((self.keys_path, KEY_SIZE), (self.vectors_path, 4 * dim)):
+            with open(path, "wb") as f:
+                f.truncate(self.capacity * size)
+        self.__write_meta()
+        self.__map()
+
+    def __map(self) -> None:
+        self.keys = np.memmap(self.keys_path, dtype=np.uint8, mode="r+", shape=(self.capacity, KEY_SIZE))
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim)
+        )
+
+    def __write_meta(self) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"model": self.model_name, "dim": self.dim, "capacity": self.capacity, "next": self.next},
+                f,
+            )
+        os.replace(tmp_path, self.meta_path)
+
+
+# Shared by every SemanticSearch of one process.
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
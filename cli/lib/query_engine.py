@@ -0,0 +1,254 @@
+"""
+Top-k query engines that rank documents from BM25 posting lists.
+
+Documents are identified by their dense position in the index (doc_idx).
+Every engine returns the same (doc_idx, score) pairs: the `limit` highest
+scores, ties broken by the lower doc_idx.
+"""
+
+import heapq
+import sys
+from bisect import bisect_left
+from operator import attrgetter
+
+from .search_utils import POSTING_BLOCK_SIZE
+
+# Upper bounds are sums of floats added in a different order than the real
+# score, so allow them to be off by rounding before pruning a document.
+SCORE_EPSILON = 1e-9
+END_OF_POSTINGS = sys.maxsize
+
+
+class PostingList:
+    """
+    Doc-idx sorted postings of one term with their BM25 contributions.
+
+    Besides the term-wide maximum score (used by WAND), the postings are cut
+    into fixed-size blocks that record their last doc idx and their maximum
+    score (used by Block-Max WAND). Cursors read postings one block at a
+    time through `block()`, so subclasses can decode blocks lazily.
+    """
+
+    def __init__(
+        self,
+        doc_idxs: list[int],
+        scores: list[float],
+        block_size: int = POSTING_BLOCK_SIZE,
+    ) -> None:
+        self.doc_idxs = doc_idxs
+        self.scores = scores
+        self.length = len(doc_idxs)
+        self.max_score = max(scores, default=0.0)
+        self.block_size = block_size
+        self.block_last_doc_idxs = []
+        self.block_max_scores = []
+        for start in range(0, len(doc_idxs), block_size):
+            end = min(start + block_size, len(doc_idxs))
+            self.block_last_doc_idxs.append(doc_idxs[end - 1])
+            self.block_max_scores.append(max(scores[start:end]))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        return zip(self.doc_idxs, self.scores)
+
+    def block(self, block_idx: int) -> tuple[list[int], list[float]]:
+        """Return the doc idxs and scores of one block."""
+        start = block_idx * self.block_size
+        end = start + self.block_size
+        return self.doc_idxs[start:end], self.scores[start:end]
+
+
+class PostingCursor:
+    """Forward-only position in a posting list, one decoded block at a time."""
+
+    def __init__(self, postings: PostingList, term_idx: int) -> None:
+        self.postings = postings
+        self.term_idx = term_idx
+        self.max_score = postings.max_score
+        self.block_last_doc_idxs = postings.block_last_doc_idxs
+        self.__load_block(0)
+
+    @property
+    def score(self) -> float:
+        return self.block_scores[self.offset]
+
+    def next(self) -> None:
+        self.offset += 1
+        if self.offset < len(self.block_doc_idxs):
+            self.doc_idx = self.block_doc_idxs[self.offset]
+        else:
+            self.__load_block(self.block_idx + 1)
+
+    def advance_to(self, doc_idx: int) -> None:
+        """Move to the first posting whose doc idx is >= `doc_idx`."""
+        if self.doc_idx >= doc_idx:
+            return
+        if doc_idx > self.block_last_doc_idxs[self.block_idx]:
+            self.__load_block(
+                bisect_left(self.block_last_doc_idxs, doc_idx, lo=self.block_idx + 1)
+            )
+            if self.doc_idx == END_OF_POSTINGS:
+                return
+        self.offset = bisect_left(self.block_doc_idxs, doc_idx, lo=self.offset)
+        self.doc_idx = self.block_doc_idxs[self.offset]
+
+    def block_max_score(self, doc_idx: int) -> tuple[float, int]:
+        """
+        Return (max score, last doc idx) of the block that may hold `doc_idx`,
+        or (0.0, END_OF_POSTINGS) when the list ends before `doc_idx`.
+        """
+        block = bisect_left(self.block_last_doc_idxs, doc_idx, lo=self.block_idx)
+        if block >= len(self.block_last_doc_idxs):
+            return 0.0, END_OF_POSTINGS
+        return self.postings.block_max_scores[block], self.block_last_doc_idxs[block]
+
+    def __load_block(self, block_idx: int) -> None:
+        self.block_idx = block_idx
+        self.offset = 0
+        if block_idx >= len(self.block_last_doc_idxs):
+            self.block_doc_idxs, self.block_scores = [], []
+            self.doc_idx = END_OF_POSTINGS
+            return
+        self.block_doc_idxs, self.block_scores = self.postings.block(block_idx)
+        self.doc_idx = self.block_doc_idxs[0]
+
+
+def term_at_a_time(
+    posting_lists: list[PostingList],
+    limit: int,
+) -> list[tuple[int, float]]:
+    """
+    Score documents one posting list at a time and keep the best `limit`.
+
+    Only documents that contain at least one query term are touched.
+    """
+    scores: dict[int, float] = {}
+    for postings in posting_lists:
+        for doc_idx, contribution in postings:
+            scores[doc_idx] = scores.get(doc_idx, 0.0) + contribution
+
+    return heapq.nlargest(
+        limit,
+        scores.items(),
+        key=lambda item: (item[1], -item[0]),
+    )
+
+
+def wand(
+    posting_lists: list[PostingList],
+    limit: int,
+) -> list[tuple[int, float]]:
+    """
+    Document-at-a-time top-k with WAND pruning on per-term max scores.
+    """
+    return _document_at_a_time(posting_lists, limit, block_max=False)
+
+
+def block_max_wand(
+    posting_lists: list[PostingList],
+    limit: int,
+) -> list[tuple[int, float]]:
+    """
+    WAND that also checks per-block max scores before scoring a pivot, so
+    whole blocks that cannot reach the heap are skipped.
+    """
+    return _document_at_a_time(posting_lists, limit, block_max=True)
+
+
+def _document_at_a_time(
+    posting_lists: list[PostingList],
+    limit: int,
+    block_max: bool,
+) -> list[tuple[int, float]]:
+    if limit <= 0:
+        return []
+
+    cursors = [
+        PostingCursor(postings, term_idx)
+        for term_idx, postings in enumerate(posting_lists)
+        if len(postings) > 0
+    ]
+    if not cursors:
+        return []
+    by_doc_idx = attrgetter("doc_idx")
+    # Min-heap of (score, -doc_idx); heap[0] is the entry to beat.
+    heap: list[tuple[float, int]] = []
+    threshold = None
+
+    while True:
+        cursors.sort(key=by_doc_idx)
+        pivot = _find_pivot(cursors, threshold)
+        if pivot is None:
+            break
+        pivot_doc_idx = cursors[pivot].doc_idx
+
+        if block_max and threshold is not None:
+            bound = 0.0
+            next_doc_idx = END_OF_POSTINGS
+            for cursor in cursors[: pivot + 1]:
+                block_score, block_last_doc_idx = cursor.block_max_score(pivot_doc_idx)
+                bound += block_score
+                if block_last_doc_idx < next_doc_idx:
+                    next_doc_idx = block_last_doc_idx + 1
+            if bound < threshold:
+                if pivot + 1 < len(cursors) and cursors[pivot + 1].doc_idx < next_doc_idx:
+                    next_doc_idx = cursors[pivot + 1].doc_idx
+                for cursor in cursors[: pivot + 1]:
+                    cursor.advance_to(next_doc_idx)
+                continue
+
+        if cursors[0].doc_idx != pivot_doc_idx:
+            for cursor in cursors[:pivot]:
+                cursor.advance_to(pivot_doc_idx)
+            continue
+
+        matching = sorted(cursors[: pivot + 1], key=attrgetter("term_idx"))
+        score = 0.0
+        for cursor in matching:
+            score += cursor.score
+            cursor.next()
+
+        entry = (score, -pivot_doc_idx)
+        if len(heap) < limit:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+        if len(heap) >= limit:
+            threshold = heap[0][0] - SCORE_EPSILON
+
+    ranked = sorted(heap, reverse=True)
+    return [(-neg_doc_idx, score) for score, neg_doc_idx in ranked]
+
+
+def _find_pivot(cursors: list[PostingCursor], threshold) -> int | None:
+    """
+    Return the index of the last cursor needed to reach `threshold`, extended
+    over every cursor positioned on the same document, or None if no
+    remaining document can reach it.
+    """
+    if threshold is None:
+        pivot = 0
+    else:
+        upper_bound = 0.0
+        for pivot, cursor in enumerate(cursors):
+            upper_bound += cursor.max_score
+            if upper_bound >= threshold:
+                break
+        else:
+            return None
+
+    pivot_doc_idx = cursors[pivot].doc_idx
+    if pivot_doc_idx == END_OF_POSTINGS:
+        return None
+    while pivot + 1 < len(cursors) and cursors[pivot + 1].doc_idx == pivot_doc_idx:
+        pivot += 1
+    return pivot
+
+
+BM25_ENGINES = {
+    "taat": term_at_a_time,
+    "wand": wand,
+    "bmw": block_max_wand,
+}
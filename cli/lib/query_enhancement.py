@@ -4,6 +4,8 @@ from typing import Optional
 from dotenv import load_dotenv
 from google import genai
 
+from .spell_correction import correct_spelling
+
 load_dotenv()
 api_key = os.getenv("gemini_api_key")
 client = genai.Client(api_key=api_key)
@@ -11,6 +13,11 @@ model = "gemini-2.0-flash"
 
 
 def spell_correct(query: str) -> str:
+    corrected, _ = correct_spelling(query, fallback=llm_spell_correct)
+    return corrected
+
+
+def llm_spell_correct(query: str) -> str:
     prompt = f"""Fix any spelling errors in this movie search query.
 
 Only correct obvious typos. Don't change correctly spelled words.
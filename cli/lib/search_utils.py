@@ -1,6 +1,6 @@
 import json
 import os
-from typing import Any
+from typing import Any, Iterator, TextIO
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "movies.json")
@@ -8,13 +8,60 @@ GOLDEN_DATASET_PATH = os.path.join(PROJECT_ROOT, "data", "golden_dataset.json")
 CACHE_DIR = os.path.join(PROJECT_ROOT, "cache")
 STOPWORDS_PATH = os.path.join(PROJECT_ROOT, "data", "stopwords.txt")
 MOVIE_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "movie_embeddings.npy")
+MOVIE_EMBEDDINGS_MANIFEST_PATH = os.path.join(CACHE_DIR, "movie_embeddings.json")
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embedding_cache")
 CHUNK_EMBEDDINGS_PATH = os.path.join(CACHE_DIR, "chunk_embeddings.npy")
 CHUNK_METADATA_PATH = os.path.join(CACHE_DIR, "chunk_metadata.json")
+CHUNK_ANN_INDEX_PATH = os.path.join(CACHE_DIR, "chunk_embeddings.ivf")
+KEYWORD_SEGMENTS_DIR = os.path.join(CACHE_DIR, "keyword_segments")
+KEYWORD_SHARDS_DIR = os.path.join(CACHE_DIR, "keyword_shards")
+QUERY_CACHE_DIR = os.path.join(CACHE_DIR, "query_cache")
+QUERY_EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "query_embeddings")
+SPELL_VOCABULARY_PATH = os.path.join(CACHE_DIR, "spell_vocabulary.json")
 
 DEFAULT_SEARCH_LIMIT = 5
 BM25_K1 = 1.5
 BM25_B = 0.75
+BM25F_TITLE_WEIGHT = 3.0
+BM25F_DESCRIPTION_WEIGHT = 1.0
+DEFAULT_STEM_CACHE_SIZE = 65536
+POSTING_BLOCK_SIZE = 64
+DEFAULT_BM25_ENGINE = "taat"
+DEFAULT_POSTING_CODEC = "raw"
+SEGMENT_MERGE_THRESHOLD = 8
+DEFAULT_SHARD_COUNT = 4
+INGEST_BATCH_SIZE = 1024
+EMBEDDING_BATCH_SIZE = 256
+DEFAULT_BUILD_WORKERS = 1
+BUILD_QUEUE_DEPTH = 2
 SEARCH_MULTIPLIER = 5
+BM25_BATCH_CELLS = 1 << 22
+SEMANTIC_BATCH_CELLS = 1 << 22
+TOP_K_BLOCK_SIZE = 1024
+PROXIMITY_WINDOW = 5
+PROXIMITY_CANDIDATE_MULTIPLIER = 10
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_DISK_ENTRIES = 10000
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+QUERY_EMBEDDING_DISK_ENTRIES = 65536
+AUTOCOMPLETE_SCAN_LIMIT = 4096
+AUTOCOMPLETE_PRECOMPUTED = 32
+SPELL_MAX_EDIT_DISTANCE = 2
+SPELL_PREFIX_LENGTH = 7
+SPELL_MIN_WORD_LENGTH = 3
+SPELL_DOMINANCE_RATIO = 2.0
+ANN_DEFAULT_NPROBE = 8
+ANN_KMEANS_ITERATIONS = 10
+ANN_TRAIN_POINTS_PER_LIST = 64
+ANN_SCORE_BLOCK_ROWS = 16384
+DEFAULT_EMBEDDING_STORAGE = "float32"
+DEFAULT_RECALL_TARGET = 0.99
+QUANTIZATION_CALIBRATION_QUERIES = 50
+QUANTIZATION_CALIBRATION_LIMIT = 10
+QUANTIZATION_MAX_MULTIPLIER = 256
+QUANTIZATION_BUILD_BLOCK_ROWS = 65536
+QUANTIZED_SCORE_BLOCK_ROWS = 512
+HAMMING_SCORE_BLOCK_ROWS = 65536
 
 DEFAULT_CHUNK_SIZE = 200
 DEFAULT_CHUNK_OVERLAP = 1
@@ -30,6 +77,106 @@ def load_movies() -> list[dict]:
         data = json.load(f)
     return data["movies"]
 
+def iter_movies(path: str = DATA_PATH) -> Iterator[dict]:
+    """
+    Yield movies one at a time without reading the whole catalog.
+
+    `.jsonl` files hold one movie per line; any other file is read as the
+    usual {"movies": [...]} document, decoding one array element at a time.
+    """
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _JsonArrayReader(f).iter_array("movies")
+
+
+class MovieCatalog:
+    """The movies of `path`, streamed by `iter_movies` anew on every iteration."""
+
+    def __init__(self, path: str = DATA_PATH) -> None:
+        self.path = path
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter_movies(self.path)
+
+
+class _JsonArrayReader:
+    """Incremental reader for one array member of a top-level JSON object."""
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 20) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def iter_array(self, key: str) -> Iterator[dict]:
+        self.__expect("{")
+        while True:
+            name = self.__decode()
+            self.__expect(":")
+            if name == key:
+                break
+            self.__decode()
+            self.__expect(",")
+
+        self.__expect("[")
+        if self.__peek() == "]":
+            return
+        while True:
+            yield self.__decode()
+            if self.__peek() == "]":
+                return
+            self.__expect(",")
+
+    def __peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.__fill():
+                break
+        if self.pos >= len(self.buffer):
+            raise ValueError("unexpected end of JSON input")
+        return self.buffer[self.pos]
+
+    def __expect(self, char: str) -> None:
+        found = self.__peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} in JSON input, found {found!r}")
+        self.pos += 1
+
+    def __decode(self) -> Any:
+        self.__peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # The value may continue past the buffer.
+                if not self.__fill():
+                    raise
+                continue
+            if end == len(self.buffer) and self.__fill():
+                # A number may have been cut in half; decode it again.
+                continue
+            self.pos = end
+            return value
+
+    def __fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+
 def load_golden_dataset() -> list[dict]:
     with open(GOLDEN_DATASET_PATH, "r") as f:
         data = json.load(f)
@@ -0,0 +1,439 @@
+"""
+Log-structured keyword index built from immutable InvertedIndex segments.
+
+Adding or updating movies writes a new small segment; deleting writes a
+tombstone. A manifest records the segments in sequence order and the
+tombstones:
+
+    {"next_seq": 4, "next_file": 5,
+     "segments": [{"file": "segment-000001.bin", "seq": 1}, ...],
+     "tombstones": {"42": 3}}
+
+A document in a segment is live unless a newer segment holds the same movie
+id, or a tombstone for its id was written after the segment (tombstone seq
+greater than the segment seq). Queries score every segment with collection
+statistics taken over the live documents only, so results equal those of a
+single index built from the live catalog. Merging rewrites segments into one
+without re-analyzing any text.
+
+Threads of one process are serialized by in-process locks. Separate
+processes, e.g. `segments-add` while another invocation's merge finishes,
+serialize on an flock of writer.lock held from loading the manifest until
+the last write (see `SegmentedIndex.writer`). Readers take no writer lock;
+instead `load` holds a shared flock of readers.lock, and a merge deletes the
+segments it replaced only under an exclusive one, so a reader never finds a
+segment of the manifest it read missing.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from .analyzer import Analyzer, get_analyzer
+from .index_format import DocumentStore, TermDictionary
+from .keyword_search import (
+    InvertedIndex,
+    analyzed_query_key,
+    bm25_idf,
+    bm25_length_norm,
+    bm25_tf,
+)
+from .query_cache import QUERY_CACHE, QueryCache
+from .query_engine import BM25_ENGINES, PostingList
+from .search_utils import (
+    DEFAULT_BM25_ENGINE,
+    DEFAULT_SEARCH_LIMIT,
+    KEYWORD_SEGMENTS_DIR,
+    SEGMENT_MERGE_THRESHOLD,
+    format_search_result,
+    load_movies,
+)
+
+WRITER_LOCK_FILE = "writer.lock"
+READERS_LOCK_FILE = "readers.lock"
+
+
+class Segment:
+    def __init__(self, file: str, seq: int, index: InvertedIndex) -> None:
+        self.file = file
+        self.seq = seq
+        self.index = index
+        self.live = np.ones(len(index.doc_ids), dtype=bool)
+        self.length_norms = np.empty(0, dtype=np.float64)
+
+
+class SegmentedIndex:
+    def __init__(
+        self,
+        directory: str = KEYWORD_SEGMENTS_DIR,
+        analyzer: Optional[Analyzer] = None,
+        merge_threshold: int = SEGMENT_MERGE_THRESHOLD,
+    ) -> None:
+        self.directory = directory
+        self.analyzer = analyzer or get_analyzer()
+        self.merge_threshold = merge_threshold
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.writer_lock_path = os.path.join(directory, WRITER_LOCK_FILE)
+        self.readers_lock_path = os.path.join(directory, READERS_LOCK_FILE)
+        self.segments: list[Segment] = []
+        self.tombstones: dict[int, int] = {}
+        self.next_seq = 1
+        self.next_file = 1
+        self.doc_count = 0
+        self.avg_doc_length = 0.0
+        self.lock = threading.RLock()
+        self.merge_lock = threading.Lock()
+        self.merge_thread: Optional[threading.Thread] = None
+
+    def load(self) -> None:
+        with self.lock:
+            if not os.path.exists(self.manifest_path):
+                return
+            with self.__readers_lock(fcntl.LOCK_SH):
+                with open(self.manifest_path, "r") as f:
+                    manifest = json.load(f)
+                self.next_seq = manifest["next_seq"]
+                self.next_file = manifest["next_file"]
+                self.tombstones = {
+                    int(doc_id): seq for doc_id, seq in manifest["tombstones"].items()
+                }
+                self.segments = [
+                    Segment(entry["file"], entry["seq"], self.__load_segment(entry["file"]))
+                    for entry in manifest["segments"]
+                ]
+                self.__refresh()
+
+    @contextmanager
+    def writer(self) -> Iterator[None]:
+        """
+        Hold the cross-process writer lock. Load inside it and wait for any
+        background merge before leaving, so the manifest read-modify-write
+        of one process never interleaves with another's.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.writer_lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+                if self.merge_thread is not None:
+                    self.merge_thread.join()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def data_paths(self) -> list[str]:
+        """The manifest and the segments it lists on disk, for cache generations."""
+        if not os.path.exists(self.manifest_path):
+            return [self.manifest_path]
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        return [self.manifest_path] + [
+            os.path.join(self.directory, entry["file"]) for entry in manifest["segments"]
+        ]
+
+    @contextmanager
+    def __readers_lock(self, operation: int) -> Iterator[None]:
+        with open(self.readers_lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add_documents(self, movies: Iterable[dict]) -> int:
+        """
+        Add or replace movies by writing them as a new segment. Returns the
+        number of distinct movie ids written.
+        """
+        # Within one batch the last version of a movie wins.
+        batch = list({m["id"]: m for m in movies}.values())
+        if not batch:
+            return 0
+        index = InvertedIndex(analyzer=self.analyzer)
+        index.build(batch)
+        with self.lock:
+            file = self.__write_segment(index)
+            self.segments.append(Segment(file, self.next_seq, index))
+            self.next_seq += 1
+            self.__save_manifest()
+            self.__refresh()
+        self.__maybe_merge()
+        return len(batch)
+
+    def update_documents(self, movies: Iterable[dict]) -> int:
+        return self.add_documents(movies)
+
+    def delete_documents(self, doc_ids: Iterable[int]) -> None:
+        with self.lock:
+            for doc_id in doc_ids:
+                self.tombstones[doc_id] = self.next_seq
+            self.__save_manifest()
+            self.__refresh()
+
+    def merge(self) -> None:
+        """Merge every current segment into one, dropping dead documents."""
+        with self.merge_lock:
+            self.__merge()
+
+    def __merge(self) -> None:
+        with self.lock:
+            merging = list(self.segments)
+            merged_tombstones = dict(self.tombstones)
+        if len(merging) < 2:
+            return
+
+        # Adds and deletes may continue while the merge runs; they only
+        # append segments or tombstones, which are kept below.
+        index = merge_segments(merging, self.analyzer)
+        with self.lock:
+            file = self.__write_segment(index)
+            merged = Segment(file, merging[-1].seq, index)
+            newer = self.segments[len(merging) :]
+            self.segments = [merged] + newer
+            # Tombstones the merge already applied only affect merged segments.
+            for doc_id, seq in merged_tombstones.items():
+                if self.tombstones.get(doc_id) == seq and seq <= merged.seq + 1:
+                    del self.tombstones[doc_id]
+            self.__save_manifest()
+            self.__refresh()
+            # Readers still loading the old manifest need its segments.
+            with self.__readers_lock(fcntl.LOCK_EX):
+                for segment in merging:
+                    os.remove(os.path.join(self.directory, segment.file))
+
+    def start_background_merge(self) -> threading.Thread:
+        """Run `merge` in a background thread, unless one is already running."""
+        with self.lock:
+            if self.merge_thread is None or not self.merge_thread.is_alive():
+                self.merge_thread = threading.Thread(target=self.merge)
+                self.merge_thread.start()
+            return self.merge_thread
+
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        proximity_weight: float = 0.0,
+    ) -> list[dict]:
+        """
+        Rank live documents by BM25. Segments are built without positions,
+        so, as on an InvertedIndex without them, quoted phrases match as
+        plain terms and proximity scoring is refused.
+        """
+        if engine not in BM25_ENGINES:
+            raise ValueError(f"unknown BM25 engine: {engine}")
+        if proximity_weight > 0:
+            raise ValueError("proximity scoring needs an index built with positions")
+        with self.lock:
+            segments = list(self.segments)
+            doc_count = self.doc_count
+
+        bases = np.cumsum([0] + [len(s.index.doc_ids) for s in segments])
+        posting_lists = []
+        for token in self.analyzer.tokenize(query):
+            per_segment = []
+            for base, segment in zip(bases, segments):
+                doc_idxs, tfs = segment.index.get_postings(token)
+                live = segment.live[doc_idxs]
+                per_segment.append((base, segment, doc_idxs[live], tfs[live]))
+            df = sum(len(doc_idxs) for _, _, doc_idxs, _ in per_segment)
+            idf = bm25_idf(doc_count, df)
+            doc_idxs = []
+            scores = []
+            for base, segment, seg_doc_idxs, tfs in per_segment:
+                doc_idxs.extend((seg_doc_idxs.astype(np.int64) + base).tolist())
+                scores.extend(
+                    (bm25_tf(tfs, segment.length_norms[seg_doc_idxs]) * idf).tolist()
+                )
+            posting_lists.append(PostingList(doc_idxs, scores))
+        ranked = BM25_ENGINES[engine](posting_lists, limit)
+
+        if len(ranked) < limit:
+            # Same deep-list padding as InvertedIndex.bm25_search.
+            matched = {doc_idx for doc_idx, _ in ranked}
+            for base, segment in zip(bases, segments):
+                for local_idx in np.flatnonzero(segment.live).tolist():
+                    if len(ranked) >= limit:
+                        break
+                    if base + local_idx not in matched:
+                        ranked.append((int(base + local_idx), 0.0))
+
+        results = []
+        for doc_idx, score in ranked:
+            segment_idx = int(np.searchsorted(bases, doc_idx, side="right")) - 1
+            doc = segments[segment_idx].index.documents[doc_idx - int(bases[segment_idx])]
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=score,
+                )
+            )
+        return results
+
+    def __refresh(self) -> None:
+        """Recompute live masks and the collection statistics over them."""
+        tombstone_ids = np.array(list(self.tombstones), dtype=np.int64)
+        tombstone_seqs = np.array(list(self.tombstones.values()), dtype=np.int64)
+        newer_ids = np.empty(0, dtype=np.int64)
+        for segment in reversed(self.segments):
+            doc_ids = np.asarray(segment.index.doc_ids)
+            deleted = tombstone_ids[tombstone_seqs > segment.seq]
+            segment.live = ~(np.isin(doc_ids, newer_ids) | np.isin(doc_ids, deleted))
+            newer_ids = np.concatenate([newer_ids, doc_ids])
+
+        self.doc_count = sum(int(s.live.sum()) for s in self.segments)
+        total_length = sum(int(s.index.doc_lengths[s.live].sum()) for s in self.segments)
+        self.avg_doc_length = total_length / self.doc_count if self.doc_count else 0.0
+        for segment in self.segments:
+            segment.length_norms = bm25_length_norm(
+                segment.index.doc_lengths, self.avg_doc_length
+            )
+
+    def __maybe_merge(self) -> None:
+        if len(self.segments) > self.merge_threshold:
+            self.start_background_merge()
+
+    def __load_segment(self, file: str) -> InvertedIndex:
+        index = InvertedIndex(analyzer=self.analyzer)
+        index.index_path = os.path.join(self.directory, file)
+        index.load()
+        return index
+
+    def __write_segment(self, index: InvertedIndex) -> str:
+        file = f"segment-{self.next_file:06d}.bin"
+        self.next_file += 1
+        index.index_path = os.path.join(self.directory, file)
+        index.save()
+        return file
+
+    def __save_manifest(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {
+            "next_seq": self.next_seq,
+            "next_file": self.next_file,
+            "segments": [{"file": s.file, "seq": s.seq} for s in self.segments],
+            "tombstones": {str(doc_id): seq for doc_id, seq in self.tombstones.items()},
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def merge_segments(segments: list[Segment], analyzer: Analyzer) -> InvertedIndex:
+    """
+    Combine the live documents of `segments` into one index, reusing their
+    postings instead of re-tokenizing.
+    """
+    all_terms = sorted(set().union(*(set(s.index.terms) for s in segments)))
+    global_term_ids = {term: term_id for term_id, term in enumerate(all_terms)}
+
+    posting_terms, posting_doc_idxs, posting_tfs = [], [], []
+    doc_ids, doc_lengths, documents = [], [], []
+    base = 0
+    for segment in segments:
+        index = segment.index
+        live = segment.live
+        new_doc_idxs = np.where(live, np.cumsum(live) - 1 + base, -1)
+        local_to_global = np.array(
+            [global_term_ids[term] for term in index.terms], dtype=np.int64
+        )
+        seg_doc_idxs, seg_tfs = index.get_posting_arrays()
+        terms = np.repeat(local_to_global, np.diff(index.posting_offsets))
+        remapped = new_doc_idxs[seg_doc_idxs]
+        keep = remapped >= 0
+        posting_terms.append(terms[keep])
+        posting_doc_idxs.append(remapped[keep])
+        posting_tfs.append(seg_tfs[keep])
+
+        live_idxs = np.flatnonzero(live)
+        doc_ids.append(np.asarray(index.doc_ids)[live_idxs])
+        doc_lengths.append(np.asarray(index.doc_lengths)[live_idxs])
+        documents.extend(index.documents[i] for i in live_idxs.tolist())
+        base += len(live_idxs)
+
+    terms = np.concatenate(posting_terms)
+    doc_idxs = np.concatenate(posting_doc_idxs)
+    tfs = np.concatenate(posting_tfs)
+    order = np.lexsort((doc_idxs, terms))
+    terms, doc_idxs, tfs = terms[order], doc_idxs[order], tfs[order]
+
+    # Terms whose every posting was deleted are dropped from the dictionary.
+    counts = np.bincount(terms, minlength=len(all_terms))
+    kept_terms = np.flatnonzero(counts)
+
+    merged = InvertedIndex(analyzer=analyzer)
+    merged.terms = TermDictionary.from_terms([all_terms[i] for i in kept_terms.tolist()])
+    merged.posting_offsets = np.zeros(len(kept_terms) + 1, dtype=np.int64)
+    np.cumsum(counts[kept_terms], out=merged.posting_offsets[1:])
+    merged.posting_doc_idxs = doc_idxs.astype(np.int32)
+    merged.posting_tfs = tfs.astype(np.int32)
+    merged.doc_ids = np.concatenate(doc_ids).astype(np.int64)
+    merged.doc_lengths = np.concatenate(doc_lengths).astype(np.int32)
+    merged.documents = DocumentStore.from_documents(documents)
+    merged.compute_bm25_stats()
+    return merged
+
+
+def segments_build_command() -> None:
+    """Start a fresh segmented index holding the whole catalog."""
+    idx = SegmentedIndex()
+    with idx.writer():
+        for file in os.listdir(idx.directory):
+            if file not in (WRITER_LOCK_FILE, READERS_LOCK_FILE):
+                os.remove(os.path.join(idx.directory, file))
+        idx.add_documents(load_movies())
+
+
+def segments_add_command(path: str) -> int:
+    with open(path, "r") as f:
+        data = json.load(f)
+    movies = data["movies"] if isinstance(data, dict) else data
+    idx = SegmentedIndex()
+    with idx.writer():
+        idx.load()
+        return idx.add_documents(movies)
+
+
+def segments_delete_command(doc_ids: list[int]) -> None:
+    idx = SegmentedIndex()
+    with idx.writer():
+        idx.load()
+        idx.delete_documents(doc_ids)
+
+
+def segments_merge_command() -> int:
+    idx = SegmentedIndex()
+    with idx.writer():
+        idx.load()
+        idx.merge()
+    return len(idx.segments)
+
+
+def segments_bm25search_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    engine: str = DEFAULT_BM25_ENGINE,
+    proximity_weight: float = 0.0,
+    cache: QueryCache = QUERY_CACHE,
+) -> list[dict]:
+    idx = SegmentedIndex()
+
+    def search() -> list[dict]:
+        idx.load()
+        return idx.bm25_search(query, limit, engine, proximity_weight)
+
+    return cache.get_or_compute(
+        "bm25-segmented",
+        analyzed_query_key(idx.analyzer, query),
+        {"limit": limit, "proximity_weight": proximity_weight},
+        idx.data_paths(),
+        search,
+    )
@@ -2,16 +2,29 @@
 Semantic search module using sentence transformers for embedding-based search.
 """
 
+import json
 import re
-from sentence_transformers import SentenceTransformer
+from collections.abc import Sequence
+from itertools import batched
 import numpy as np
 import os
 
+from .embedding_cache import EmbeddingCache, content_hash, content_hasher, text_key
+from .embedding_store import EmbeddingWriter, load_normalized
+from .quantization import EMBEDDING_STORAGE_MODES, QuantizedEmbeddings, rescore
+from .query_embedding_cache import QUERY_EMBEDDING_CACHE
+from .vector_search import cosine_scores, normalize_rows, top_k_indices
 from .search_utils import (
     DEFAULT_CHUNK_SIZE,
     DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_EMBEDDING_STORAGE,
+    DEFAULT_RECALL_TARGET,
     DEFAULT_SEMANTIC_CHUNK_SIZE,
+    EMBEDDING_BATCH_SIZE,
+    MOVIE_EMBEDDINGS_MANIFEST_PATH,
     MOVIE_EMBEDDINGS_PATH,
+    SEMANTIC_BATCH_CELLS,
+    MovieCatalog,
     load_movies
 )
 
@@ -21,60 +34,168 @@ class SemanticSearch:
     semantically similar content.
     """
     
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name="all-MiniLM-L6-v2",
+        storage=DEFAULT_EMBEDDING_STORAGE,
+        recall_target=DEFAULT_RECALL_TARGET,
+    ):
+        """
+        `storage` is "float32" to score the embeddings exactly, or a
+        quantization mode ("float16", "int8", "binary") to score a quantized
+        copy and rescore a shortlist, sized for `recall_target`, at full
+        precision.
+
+        The encoder is loaded on first use, so commands that only read
+        saved embeddings start without it.
+        """
+        if storage not in EMBEDDING_STORAGE_MODES:
+            raise ValueError(f"unknown embedding storage: {storage}")
+        self.model_name = model_name
+        self.__model = None
+        self.__embedding_cache = None
+        self.query_embedding_cache = QUERY_EMBEDDING_CACHE
         self.embeddings = None
         self.documents = None
         self.document_map = {}
+        self.storage = storage
+        self.recall_target = recall_target
+        self.quantized = None
+
+
+    @property
+    def model(self):
+        if self.__model is None:
+            # Imported here: importing the library and torch takes seconds.
+            from sentence_transformers import SentenceTransformer
+
+            self.__model = SentenceTransformer(self.model_name)
+        return self.__model
+
+
+    @property
+    def embedding_cache(self):
+        """Embeddings of every text this model encoded in a build, by content."""
+        if self.__embedding_cache is None:
+            self.__embedding_cache = EmbeddingCache(self.model_name)
+        return self.__embedding_cache
+
+
+    def encode_cached(self, texts):
+        """Normalized embeddings of `texts`; only texts never built before reach the model."""
+        return self.embedding_cache.embed(texts, lambda missing: self.model.encode(missing))
 
 
     def generate_embedding(self, text):
         if not text or not text.strip():
             raise ValueError("cannot generate embedding for empty text")
         
-        return self.model.encode([text])[0]
+        return self.query_embedding_cache.get_or_compute(
+            self.model_name, text, lambda query: self.model.encode([query])[0]
+        )
+
+
+    def generate_embeddings(self, texts):
+        """Embeddings of `texts`, one row each, with the misses encoded in one batch."""
+        for text in texts:
+            if not text or not text.strip():
+                raise ValueError("cannot generate embedding for empty text")
 
+        return self.query_embedding_cache.get_or_compute_many(
+            self.model_name, texts, lambda queries: self.model.encode(queries)
+        )
 
-    def build_embeddings(self, documents):
+
+    def build_embeddings(self, documents, batch_size=EMBEDDING_BATCH_SIZE):
         """
-        Build embeddings for a list of movie documents.
-        
+        Build embeddings for movie documents.
+
+        Documents are encoded `batch_size` at a time and every batch is
+        flushed to disk, so any iterable (e.g. `iter_movies()`) can be
+        embedded with bounded memory. Texts embedded by earlier builds come
+        from the embedding cache instead of the model.
+
+        A list of documents is kept for `search`, as `load_or_create_embeddings`
+        does. A one-shot iterable cannot be kept, so searching after building
+        from one needs `load_or_create_embeddings` with the documents.
+
         Args:
-            documents: List of dictionaries, each representing a movie with 'id', 'title', and 'description'
-        
+            documents: Iterable of dictionaries, each representing a movie with 'id', 'title', and 'description'
+            batch_size: Number of documents encoded per batch
+
         Returns:
-            The generated embeddings as a numpy array
+            The generated embeddings, L2-normalized, as a read-only
+            memory-mapped numpy array
         """
-                
-        self.documents = documents
-        self.document_map = {}
-        movie_strings = []
-
-        for doc in documents:
-            self.document_map[doc['id']] = doc
-            movie_strings.append(f"{doc['title']}: {doc['description']}")
-        
-        self.embeddings = self.model.encode(movie_strings, show_progress_bar=True)
-
-        os.makedirs(os.path.dirname(MOVIE_EMBEDDINGS_PATH), exist_ok=True)
-        np.save(MOVIE_EMBEDDINGS_PATH, self.embeddings)
+        self.set_documents(documents)
+        hasher = content_hasher(self.model_name)
+        with EmbeddingWriter(MOVIE_EMBEDDINGS_PATH) as writer:
+            for batch in batched(documents, batch_size):
+                movie_strings = [movie_text(doc) for doc in batch]
+                for movie_string in movie_strings:
+                    hasher.update(text_key(movie_string))
+                writer.write(self.encode_cached(movie_strings))
+        with open(MOVIE_EMBEDDINGS_MANIFEST_PATH, 'w') as f:
+            json.dump({"model": self.model_name, "content_hash": hasher.hexdigest()}, f)
+
+        self.embeddings = np.load(MOVIE_EMBEDDINGS_PATH, mmap_mode="r")
+        self.quantized = self.load_quantized(MOVIE_EMBEDDINGS_PATH)
         return self.embeddings
 
 
-    def load_or_create_embeddings(self, documents):
+    def set_documents(self, documents):
+        """
+        Keep `documents` for search if it is a sequence; otherwise forget
+        any earlier documents, which no longer match the embeddings.
+        """
+        if not isinstance(documents, Sequence):
+            self.documents = None
+            self.document_map = {}
+            return
+
         self.documents = documents
         self.document_map = {}
 
         for doc in documents:
             self.document_map[doc['id']] = doc
 
-        if os.path.exists(MOVIE_EMBEDDINGS_PATH):
-            self.embeddings = np.load(MOVIE_EMBEDDINGS_PATH)
 
-            if len(self.embeddings) == len(documents):
-                return self.embeddings
+    def load_or_create_embeddings(self, documents):
+        """
+        Load the saved embeddings if they match `documents`, else build them.
+        `documents` is read once to check and again to build, so it must be
+        re-iterable, e.g. a list or a `MovieCatalog`, which streams from disk
+        on every pass; a one-shot iterator such as `iter_movies()` can only
+        go to `build_embeddings`.
+        """
+        if iter(documents) is documents:
+            raise TypeError("load_or_create_embeddings needs re-iterable documents, not an iterator")
+        self.set_documents(documents)
+
+        if os.path.exists(MOVIE_EMBEDDINGS_PATH) and self.__movie_embeddings_current(documents):
+            self.embeddings = load_normalized(MOVIE_EMBEDDINGS_PATH)
+            self.quantized = self.load_quantized(MOVIE_EMBEDDINGS_PATH)
+            return self.embeddings
         
         return self.build_embeddings(documents)
+
+
+    def __movie_embeddings_current(self, documents):
+        """Whether the saved embeddings were built by this model from exactly these texts."""
+        if not os.path.exists(MOVIE_EMBEDDINGS_MANIFEST_PATH):
+            return False
+        with open(MOVIE_EMBEDDINGS_MANIFEST_PATH, 'r') as f:
+            manifest = json.load(f)
+        return manifest["model"] == self.model_name and manifest["content_hash"] == content_hash(
+            self.model_name, (movie_text(doc) for doc in documents)
+        )
+
+
+    def load_quantized(self, embeddings_path):
+        """The quantized copy of `embeddings_path` for this storage mode, or None for float32."""
+        if self.storage == "float32":
+            return None
+        return QuantizedEmbeddings.load_or_build(embeddings_path, self.storage, self.recall_target)
     
 
     def search(self, query, limit):
@@ -83,20 +204,14 @@ class SemanticSearch:
 
         if self.documents is None or len(self.documents) == 0:
             raise ValueError(
-                "No documents loaded. Call `load_or_create_embeddings` first."
+                "No documents loaded. Build from a list of documents or call `load_or_create_embeddings` first."
             )
         
         query_embedding = self.generate_embedding(query)
-        
-        similarities = []
-        for i, doc_embedding in enumerate(self.embeddings):
-            similarity = cosine_similarity(query_embedding, doc_embedding)
-            similarities.append((similarity, self.documents[i]))
-            
-        similarities.sort(key=lambda x: x[0], reverse=True)
 
         results = []
-        for score, doc in similarities[:limit]:
+        for i, score in self.rank(query_embedding, limit):
+            doc = self.documents[i]
             results.append({
                 'score': score,
                 'title': doc['title'],
@@ -105,15 +220,73 @@ class SemanticSearch:
         
         return results
 
-def cosine_similarity(vec1, vec2):
-    dot_product = np.dot(vec1, vec2)
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
 
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
+    def search_many(self, queries, limit):
+        """`search` for every query, with one batched encode and scoring pass."""
+        if self.embeddings is None or self.embeddings.size == 0:
+            raise ValueError("No embeddings loaded. Call `load_or_create_embeddings` first.")
+
+        if self.documents is None or len(self.documents) == 0:
+            raise ValueError(
+                "No documents loaded. Build from a list of documents or call `load_or_create_embeddings` first."
+            )
+        if not queries:
+            return []
+
+        query_embeddings = self.generate_embeddings(queries)
+
+        batch_results = []
+        for ranked in self.rank_many(query_embeddings, limit):
+            results = []
+            for i, score in ranked:
+                doc = self.documents[i]
+                results.append({
+                    'score': score,
+                    'title': doc['title'],
+                    'description': doc['description']
+                })
+            batch_results.append(results)
+
+        return batch_results
+
+
+    def rank(self, query_embedding, limit):
+        """Return the (doc_idx, score) of the `limit` documents closest to `query_embedding`."""
+        if self.quantized is None:
+            scores = cosine_scores(self.embeddings, query_embedding)
+            return [(int(i), scores[i]) for i in top_k_indices(scores, limit)]
+
+        shortlist = top_k_indices(
+            self.quantized.scores(query_embedding), self.quantized.shortlist_size(limit)
+        )
+        rows, scores = rescore(self.embeddings, query_embedding, shortlist)
+        return [(int(rows[i]), scores[i]) for i in top_k_indices(scores, limit)]
+
+
+    def rank_many(self, query_embeddings, limit):
+        """
+        `rank` for every row of `query_embeddings`. Exact scoring is one
+        matrix product per block of queries, each block holding at most
+        SEMANTIC_BATCH_CELLS scores, cut to the top `limit` per row.
+        Quantized storage scores per query. Scores can differ from `rank`
+        in the last bits, which may swap near-ties.
+        """
+        if self.quantized is not None:
+            return [self.rank(query_embedding, limit) for query_embedding in query_embeddings]
+
+        queries = normalize_rows(query_embeddings)
+        block_size = max(1, SEMANTIC_BATCH_CELLS // max(len(self.embeddings), 1))
+        ranked = []
+        for start in range(0, len(queries), block_size):
+            block_scores = queries[start : start + block_size] @ self.embeddings.T
+            for scores in block_scores:
+                ranked.append([(int(i), scores[i]) for i in top_k_indices(scores, limit)])
+        return ranked
+
+def movie_text(doc):
+    """The text embedded for a movie."""
+    return f"{doc['title']}: {doc['description']}"
 
-    return dot_product / (norm1 * norm2)
 
 def verify_model():
     """
@@ -139,9 +312,8 @@ def embed_text(text):
 
 def verify_embeddings():
     search = SemanticSearch()
-    movies = load_movies()
-    embeddings = search.load_or_create_embeddings(movies)
-    print(f"Number of docs:   {len(movies)}")
+    embeddings = search.load_or_create_embeddings(MovieCatalog())
+    print(f"Number of docs:   {embeddings.shape[0]}")
     print(f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
 
 
@@ -153,8 +325,8 @@ def embed_query_text(query):
     print(f"Shape: {embedding.shape}")
 
 
-def semantic_search(query, limit):
-    search = SemanticSearch()
+def semantic_search(query, limit, storage=DEFAULT_EMBEDDING_STORAGE):
+    search = SemanticSearch(storage=storage)
     movies = load_movies()
     search.load_or_create_embeddings(movies)
 
@@ -0,0 +1,273 @@
+"""
+Keyword index partitioned across shards and queried scatter-gather.
+
+The movie at catalog position p lives in shard p % shard_count as local
+doc_idx p // shard_count, so a document's global doc_idx is
+
+    local_doc_idx * shard_count + shard
+
+Every shard is an ordinary InvertedIndex file whose IDF, average document
+length and length norms were computed over the whole collection, so a
+shard scores its documents exactly as the unsharded index would. A query is
+sent to every shard in a pool of worker processes; the per-shard top-k
+lists come back sorted by (-score, global doc_idx) and are k-way merged.
+Like InvertedIndex.bm25_search, results are padded with 0.0-score documents
+in global index order.
+
+With a proximity weight, the shards return plain BM25 candidates, the merge
+keeps the global top limit * PROXIMITY_CANDIDATE_MULTIPLIER of them, and
+only those are sent back to their shards for proximity scores, so the same
+candidates are rescored as in the unsharded index.
+
+    cache/keyword_shards/manifest.json   {"shard_count": 4, "doc_count": ...}
+    cache/keyword_shards/shard-000.bin   ...
+"""
+
+import heapq
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .analyzer import get_analyzer
+from .keyword_search import InvertedIndex, analyzed_query_key
+from .query_cache import QUERY_CACHE, QueryCache
+from .query_engine import BM25_ENGINES
+from .search_utils import (
+    DEFAULT_BM25_ENGINE,
+    DEFAULT_POSTING_CODEC,
+    DEFAULT_SEARCH_LIMIT,
+    DEFAULT_SHARD_COUNT,
+    KEYWORD_SHARDS_DIR,
+    PROXIMITY_CANDIDATE_MULTIPLIER,
+    format_search_result,
+    iter_movies,
+)
+
+
+class ShardedIndex:
+    def __init__(
+        self, directory: str = KEYWORD_SHARDS_DIR, workers: Optional[int] = None
+    ) -> None:
+        """
+        `workers` is the size of the query process pool, one per shard by
+        default; 0 queries the shards one after another in this process.
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.workers = workers
+        self.shard_count = 0
+        self.doc_count = 0
+        self.shards: list[InvertedIndex] = []
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def build(
+        self,
+        shard_count: int = DEFAULT_SHARD_COUNT,
+        movies: Optional[Iterable[dict]] = None,
+        posting_codec: str = DEFAULT_POSTING_CODEC,
+        positions: bool = False,
+    ) -> None:
+        if movies is None:
+            # One streaming pass over the catalog per shard, so no shard's
+            # movies are ever collected in a list.
+            partitions = [
+                islice(iter_movies(), shard_idx, None, shard_count)
+                for shard_idx in range(shard_count)
+            ]
+        else:
+            partitions = [[] for _ in range(shard_count)]
+            for position, movie in enumerate(movies):
+                partitions[position % shard_count].append(movie)
+
+        shards = []
+        for partition in partitions:
+            shard = InvertedIndex()
+            shard.build(partition, positions=positions)
+            shards.append(shard)
+
+        # Collection statistics over all shards, as one index would see them.
+        doc_count = sum(len(shard.doc_ids) for shard in shards)
+        total_length = sum(int(shard.doc_lengths.sum()) for shard in shards)
+        avg_doc_length = total_length / doc_count if doc_count else 0.0
+        doc_freqs = Counter()
+        for shard in shards:
+            doc_freqs.update(dict(zip(shard.terms, np.diff(shard.posting_offsets).tolist())))
+
+        os.makedirs(self.directory, exist_ok=True)
+        for file in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, file))
+        for shard_idx, shard in enumerate(shards):
+            shard.compute_bm25_stats(
+                doc_count,
+                avg_doc_length,
+                np.array([doc_freqs[term] for term in shard.terms], dtype=np.int64),
+            )
+            shard.index_path = self.__shard_path(shard_idx)
+            shard.save(posting_codec)
+
+        with open(self.manifest_path, "w") as f:
+            json.dump({"shard_count": shard_count, "doc_count": doc_count}, f)
+        self.shard_count = shard_count
+        self.doc_count = doc_count
+        self.shards = shards
+
+    def load(self) -> None:
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        self.shard_count = manifest["shard_count"]
+        self.doc_count = manifest["doc_count"]
+        self.shards = []
+        for shard_idx in range(self.shard_count):
+            shard = InvertedIndex()
+            shard.index_path = self.__shard_path(shard_idx)
+            shard.load()
+            self.shards.append(shard)
+
+    def data_paths(self) -> list[str]:
+        """The manifest and the shards it lists on disk, for cache generations."""
+        if not os.path.exists(self.manifest_path):
+            return [self.manifest_path]
+        with open(self.manifest_path, "r") as f:
+            shard_count = json.load(f)["shard_count"]
+        return [self.manifest_path] + [self.__shard_path(i) for i in range(shard_count)]
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> "ShardedIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        proximity_weight: float = 0.0,
+    ) -> list[dict]:
+        results = []
+        for doc_idx, score in self.bm25_rank(query, limit, engine, proximity_weight):
+            doc = self.shards[doc_idx % self.shard_count].documents[doc_idx // self.shard_count]
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=score,
+                )
+            )
+        return results
+
+    def bm25_rank(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        engine: str = DEFAULT_BM25_ENGINE,
+        proximity_weight: float = 0.0,
+    ) -> list[tuple[int, float]]:
+        """Scatter `query` to every shard and merge their top `limit` lists."""
+        if engine not in BM25_ENGINES:
+            raise ValueError(f"unknown BM25 engine: {engine}")
+        candidate_limit = limit
+        if proximity_weight > 0:
+            candidate_limit = limit * PROXIMITY_CANDIDATE_MULTIPLIER
+        shard_rankings = self.__map_shards(
+            "bm25_rank", [(query, candidate_limit, engine)] * self.shard_count
+        )
+
+        # Each shard pads its own list with its lowest unmatched documents,
+        # which include every document the global padding can need, and a
+        # shard's local order is its global order.
+        merged = heapq.merge(
+            *(
+                [(-score, doc_idx * self.shard_count + shard_idx) for doc_idx, score in ranked]
+                for shard_idx, ranked in enumerate(shard_rankings)
+            )
+        )
+        ranked = [
+            (doc_idx, -neg_score) for neg_score, doc_idx in islice(merged, candidate_limit)
+        ]
+        if proximity_weight <= 0:
+            return ranked
+
+        shard_candidates = [[] for _ in range(self.shard_count)]
+        for doc_idx, _ in ranked:
+            shard_candidates[doc_idx % self.shard_count].append(doc_idx // self.shard_count)
+        shard_proximity = self.__map_shards(
+            "query_proximity_scores",
+            [(query, np.array(local_idxs, dtype=np.int64)) for local_idxs in shard_candidates],
+        )
+        # Every shard's scores are in the order its candidates were ranked.
+        bonuses = [iter(proximity.tolist()) for proximity in shard_proximity]
+        rescored = [
+            (doc_idx, score + proximity_weight * next(bonuses[doc_idx % self.shard_count]))
+            for doc_idx, score in ranked
+        ]
+        rescored.sort(key=lambda item: (-item[1], item[0]))
+        return rescored[:limit]
+
+    def __map_shards(self, method: str, shard_args: list[tuple]) -> list:
+        """Call InvertedIndex `method` on every shard with its `shard_args`, in shard order."""
+        if self.workers == 0:
+            return [
+                getattr(shard, method)(*args) for shard, args in zip(self.shards, shard_args)
+            ]
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers or self.shard_count)
+        paths = [self.__shard_path(shard_idx) for shard_idx in range(self.shard_count)]
+        return list(self.executor.map(_call_shard, paths, [method] * len(paths), shard_args))
+
+    def __shard_path(self, shard_idx: int) -> str:
+        return os.path.join(self.directory, f"shard-{shard_idx:03d}.bin")
+
+
+# Shards opened by this worker process, by path.
+_worker_shards: dict[str, InvertedIndex] = {}
+
+
+def _call_shard(path: str, method: str, args: tuple):
+    shard = _worker_shards.get(path)
+    if shard is None:
+        shard = InvertedIndex()
+        shard.index_path = path
+        shard.load()
+        _worker_shards[path] = shard
+    return getattr(shard, method)(*args)
+
+
+def shards_build_command(
+    shard_count: int = DEFAULT_SHARD_COUNT,
+    posting_codec: str = DEFAULT_POSTING_CODEC,
+    positions: bool = False,
+) -> None:
+    ShardedIndex().build(shard_count, posting_codec=posting_codec, positions=positions)
+
+
+def shards_bm25search_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    engine: str = DEFAULT_BM25_ENGINE,
+    proximity_weight: float = 0.0,
+    cache: QueryCache = QUERY_CACHE,
+) -> list[dict]:
+    def search() -> list[dict]:
+        with ShardedIndex() as idx:
+            idx.load()
+            return idx.bm25_search(query, limit, engine, proximity_weight)
+
+    return cache.get_or_compute(
+        "bm25-sharded",
+        analyzed_query_key(get_analyzer(), query),
+        {"limit": limit, "proximity_weight": proximity_weight},
+        ShardedIndex().data_paths(),
+        search,
+    )
@@ -0,0 +1,252 @@
+"""
+Local spelling correction over the catalog vocabulary.
+
+Uses symmetric delete lookup (SymSpell): every vocabulary word is indexed
+under all strings obtained by deleting up to SPELL_MAX_EDIT_DISTANCE
+characters from its first SPELL_PREFIX_LENGTH characters. A misspelled word
+generates its own deletes the same way, and any shared delete is a candidate
+that only needs an exact edit distance check. A lookup touches a few dozen
+dict entries instead of the whole vocabulary.
+
+The vocabulary holds the lower-cased, unstemmed words of movie titles and
+descriptions with their counts. It is cached next to the index, stamped with
+the generation of the movie data it was read from.
+"""
+
+import json
+import os
+import string
+from collections import Counter, defaultdict
+from typing import Callable, Iterable, Optional
+
+from .analyzer import Analyzer, get_analyzer
+from .query_cache import file_generation
+from .search_utils import (
+    DATA_PATH,
+    SPELL_DOMINANCE_RATIO,
+    SPELL_MAX_EDIT_DISTANCE,
+    SPELL_MIN_WORD_LENGTH,
+    SPELL_PREFIX_LENGTH,
+    SPELL_VOCABULARY_PATH,
+    iter_movies,
+)
+
+
+class SymSpell:
+    def __init__(
+        self,
+        word_counts: dict[str, int],
+        max_edit_distance: int = SPELL_MAX_EDIT_DISTANCE,
+        prefix_length: int = SPELL_PREFIX_LENGTH,
+        analyzer: Optional[Analyzer] = None,
+    ) -> None:
+        self.word_counts = word_counts
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.analyzer = analyzer or get_analyzer()
+        self.deletes: dict[str, list[str]] = defaultdict(list)
+        for word in word_counts:
+            for delete in self.__prefix_deletes(word):
+                self.deletes[delete].append(word)
+
+    @classmethod
+    def from_movies(
+        cls, movies: Optional[Iterable[dict]] = None, analyzer: Optional[Analyzer] = None
+    ) -> "SymSpell":
+        analyzer = analyzer or get_analyzer()
+        if movies is None:
+            movies = iter_movies()
+        counts = Counter()
+        for movie in movies:
+            counts.update(analyzer.preprocess(f"{movie['title']} {movie['description']}").split())
+        return cls(dict(counts), analyzer=analyzer)
+
+    @classmethod
+    def load_or_build(cls, path: str = SPELL_VOCABULARY_PATH) -> "SymSpell":
+        """Load the cached vocabulary, rebuilding it if the movie data changed."""
+        generation = file_generation([DATA_PATH])
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                cached = json.load(f)
+            if cached["generation"] == generation:
+                return cls(cached["word_counts"])
+
+        spell = cls.from_movies()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"generation": generation, "word_counts": spell.word_counts}, f)
+        return spell
+
+    def lookup(self, word: str) -> list[tuple[str, int, int]]:
+        """
+        Return the (word, edit distance, count) of the vocabulary words
+        closest to `word`, most frequent first. Empty if none is within
+        the maximum edit distance.
+        """
+        if word in self.word_counts:
+            return [(word, 0, self.word_counts[word])]
+
+        best_distance = self.max_edit_distance
+        best: dict[str, int] = {}
+        seen = set()
+        for delete in self.__prefix_deletes(word):
+            for candidate in self.deletes.get(delete, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if abs(len(candidate) - len(word)) > best_distance:
+                    continue
+                distance = edit_distance(word, candidate, best_distance + 1)
+                if distance > best_distance:
+                    continue
+                if distance < best_distance:
+                    best_distance = distance
+                    best = {}
+                best[candidate] = self.word_counts[candidate]
+        return sorted(
+            ((candidate, best_distance, count) for candidate, count in best.items()),
+            key=lambda suggestion: (-suggestion[2], suggestion[0]),
+        )
+
+    def correct_word(self, word: str) -> Optional[str]:
+        """
+        Return the confident correction of a lower-cased word, the word
+        itself if it needs none, or None if no correction is confident: there
+        is no candidate, or the best one is not SPELL_DOMINANCE_RATIO times
+        as frequent as the runner-up at the same distance.
+        """
+        if len(word) < SPELL_MIN_WORD_LENGTH or word.isdigit() or word in self.analyzer.stopwords:
+            return word
+        suggestions = self.lookup(word)
+        if not suggestions:
+            return None
+        if len(suggestions) > 1 and suggestions[0][2] < SPELL_DOMINANCE_RATIO * suggestions[1][2]:
+            return None
+        return suggestions[0][0]
+
+    def correct(self, query: str) -> Optional[str]:
+        """
+        Correct every word of `query`, or return None if any word has no
+        confident correction. Only the misspelled part of a token is
+        replaced: surrounding punctuation stays and the correction follows
+        the original word's casing.
+        """
+        corrected = []
+        for token in query.split():
+            word = self.analyzer.preprocess(token)
+            if not word:
+                corrected.append(token)
+                continue
+            correction = self.correct_word(word)
+            if correction is None:
+                return None
+            corrected.append(token if correction == word else _replace_word(token, correction))
+        return " ".join(corrected)
+
+    def __prefix_deletes(self, word: str) -> set[str]:
+        prefix = word[: self.prefix_length]
+        deletes = {prefix}
+        frontier = {prefix}
+        for _ in range(self.max_edit_distance):
+            frontier = {
+                candidate[:i] + candidate[i + 1 :]
+                for candidate in frontier
+                for i in range(len(candidate))
+            }
+            deletes |= frontier
+        return deletes
+
+
+def _replace_word(token: str, correction: str) -> str:
+    """`token` with the word between its leading and trailing punctuation replaced."""
+    start = len(token) - len(token.lstrip(string.punctuation))
+    end = len(token.rstrip(string.punctuation))
+    word = token[start:end]
+    if len(word) > 1 and word.isupper():
+        correction = correction.upper()
+    elif word[:1].isupper():
+        correction = correction[:1].upper() + correction[1:]
+    return token[:start] + correction + token[end:]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance between `a` and `b` (edits are
+    insertions, deletions, substitutions and adjacent transpositions).
+    Returns `limit` as soon as the distance is known to reach it.
+    """
+    if abs(len(a) - len(b)) >= limit:
+        return limit
+    # A shared prefix or suffix never costs an edit; candidates usually
+    # differ from the query in a character or two, leaving a tiny table.
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) + len(b), limit)
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                previous_previous is not None
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) >= limit:
+            return limit
+        previous_previous, previous = previous, current
+    return min(previous[-1], limit)
+
+
+def stub_llm_spell_correct(query: str) -> str:
+    """Offline stand-in for the LLM spell corrector: returns `query` as is."""
+    return query
+
+
+_default_spell: Optional[SymSpell] = None
+
+
+def get_spell() -> SymSpell:
+    """Return the process-wide SymSpell, loading it on first use."""
+    global _default_spell
+    if _default_spell is None:
+        _default_spell = SymSpell.load_or_build()
+    return _default_spell
+
+
+def correct_spelling(
+    query: str, fallback: Callable[[str], str], spell: Optional[SymSpell] = None
+) -> tuple[str, str]:
+    """
+    Correct `query` locally, calling `fallback` only when some word has no
+    confident local correction. Returns the corrected query and which
+    corrector produced it ("local" or "fallback").
+    """
+    corrected = (spell or get_spell()).correct(query)
+    if corrected is not None:
+        return corrected, "local"
+    return fallback(query), "fallback"
+
+
+def spell_command(query: str, stub: bool = False) -> dict:
+    if stub:
+        fallback = stub_llm_spell_correct
+    else:
+        # Imported here so local corrections work without LLM credentials.
+        from .query_enhancement import llm_spell_correct
+
+        fallback = llm_spell_correct
+    corrected, source = correct_spelling(query, fallback)
+    return {"query": query, "corrected": corrected, "source": source}
@@ -0,0 +1,82 @@
+"""
+Vectorized cosine similarity search over embedding matrices.
+
+Embeddings are L2-normalized once, when they are built (see
+embedding_store.load_normalized for older files), so the cosine similarity
+of a query with every row is a single matrix-vector product, and the top k
+come from np.argpartition instead of a full sort.
+Rows with zero norm stay zero and score 0.0, as in `cosine_similarity`.
+"""
+
+import numpy as np
+
+
+def cosine_similarity(vec1, vec2):
+    dot_product = np.dot(vec1, vec2)
+    norm1 = np.linalg.norm(vec1)
+    norm2 = np.linalg.norm(vec2)
+
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+
+    return dot_product / (norm1 * norm2)
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    """Return `embeddings` as float32 rows of unit L2 norm."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+
+def cosine_scores(normalized: np.ndarray, query) -> np.ndarray:
+    """Cosine similarity of `query` with every row of a normalized matrix."""
+    return normalized @ normalize_rows(query)
+
+
+def top_k_indices(scores: np.ndarray, limit: int) -> np.ndarray:
+    """
+    Indices of the `limit` highest scores, best first. Equal scores keep
+    index order, like a stable descending sort of the whole array.
+    """
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64)
+    partitioned = np.argpartition(-scores, limit - 1)[:limit]
+    # Every index tied with the k-th score competes for the last places.
+    candidates = np.flatnonzero(scores >= scores[partitioned].min())
+    order = np.lexsort((candidates, -scores[candidates]))[:limit]
+    return candidates[order]
+
+
+def group_starts(groups: np.ndarray) -> np.ndarray:
+    """Start of every run of equal values in `groups`."""
+    return np.flatnonzero(np.diff(groups, prepend=-1) != 0)
+
+
+def top_k_groups(
+    scores: np.ndarray, groups: np.ndarray, starts: np.ndarray, limit: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rank groups of consecutive rows (e.g. the chunks of a movie) by their
+    best row. `starts` comes from `group_starts(groups)`. Returns the best
+    `limit` group ids and their scores; ties keep group order.
+    """
+    if len(scores) == 0:
+        return np.empty(0, dtype=groups.dtype), np.empty(0, dtype=scores.dtype)
+    best = np.maximum.reduceat(scores, starts)
+    top = top_k_indices(best, limit)
+    return groups[starts[top]], best[top]
+
+
+def group_rows(groups: np.ndarray, starts: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    Rows of the groups with the given `ids`, in row order. Groups must be
+    laid out in increasing id order, as chunks are by movie_idx.
+    """
+    positions = np.searchsorted(groups[starts], np.sort(ids))
+    ends = np.append(starts[1:], len(groups))
+    begins = starts[positions]
+    lengths = ends[positions] - begins
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(begins - offsets, lengths) + np.arange(lengths.sum())
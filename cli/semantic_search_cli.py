@@ -2,10 +2,13 @@
 
 import argparse
 
+from lib.ann_index import build_ann_command
 from lib.chunked_semantic_search import (
     embed_chunks,
     search_chunked
 )
+from lib.quantization import EMBEDDING_STORAGE_MODES, QUANTIZATION_MODES, quantize_command
+from lib.search_utils import ANN_DEFAULT_NPROBE, DEFAULT_EMBEDDING_STORAGE, DEFAULT_RECALL_TARGET
 from lib.semantic_search import (
     DEFAULT_CHUNK_SIZE,
     DEFAULT_CHUNK_OVERLAP,
@@ -37,6 +40,7 @@ def main() -> None:
     search_parser = subparsers.add_parser("search", help="Search movie database to get similar movies")
     search_parser.add_argument("query", type=str, help="Input text to search movie for")
     search_parser.add_argument("--limit", type=int, default=5, help="Limit the number of search results (default: 5)")
+    search_parser.add_argument("--storage", choices=EMBEDDING_STORAGE_MODES, default=DEFAULT_EMBEDDING_STORAGE, help="Score a quantized copy of the embeddings first, rescoring a shortlist at full precision")
 
     # Command: chunk
     chunk_parser = subparsers.add_parser("chunk", help="add fixed size chunking to split long text into smaller pieces for embedding")
@@ -57,6 +61,17 @@ def main() -> None:
     search_chunked_parser = subparsers.add_parser("search_chunked", help="Search documents in semantic search")
     search_chunked_parser.add_argument("query", type=str, help="input text to search")
     search_chunked_parser.add_argument("--limit", type=int, default=5, help="input text to search")
+    search_chunked_parser.add_argument("--storage", choices=EMBEDDING_STORAGE_MODES, default=DEFAULT_EMBEDDING_STORAGE, help="Score a quantized copy of the embeddings first, rescoring a shortlist at full precision")
+    search_chunked_parser.add_argument("--nprobe", type=int, default=ANN_DEFAULT_NPROBE, help="ANN lists to scan when an ANN index exists; 0 searches exactly")
+
+    #Command: build_ann
+    build_ann_parser = subparsers.add_parser("build_ann", help="Build an IVF approximate nearest neighbour index over the chunk embeddings")
+    build_ann_parser.add_argument("--nlist", type=int, help="Number of IVF lists (default: 4 * sqrt(chunks))")
+
+    #Command: quantize
+    quantize_parser = subparsers.add_parser("quantize", help="Build quantized copies of the movie and chunk embeddings")
+    quantize_parser.add_argument("--storage", choices=QUANTIZATION_MODES, default="int8", help="Quantization mode")
+    quantize_parser.add_argument("--recall-target", type=float, default=DEFAULT_RECALL_TARGET, help="Recall@10 of the rescoring shortlist to calibrate for")
 
     args = parser.parse_args()
 
@@ -70,7 +85,7 @@ def main() -> None:
         case "embedquery":
             embed_query_text(args.query)
         case "search":
-            semantic_search(args.query, args.limit)
+            semantic_search(args.query, args.limit, args.storage)
         case "chunk":
             chunk_text(args.text, args.chunk_size, args.overlap)
         case "semantic_chunk":
@@ -78,7 +93,18 @@ def main() -> None:
         case "embed_chunks":
             embed_chunks()
         case "search_chunked":
-            search_chunked(args.query, args.limit)
+            search_chunked(args.query, args.limit, args.nprobe, args.storage)
+        case "build_ann":
+            report = build_ann_command(args.nlist)
+            print(f"Indexed {report['rows']} chunk embeddings in {report['nlist']} lists (largest: {report['largest_list']})")
+            print(f"Saved to {report['path']}")
+        case "quantize":
+            for report in quantize_command(args.storage, args.recall_target):
+                print(f"{report['embeddings']}: {report['rows']} rows")
+                print(
+                    f"  float32 {report['float32_bytes'] / 1e6:.2f} MB -> {args.storage} {report['quantized_bytes'] / 1e6:.2f} MB "
+                    f"({report['saving']:.0%} saved), rescoring {report['rescore_multiplier']}x the limit"
+                )
         case _:
             parser.print_help()
 